@@ -3,6 +3,7 @@ from apscheduler.triggers.cron import CronTrigger
 import threading
 import time
 from rag.scrape import crawl_and_index
+from rag.milvus_utils import tune_indexes
 import pytz
 
 # Shared progress state
@@ -56,6 +57,45 @@ def trigger_refresh(url):
     t.start()
 
 
+def run_tuning():
+    """
+    Rebuild vector indexes that have outgrown their parameters. Searches of an index fail while
+    it rebuilds, so schedule this off-hours rather than after every crawl.
+    """
+    try:
+        rebuilt = tune_indexes()
+        print(f"[Scheduler] Index tuning done; rebuilt: {', '.join(rebuilt) or 'none'}")
+        return rebuilt
+    except Exception as e:
+        print(f"[Scheduler] Index tuning error: {e}")
+        return []
+
+
+def trigger_tuning():
+    """
+    Manually trigger index tuning in a background thread.
+    """
+    t = threading.Thread(target=run_tuning)
+    t.start()
+
+
+def _cron_trigger(cron_expr, timezone_str):
+    # Returns None if the timezone is invalid
+    tz = None
+    if timezone_str:
+        try:
+            tz = pytz.timezone(timezone_str)
+        except Exception:
+            print(f"[Scheduler] Invalid timezone: {timezone_str}")
+            return None
+    return CronTrigger.from_crontab(cron_expr, timezone=tz)
+
+
+def _start():
+    if not scheduler.running:
+        scheduler.start()
+
+
 def schedule_refresh(cron_expr, url, timezone_str=None):
     """
     Schedule a scrape using a cron expression (e.g., '0 2 * * *' for 2am daily) in a given timezone.
@@ -63,21 +103,33 @@ def schedule_refresh(cron_expr, url, timezone_str=None):
     Returns True if scheduled, False if error.
     """
     try:
-        tz = None
-        if timezone_str:
-            try:
-                tz = pytz.timezone(timezone_str)
-            except Exception:
-                print(f"[Scheduler] Invalid timezone: {timezone_str}")
-                return False
-        trigger = CronTrigger.from_crontab(cron_expr, timezone=tz)
+        trigger = _cron_trigger(cron_expr, timezone_str)
+        if trigger is None:
+            return False
         scheduler.add_job(run_scrape_with_progress, trigger, args=[url], id="scheduled_scrape", replace_existing=True)
-        scheduler.start()
+        _start()
         return True
     except Exception as e:
         print(f"[Scheduler] Error scheduling: {e}")
         return False
 
 
+def schedule_tuning(cron_expr, timezone_str=None):
+    """
+    Schedule index tuning with a cron expression, e.g. '0 4 * * 0' for 4am on Sundays.
+    Returns True if scheduled, False if error.
+    """
+    try:
+        trigger = _cron_trigger(cron_expr, timezone_str)
+        if trigger is None:
+            return False
+        scheduler.add_job(run_tuning, trigger, id="scheduled_tuning", replace_existing=True)
+        _start()
+        return True
+    except Exception as e:
+        print(f"[Scheduler] Error scheduling tuning: {e}")
+        return False
+
+
 def stop_scheduler():
     scheduler.shutdown(wait=False) 
\ No newline at end of file
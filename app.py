@@ -1,12 +1,20 @@
 import dash
 import dash_bootstrap_components as dbc
-from dash import html, dcc, Input, Output, State, callback, ctx
+from dash import html, dcc, Input, Output, State, callback, ctx, no_update
 import time
+import threading
+import uuid
+from flask import Response
 from admin import scheduler
 from rag.ollama_utils import run_gemma3n
 import os
 from rag.agents import rag_pipeline
 from rag.agents import rag_pipeline_stream
+from rag.agents import warm_up_pipeline
+from rag import metrics
+from rag.ollama_broker import get_broker
+from rag.llm_cache import cache_stats
+from rag.semantic_cache import get_semantic_cache
 
 external_scripts = [
     "https://unpkg.com/dash.nprogress@latest/dist/dash.nprogress.js"
@@ -14,6 +22,11 @@ external_scripts = [
 
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], external_scripts=external_scripts)
 
+@app.server.route("/metrics")
+def prometheus_metrics():
+    # Latency histograms and counters for Prometheus to scrape
+    return Response(metrics.prometheus_text(), mimetype="text/plain; version=0.0.4")
+
 # Simple in-memory user session (stub)
 USER = {"username": "admin", "password": "password"}
 
@@ -24,7 +37,7 @@ CONFIG = {
 }
 
 # Store last crawl/index summary for admin feedback
-LAST_INDEX_SUMMARY = {"pages_crawled": 0, "files_found": 0, "files_downloaded": 0, "files_processed": 0, "files_failed": 0, "chunks_indexed": 0, "errors": []}
+LAST_INDEX_SUMMARY = {"pages_crawled": 0, "files_found": 0, "files_downloaded": 0, "files_processed": 0, "files_failed": 0, "chunks_indexed": 0, "rows_added": 0, "rows_replaced": 0, "rows_deleted": 0, "errors": []}
 
 # Store user feedback in memory (can be extended to SQLite)
 USER_FEEDBACK = {"helpful": 0, "not_helpful": 0}
@@ -96,7 +109,7 @@ def setup_wizard_layout(step=1, url_val=None, title_val=None):
 
 # --- Admin Panel Layout ---
 def admin_panel_layout():
-    # Tabs: Main admin, Search Index Logs
+    # Tabs: Main admin, Search Index Logs, Performance
     return dbc.Container([
         html.H2("Admin Panel"),
         dcc.Tabs(id="admin-tabs", value="main", children=[
@@ -125,6 +138,15 @@ def admin_panel_layout():
                         dbc.Button("Schedule Refresh", id="admin-sched-btn", color="secondary"),
                     ], width=8),
                 ], className="mb-3"),
+                dbc.Row([
+                    dbc.Col([
+                        dbc.Button("Retune Indexes Now", id="admin-tune-btn", color="warning", className="me-2"),
+                        dbc.Button("Schedule Index Tuning", id="admin-tune-sched-btn", color="secondary"),
+                        html.Small(" Uses the schedule above. An index cannot be searched while it rebuilds, so prefer off-hours.",
+                                   className="text-muted"),
+                        html.Div(id="admin-tune-msg", className="mt-1"),
+                    ], width=8),
+                ], className="mb-3"),
                 html.Hr(),
                 html.H5("Scraping Progress"),
                 dcc.Interval(id="progress-interval", interval=2000, n_intervals=0),
@@ -142,6 +164,12 @@ def admin_panel_layout():
                 dbc.Button("Refresh Logs", id="refresh-logs-btn", color="secondary", className="mb-2"),
                 html.Div(id="log-display", style={"maxHeight": "400px", "overflowY": "scroll", "background": "#222", "color": "#eee", "fontFamily": "monospace", "padding": "1em", "borderRadius": "5px"}),
             ]),
+            dcc.Tab(label="Performance", value="performance", children=[
+                html.H5("Latency by pipeline step (last 500 samples each)"),
+                html.Small("Also served in Prometheus format at /metrics"),
+                dcc.Interval(id="performance-interval", interval=5000, n_intervals=0),
+                html.Div(id="performance-display", className="mt-2"),
+            ]),
         ]),
     ], className="mt-4")
 
@@ -197,17 +225,20 @@ def chat_layout():
             html.P("Type your question or what you are looking for below. For example: 'When is the next town meeting?' or 'How do I get a building permit?'"),
             dbc.Row([
                 dbc.Col([
-                    dcc.Input(id="chat-query", type="text", placeholder="Type your question here...", style=input_style, aria_label="Search input"),
+                    dcc.Input(id="chat-query", type="text", placeholder="Type your question here...", style=input_style),
                 ], width=8),
                 dbc.Col([
-                    dbc.Button("Search", id="chat-submit", color="primary", size="lg", style=button_style, n_clicks=0, **{"aria-label": "Submit search"}),
+                    dbc.Button("Search", id="chat-submit", color="primary", size="lg", style=button_style, n_clicks=0, title="Submit search"),
                 ], width=2),
             ], className="mb-3"),
             html.Div(id="chat-response", style={"fontSize": "1.2em", "marginTop": "2em"}),
+            # The pipeline runs in a background job; this polls its progress and partial answer
+            dcc.Store(id="chat-job"),
+            dcc.Interval(id="chat-interval", interval=CHAT_POLL_INTERVAL_MS, disabled=True),
             # Feedback buttons (shown after answer)
             html.Div(id="chat-feedback-area", style={"marginTop": "1em"}),
             html.Hr(),
-            dbc.Button("Go to Admin Panel", id="goto-admin-btn", color="link", **{"aria-label": "Go to admin panel"}),
+            dbc.Button("Go to Admin Panel", id="goto-admin-btn", color="link", title="Go to admin panel"),
         ], style={"padding": "2em", "background": "#f8f9fa", "borderRadius": "0 0 12px 12px"})
     ], style=card_style)
 
@@ -309,6 +340,21 @@ def schedule_refresh(n, cron, url, tz):
         return ok
     return False
 
+# --- Index Tuning (rebuilds take the index offline, so never automatic) ---
+@app.callback(Output('admin-tune-msg', 'children'),
+              Input('admin-tune-btn', 'n_clicks'),
+              Input('admin-tune-sched-btn', 'n_clicks'),
+              State('admin-cron', 'value'),
+              State('admin-tz', 'value'),
+              prevent_initial_call=True)
+def tune_indexes(now, sched, cron, tz):
+    if ctx.triggered_id == 'admin-tune-btn':
+        scheduler.trigger_tuning()
+        return "Index tuning started in the background."
+    if cron and scheduler.schedule_tuning(cron, timezone_str=tz):
+        return f"Index tuning scheduled: {cron}"
+    return "Enter a valid schedule to schedule index tuning."
+
 # --- Progress Polling ---
 @app.callback(
     Output('progress-bar', 'value'),
@@ -339,61 +385,123 @@ def login(n, username, password):
     return ""
 
 # --- Chat Search Callback (wired to section-aware RAG pipeline) ---
+# Dash callbacks return once, so the pipeline runs on a thread that writes its progress and
+# partial answer into CHAT_JOBS, and the chat-interval callback renders them as they change.
+CHAT_POLL_INTERVAL_MS = 300
+# Finished jobs nobody polled (closed tab) are dropped after this many seconds
+CHAT_JOB_TTL = 600
+CHAT_JOBS = {}
+_chat_jobs_lock = threading.Lock()
+
+NODE_STATUS = {
+    'cache_lookup': 'Checking recent answers...',
+    'embedding_route': 'Selecting best index...',
+    'planner': 'Planning your search...',
+    'translation': 'Translating (if needed)...',
+    'index_selection': 'Selecting best index...',
+    'section_prediction': 'Predicting relevant section...',
+    'query': 'Extracting info...',
+    'requery': 'Widening the search...',
+    'evaluation': 'Reviewing answer...',
+    'contacts': 'Loading contact info...',
+    'response': 'Composing response...',
+    'translation_back': 'Translating answer back to your language...',
+    'cache_store': 'Saving answer...'
+}
+
+def run_chat_job(job, query):
+    try:
+        for update in rag_pipeline_stream(query):
+            node = list(update.keys())[0]
+            state = update[node]
+            with _chat_jobs_lock:
+                if node == 'response_token':
+                    job['partial_answer'] = state['partial_answer']
+                    continue
+                if node not in ('translation_back', 'cache_store'):
+                    job['status'] = NODE_STATUS.get(node, f"Running {node}...")
+                if node == 'translation_back' and state.get('answer'):
+                    job['answer'] = state['answer']
+                if node in ('response', 'cache_lookup') and state.get('answer'):
+                    job['answer'] = state['answer']
+                    job['citations'] = state.get('citations', [])
+    except Exception as e:
+        print(f"[Chat] Pipeline error: {e}")
+    finally:
+        with _chat_jobs_lock:
+            job['done'] = True
+            job['finished'] = time.time()
+
+def _drop_stale_chat_jobs():
+    # Called with the lock held
+    now = time.time()
+    for job_id in [j for j, job in CHAT_JOBS.items() if job['done'] and now - job['finished'] > CHAT_JOB_TTL]:
+        del CHAT_JOBS[job_id]
+
 @app.callback(
+    Output('chat-job', 'data'),
+    Output('chat-interval', 'disabled'),
     Output('chat-response', 'children'),
     Output('chat-feedback-area', 'children'),
     Input('chat-submit', 'n_clicks'),
     State('chat-query', 'value'),
     prevent_initial_call=True)
 def chat_search(n, query):
-    if n and query:
-        from dash import no_update
-        node_status = {
-            'translation': 'Translating (if needed)...',
-            'index_selection': 'Selecting best index...',
-            'section_prediction': 'Predicting relevant section...',
-            'query': 'Extracting info...',
-            'evaluation': 'Reviewing answer...',
-            'contacts': 'Loading contact info...',
-            'response': 'Composing response...',
-            'translation_back': 'Translating answer back to your language...'
-        }
-        answer = None
-        citations = None
-        for update in rag_pipeline_stream(query):
-            node = list(update.keys())[0]
-            state = update[node]
-            # Show progress message for this node
-            if node != 'translation_back':
-                yield html.Div([
-                    html.P(node_status.get(node, f"Running {node}...")),
-                    dcc.Loading(type="circle")
-                ]), ""
-            # If this is the response node, show the answer preview
-            if node == 'response' and 'answer' in state:
-                answer = state['answer']
-                citations = state.get('citations', [])
-        # Final answer
-        if answer is not None:
-            feedback_buttons = html.Div([
-                html.Span("Was this helpful? ", style={"marginRight": "1em"}),
-                dbc.Button("Yes", id="feedback-yes", color="success", n_clicks=0, style={"marginRight": "0.5em"}, **{"aria-label": "Mark answer as helpful"}),
-                dbc.Button("No", id="feedback-no", color="danger", n_clicks=0, **{"aria-label": "Mark answer as not helpful"})
-            ], role="group", aria_label="Feedback buttons")
-            yield (
-                html.Div([
-                    html.P("Here's what I found for your question:"),
-                    html.Div(answer, style={"marginBottom": "1em"}),
-                    html.Hr(),
-                    html.P("Sources consulted:"),
-                    html.Ul([html.Li(html.A(c, href=c, target="_blank")) for c in citations]) if citations else html.P("No sources found."),
-                    html.P("If you need more help, please contact your local office.", style={"marginTop": "1em", "fontStyle": "italic"})
-                ]),
-                feedback_buttons
-            )
-        else:
-            yield html.Div([html.P("Sorry, something went wrong. Please try again or contact your local office.")]), ""
-    yield "", ""
+    if not (n and query):
+        return None, True, "", ""
+    job_id = uuid.uuid4().hex
+    job = {'status': 'Searching...', 'partial_answer': None, 'answer': None, 'citations': None,
+           'done': False, 'finished': None}
+    with _chat_jobs_lock:
+        _drop_stale_chat_jobs()
+        CHAT_JOBS[job_id] = job
+    threading.Thread(target=run_chat_job, args=(job, query), daemon=True).start()
+    return job_id, False, html.Div([html.P(job['status']), dcc.Loading(type="circle")]), ""
+
+@app.callback(
+    Output('chat-response', 'children', allow_duplicate=True),
+    Output('chat-feedback-area', 'children', allow_duplicate=True),
+    Output('chat-interval', 'disabled', allow_duplicate=True),
+    Input('chat-interval', 'n_intervals'),
+    State('chat-job', 'data'),
+    prevent_initial_call=True)
+def poll_chat_job(n, job_id):
+    with _chat_jobs_lock:
+        job = dict(CHAT_JOBS.get(job_id) or {})
+        if job.get('done'):
+            CHAT_JOBS.pop(job_id, None)
+    if not job:
+        return no_update, no_update, True
+    if not job['done']:
+        # Render the answer incrementally while Gemma is generating it
+        if job['partial_answer']:
+            return html.Div([
+                html.P("Here's what I found for your question:"),
+                html.Div(job['partial_answer'], style={"marginBottom": "1em", "whiteSpace": "pre-wrap"}),
+            ]), "", False
+        return html.Div([html.P(job['status']), dcc.Loading(type="circle")]), "", False
+    # Final answer
+    answer = job['answer']
+    citations = job['citations']
+    if answer is None:
+        return html.Div([html.P("Sorry, something went wrong. Please try again or contact your local office.")]), "", True
+    feedback_buttons = html.Div([
+        html.Span("Was this helpful? ", style={"marginRight": "1em"}),
+        dbc.Button("Yes", id="feedback-yes", color="success", n_clicks=0, style={"marginRight": "0.5em"}, title="Mark answer as helpful"),
+        dbc.Button("No", id="feedback-no", color="danger", n_clicks=0, title="Mark answer as not helpful")
+    ], role="group", **{"aria-label": "Feedback buttons"})
+    return (
+        html.Div([
+            html.P("Here's what I found for your question:"),
+            html.Div(answer, style={"marginBottom": "1em", "whiteSpace": "pre-wrap"}),
+            html.Hr(),
+            html.P("Sources consulted:"),
+            html.Ul([html.Li(html.A(c, href=c, target="_blank")) for c in citations]) if citations else html.P("No sources found."),
+            html.P("If you need more help, please contact your local office.", style={"marginTop": "1em", "fontStyle": "italic"})
+        ]),
+        feedback_buttons,
+        True
+    )
 
 # --- Feedback Button Callbacks ---
 @app.callback(
@@ -416,23 +524,94 @@ def handle_feedback(yes, no):
 
 # --- Show last index summary ---
 @app.callback(
-    Output('index-summary', 'children', allow_duplicate=True),
+    Output('index-summary', 'children'),
     Input('progress-interval', 'n_intervals'))
 def show_index_summary(n):
     s = LAST_INDEX_SUMMARY
     errors = s.get("errors", [])
     total = USER_FEEDBACK["helpful"] + USER_FEEDBACK["not_helpful"]
     percent = (USER_FEEDBACK["helpful"] / total * 100) if total else 0
+    ttft = metrics.summary("llm_time_to_first_token")
+    prompt_tokens = metrics.summary("llm_prompt_tokens")
+    prompt_seconds = metrics.summary("llm_prompt_eval_seconds")
+    packed = metrics.summary("context_tokens_packed")
+    saved = metrics.summary("context_tokens_saved")
+    # Seconds of prompt evaluation avoided per request, at the observed prompt evaluation rate
+    seconds_per_token = prompt_seconds['mean'] / prompt_tokens['mean'] if prompt_tokens['mean'] else 0.0
     feedback_metrics = html.Div([
         html.H6("User Feedback Metrics", style={"marginTop": "1em"}),
-        html.P(f"Helpful: {USER_FEEDBACK['helpful']} | Not Helpful: {USER_FEEDBACK['not_helpful']} | % Helpful: {percent:.1f}%")
+        html.P(f"Helpful: {USER_FEEDBACK['helpful']} | Not Helpful: {USER_FEEDBACK['not_helpful']} | % Helpful: {percent:.1f}%"),
+        html.P(f"Answer time to first token: {ttft['mean']:.2f}s average over {ttft['count']} answers"),
+        html.P(f"Gemma prompt size: {prompt_tokens['mean']:.0f} tokens average (last {prompt_tokens['last']:.0f}), "
+               f"evaluated in {prompt_seconds['mean']:.2f}s average"),
+        html.P(f"Context packing: {packed['mean']:.0f} context tokens kept, {saved['mean']:.0f} trimmed per request "
+               f"(~{saved['mean'] * seconds_per_token:.2f}s of prompt evaluation saved)")
+    ])
+    broker = get_broker().stats()
+    ollama_queue = html.Div([
+        html.H6("Ollama Queue", style={"marginTop": "1em"}),
+        html.P("Circuit: " + ("OPEN (Ollama unavailable, failing fast)" if broker["circuit_open"] else "closed")),
+        html.Ul([
+            html.Li(f"{name.capitalize()}: {c['queued']} queued | {c['inflight']}/{c['limit']} running | avg wait {c['mean_wait']:.2f}s")
+            for name, c in broker["classes"].items()
+        ])
+    ])
+    routing_cache = cache_stats()
+    semantic = get_semantic_cache().stats()
+    llm_cache = html.Div([
+        html.H6("Answer & Routing Caches", style={"marginTop": "1em"}),
+        html.P(f"Answer cache: {semantic['hits']} hits / {semantic['misses']} misses ({semantic['hit_rate'] * 100:.0f}% hit rate), {semantic['entries']} answers stored"),
+        html.Ul([
+            html.Li(f"{node}: {c['hits']} hits / {c['misses']} misses ({c['hit_rate'] * 100:.0f}% hit rate)")
+            for node, c in routing_cache.items()
+        ]) if routing_cache else html.P("No routing calls yet.")
     ])
     return html.Div([
         html.P(f"Pages crawled: {s.get('pages_crawled', 0)} | Files found: {s.get('files_found', 0)} | Downloaded: {s.get('files_downloaded', 0)} | Processed: {s.get('files_processed', 0)} | Failed: {s.get('files_failed', 0)} | Chunks indexed: {s.get('chunks_indexed', 0)}"),
+        html.P(f"Rows added: {s.get('rows_added', 0)} | Replaced: {s.get('rows_replaced', 0)} | Deleted: {s.get('rows_deleted', 0)}"),
         html.Ul([html.Li(f"{e[0]}: {e[1]}") for e in errors]) if errors else html.P("No errors."),
-        feedback_metrics
+        feedback_metrics,
+        ollama_queue,
+        llm_cache
     ])
 
+# Timed spans shown on the Performance tab, as (metric name, section title)
+PERFORMANCE_SPANS = [
+    ("query_seconds", "Whole query"),
+    ("node_seconds", "Graph nodes"),
+    ("ollama_request_seconds", "Ollama calls"),
+    ("vector_request_seconds", "Vector index calls"),
+    ("chunk_store_seconds", "Chunk store calls"),
+]
+
+@app.callback(
+    Output('performance-display', 'children'),
+    Input('performance-interval', 'n_intervals'))
+def show_performance(n):
+    summaries = metrics.all_summaries()
+    sections = []
+    for name, title in PERFORMANCE_SPANS:
+        rows = [(key[len(name):].strip("{}") or "all", s) for key, s in summaries.items()
+                if key == name or key.startswith(name + "{")]
+        if not rows:
+            continue
+        sections.append(html.H6(title, style={"marginTop": "1em"}))
+        sections.append(dbc.Table(
+            [html.Thead(html.Tr([html.Th(h) for h in ("Step", "Samples", "p50", "p95", "p99")]))] +
+            [html.Tbody([
+                html.Tr([html.Td(label), html.Td(s['count'])] +
+                        [html.Td(f"{s[p] * 1000:.0f} ms") for p in ("p50", "p95", "p99")])
+                for label, s in sorted(rows, key=lambda row: row[1]['p95'], reverse=True)
+            ])],
+            bordered=True, size="sm", striped=True))
+    prompt_tokens = metrics.summary("llm_prompt_tokens")
+    eval_tokens = metrics.summary("llm_eval_tokens")
+    if prompt_tokens['count'] or eval_tokens['count']:
+        sections.append(html.P(
+            f"Gemma tokens per call: prompt p50 {prompt_tokens['p50']:.0f} / p95 {prompt_tokens['p95']:.0f}, "
+            f"generated p50 {eval_tokens['p50']:.0f} / p95 {eval_tokens['p95']:.0f}", className="mt-2"))
+    return sections or html.P("No queries timed yet.")
+
 @app.callback(
     Output('log-display', 'children'),
     Input('refresh-logs-btn', 'n_clicks'),
@@ -445,4 +624,6 @@ def refresh_logs(n):
     return html.Pre("No logs found.")
 
 if __name__ == '__main__':
+    # Load the models in the background so the first visitor does not wait for Ollama to load them
+    threading.Thread(target=warm_up_pipeline, daemon=True).start()
     app.run_server(debug=True) 
\ No newline at end of file
@@ -0,0 +1,62 @@
+"""
+Benchmark scripts, run as python -m bench.<name>.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+from pymilvus import utility
+
+from rag import chunk_store, index_state, metrics, milvus_utils, routing
+
+
+def percentile(values, pct):
+    """
+    pct-th percentile of values (in any order), computed the way rag.metrics reports it.
+    """
+    return metrics._percentile(sorted(values), pct)
+
+
+@contextmanager
+def isolated_stores():
+    """
+    Point the chunk store, index state (versions, section catalog, centroids) and dedup Bloom
+    filters at a temporary directory for the duration of a run, so benchmark rows never land in
+    the app's stores in the working directory. Yields the directory.
+    """
+    saved = (chunk_store._store, index_state.INDEX_STATE_FILE, index_state._conn, dict(index_state._versions),
+             milvus_utils.DEDUP_BLOOM_DIR, dict(milvus_utils._blooms))
+    with tempfile.TemporaryDirectory() as directory:
+        chunk_store._store = chunk_store.ChunkStore(os.path.join(directory, "chunk_store.db"))
+        index_state.INDEX_STATE_FILE = os.path.join(directory, "index_state.db")
+        index_state._conn = None
+        index_state._versions.clear()
+        milvus_utils.DEDUP_BLOOM_DIR = os.path.join(directory, "dedup_bloom")
+        milvus_utils._blooms.clear()
+        routing._section_matrices.clear()
+        try:
+            yield directory
+        finally:
+            chunk_store._store._conn.close()
+            if index_state._conn is not None:
+                index_state._conn.close()
+            (chunk_store._store, index_state.INDEX_STATE_FILE, index_state._conn, versions,
+             milvus_utils.DEDUP_BLOOM_DIR, blooms) = saved
+            index_state._versions.clear()
+            index_state._versions.update(versions)
+            milvus_utils._blooms.clear()
+            milvus_utils._blooms.update(blooms)
+            routing._section_matrices.clear()
+
+
+def drop_collections(names):
+    """
+    Drop benchmark collections from Milvus and forget them in this process.
+    """
+    with milvus_utils._milvus_lock:
+        for name in names:
+            for cache in (milvus_utils._collections, milvus_utils._vector_indexes, milvus_utils._ann_states):
+                cache.pop(name, None)
+            milvus_utils.INDEX_REGISTRY.pop(name, None)
+            if utility.has_collection(name, using=milvus_utils.MILVUS_ALIAS):
+                utility.drop_collection(name, using=milvus_utils.MILVUS_ALIAS)
@@ -0,0 +1,108 @@
+"""
+Measure recall@k against exact (NumPy brute-force) search and p50/p95 search latency
+for each vector index type, on the same rows and the same stored query set.
+
+Rows are reproducible clustered vectors; queries are saved to bench_ann_queries.npy on the
+first run and reused afterwards, so runs on different machines are comparable. Chunk text and
+index bookkeeping go to a temporary directory, and the bench collections are dropped at the end.
+Runs against a local Milvus Lite file by default, so no server is needed:
+    python -m bench.ann_recall [num_rows] [num_queries] [index_types] [milvus_uri]
+e.g. python -m bench.ann_recall 50000 200 FLAT,IVF_FLAT,IVF_SQ8,IVF_PQ,HNSW
+"""
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from bench import drop_collections, isolated_stores, percentile
+from rag import milvus_utils
+
+TOP_K = 5
+QUERY_FILE = "bench_ann_queries.npy"
+INSERT_BATCH = 5000
+
+
+def clustered_vectors(rng, num, centers):
+    # Embeddings cluster by topic; uniform random vectors would make every index look bad
+    assigned = centers[rng.integers(0, len(centers), size=num)]
+    vectors = assigned + 0.3 * rng.standard_normal((num, centers.shape[1])).astype(np.float32)
+    return vectors.astype(np.float32)
+
+
+def bytes_per_vector(index_type):
+    # Rough in-memory size of one vector in each index type
+    dim = milvus_utils.VECTOR_DIM
+    return {"IVF_SQ8": dim, "IVF_PQ": dim // 8, "HNSW": 4 * dim + 2 * 16 * 8}.get(index_type, 4 * dim)
+
+
+def load_queries(rng, num, centers):
+    if os.path.exists(QUERY_FILE):
+        queries = np.load(QUERY_FILE)
+        if len(queries) >= num:
+            return queries[:num]
+    queries = clustered_vectors(rng, num, centers)
+    np.save(QUERY_FILE, queries)
+    return queries
+
+
+def build_index(index_type, rows):
+    name = f"bench_ann_{index_type.lower()}"
+    milvus_utils.register_index(name, "ANN benchmark", "bench", ann_index=index_type)
+    for start in range(0, len(rows), INSERT_BATCH):
+        batch = rows[start:start + INSERT_BATCH]
+        metadatas = [{"text": f"row {start + i}", "url": str(start + i), "date": "2024-01-01", "section": "bench"}
+                     for i in range(len(batch))]
+        milvus_utils.insert_embeddings(batch.tolist(), metadatas, index_name=name)
+    if not milvus_utils.tune_ann_index(name, force=True):
+        return None
+    return milvus_utils.connect_milvus(name)
+
+
+def main():
+    num_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    num_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    index_types = (sys.argv[3] if len(sys.argv) > 3 else "FLAT,IVF_FLAT,IVF_SQ8,IVF_PQ,HNSW").split(",")
+    milvus_utils.MILVUS_URI = sys.argv[4] if len(sys.argv) > 4 else "./bench_ann.db"
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((50, milvus_utils.VECTOR_DIM)).astype(np.float32)
+    rows = clustered_vectors(rng, num_rows, centers)
+    queries = load_queries(np.random.default_rng(1), num_queries, centers)
+
+    # Ground truth: exact L2 top-k over all rows
+    sq_norms = (rows ** 2).sum(axis=1)
+    exact = [set(np.argsort(sq_norms - 2 * rows @ q)[:TOP_K]) for q in queries]
+
+    print(f"Rows: {num_rows} | queries: {num_queries} | recall@{TOP_K}")
+    with isolated_stores():
+        try:
+            for index_type in index_types:
+                measure(index_type, rows, queries, exact)
+        finally:
+            drop_collections(f"bench_ann_{index_type.lower()}" for index_type in index_types)
+
+
+def measure(index_type, rows, queries, exact):
+    num_rows = len(rows)
+    col = build_index(index_type, rows)
+    if col is None:
+        print(f"{index_type:9s} not supported by this Milvus deployment")
+        return
+    param = milvus_utils.ann_search_params(index_type, num_rows, TOP_K)
+    latencies = []
+    recalls = []
+    for q, truth in zip(queries, exact):
+        start = time.perf_counter()
+        hits = col.search(data=[q.tolist()], anns_field="embedding", param=param, limit=TOP_K, output_fields=["url"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        found = {int(hit.entity.get("url")) for hit in hits[0]}
+        recalls.append(len(found & truth) / TOP_K)
+    memory_mb = bytes_per_vector(index_type) * num_rows / 1e6
+    print(f"{index_type:9s} recall {statistics.mean(recalls):.3f} | p50 {statistics.median(latencies):6.2f} ms "
+          f"| p95 {percentile(latencies, 95):6.2f} ms | ~{memory_mb:7.1f} MB vectors | {param['params']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Measure first-query latency after idle, before and after the startup warm-up, and the effect
+of putting the fixed instructions first (as a system prompt) on answer-prompt latency.
+
+Needs a running Ollama with LLM_MODEL and EMBED_MODEL pulled. Each run unloads both models
+(as Ollama does after its keep-alive expires) and times one query's embedding plus answer call:
+    python -m bench.cold_start [runs] [num_predict]
+"""
+import statistics
+import sys
+import time
+
+from bench import percentile
+from rag import agents, ollama_utils
+
+QUESTIONS = [
+    "When is the next town council meeting?",
+    "How do I get a building permit for a shed?",
+    "Where do I pay a parking ticket?",
+    "What day is trash pickup on Elm Street?",
+]
+# Stand-in for packed context: roughly the size of a CONTEXT_TOKEN_BUDGET prompt
+CONTEXT = " ".join(f"Section {i}: residents may apply at the town clerk's office during business hours, "
+                   f"bring proof of residency and pay the posted fee; questions go to the clerk." for i in range(40))
+
+
+def unload_models():
+    session = ollama_utils.get_session()
+    session.post(f"{ollama_utils.OLLAMA_BASE_URL}/api/generate",
+                 json={"model": ollama_utils.LLM_MODEL, "keep_alive": 0}, timeout=60).raise_for_status()
+    session.post(f"{ollama_utils.OLLAMA_BASE_URL}/api/embed",
+                 json={"model": ollama_utils.EMBED_MODEL, "input": ["unload"], "keep_alive": 0}, timeout=60).raise_for_status()
+    time.sleep(1)
+
+
+def answer_call(question, num_predict, templated=True):
+    options = {"num_predict": num_predict}
+    # Retrieved context differs from query to query; only the fixed instructions can be reused
+    context = f"[{question}] {CONTEXT}"
+    if templated:
+        system, prompt = agents.build_prompt('response', context=context, citations="Source: https://example.gov/clerk",
+                                             evaluation="", section="", contacts="", query=question)
+        return ollama_utils.run_gemma3n(prompt, system=system, options=options)
+    # The old layout: the question first and the fixed instructions last, in one prompt
+    system, _ = agents.PROMPT_TEMPLATES['response']
+    prompt = f"User question: {question}\nRelevant information: {context}\n{system}"
+    return ollama_utils.run_gemma3n(prompt, options=options)
+
+
+def first_query(question, num_predict):
+    start = time.perf_counter()
+    ollama_utils.generate_embedding(question)
+    answer_call(question, num_predict)
+    return time.perf_counter() - start
+
+
+def report(label, samples):
+    print(f"{label:34s} p50 {statistics.median(samples):6.2f} s | p95 {percentile(samples, 95):6.2f} s")
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    num_predict = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    # Every query must reach Ollama
+    ollama_utils.EMBED_CACHE_ENABLED = False
+
+    cold, warmed = [], []
+    for i in range(runs):
+        question = QUESTIONS[i % len(QUESTIONS)]
+        unload_models()
+        cold.append(first_query(question, num_predict))
+        unload_models()
+        if not agents.warm_up_pipeline():
+            print("Warm-up failed; is Ollama running?")
+            return
+        warmed.append(first_query(question, num_predict))
+    report("First query, models unloaded", cold)
+    report("First query, after warm-up", warmed)
+
+    # Prefix reuse: consecutive answers to different questions on a loaded model
+    for label, templated in (("Answer call, question first", False), ("Answer call, instructions first", True)):
+        answer_call(QUESTIONS[0], num_predict, templated)
+        samples = []
+        for i in range(runs):
+            start = time.perf_counter()
+            answer_call(QUESTIONS[(i + 1) % len(QUESTIONS)], num_predict, templated)
+            samples.append(time.perf_counter() - start)
+        report(label, samples)
+
+
+if __name__ == "__main__":
+    main()
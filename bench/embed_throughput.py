@@ -0,0 +1,44 @@
+"""
+Compare single-text vs. batched embedding throughput against a stand-in Ollama.
+
+Usage: python -m bench.embed_throughput [num_chunks]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from bench.fake_ollama import start_fake_ollama
+from rag import embedding_cache, ollama_utils
+
+
+def main():
+    num_chunks = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    server, base_url = start_fake_ollama()
+    ollama_utils.OLLAMA_BASE_URL = base_url
+    # Every chunk must reach the server, and no embedding_cache.db is left in the working directory
+    ollama_utils.EMBED_CACHE_ENABLED = False
+    cache_dir = tempfile.mkdtemp()
+    embedding_cache._cache = embedding_cache.EmbeddingCache(os.path.join(cache_dir, "bench_embedding_cache.db"))
+    chunks = [f"Chunk {i}: county ordinance text " * 20 for i in range(num_chunks)]
+
+    start = time.perf_counter()
+    single = [ollama_utils.generate_embedding(c) for c in chunks]
+    single_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = ollama_utils.generate_embeddings(chunks)
+    batched_elapsed = time.perf_counter() - start
+
+    server.shutdown()
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    assert len(single) == len(batched) == num_chunks
+    print(f"Chunks: {num_chunks} | batch size: {ollama_utils.EMBED_BATCH_SIZE}")
+    print(f"Single:  {num_chunks / single_elapsed:8.1f} chunks/sec ({single_elapsed:.2f}s)")
+    print(f"Batched: {num_chunks / batched_elapsed:8.1f} chunks/sec ({batched_elapsed:.2f}s)")
+    print(f"Speedup: {single_elapsed / batched_elapsed:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Replay a query log through the RAG graph with and without confidence gating and report
+Gemma calls per query, p50/p95 latency, how queries split across the gated routes, and the
+EVAL_SKIP_CONFIDENCE the evaluator's own verdicts support.
+
+The log is a text file with one user query per line. Runs against the configured Ollama
+and Milvus; the semantic answer cache is turned off so every query runs the graph, and each
+pass starts with empty LLM and embedding caches so the second is not flattered by the first:
+    python -m bench.eval_gating queries.txt [target_yes_rate]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from bench import percentile
+from rag import agents, embedding_cache, llm_cache
+
+LLM_FUNCTIONS = ("cached_gemma3n", "run_gemma3n", "run_gemma3n_stream")
+
+
+def count_llm_calls(counter):
+    # Count the Gemma calls the graph's nodes make, whether or not the LLM cache serves them
+    for name in LLM_FUNCTIONS:
+        original = getattr(agents, name)
+
+        def counted(*args, _original=original, **kwargs):
+            counter[0] += 1
+            return _original(*args, **kwargs)
+
+        setattr(agents, name, counted)
+
+
+def fresh_caches(directory, label):
+    # Planner, rewrite, translation and embedding results from one pass must not serve the next
+    llm_cache._cache = llm_cache.LLMCache(os.path.join(directory, f"llm_cache_{label}.db"))
+    embedding_cache._cache = embedding_cache.EmbeddingCache(os.path.join(directory, f"embedding_cache_{label}.db"))
+
+
+def replay(queries, counter):
+    calls, latencies, states = [], [], []
+    for query in queries:
+        counter[0] = 0
+        start = time.perf_counter()
+        states.append(agents.get_rag_graph().invoke(agents.initial_state(query)))
+        latencies.append(time.perf_counter() - start)
+        calls.append(counter[0])
+    return calls, latencies, states
+
+
+def calibrate(states, target_yes_rate):
+    """
+    Lowest confidence at which the evaluator said 'yes' for at least target_yes_rate of the
+    queries at or above it, or None if no threshold reaches the target.
+    """
+    judged = sorted((s['retrieval_confidence'], (s.get('evaluation') or '').strip().lower().startswith('yes'))
+                    for s in states if s.get('retrieval_confidence') is not None and s.get('evaluation'))
+    for i, (confidence, _) in enumerate(judged):
+        above = [yes for _, yes in judged[i:]]
+        if sum(above) / len(above) >= target_yes_rate:
+            return confidence
+    return None
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+    with open(sys.argv[1], encoding="utf-8") as f:
+        queries = [line.strip() for line in f if line.strip()]
+    target_yes_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 0.9
+    agents.SEMANTIC_CACHE_ENABLED = False
+    counter = [0]
+    count_llm_calls(counter)
+
+    with tempfile.TemporaryDirectory() as directory:
+        fresh_caches(directory, "ungated")
+        agents.EVAL_GATING = False
+        ungated_calls, ungated_latencies, ungated_states = replay(queries, counter)
+        fresh_caches(directory, "gated")
+        agents.EVAL_GATING = True
+        gated_calls, gated_latencies, gated_states = replay(queries, counter)
+        llm_cache._cache = embedding_cache._cache = None
+
+    print(f"Queries: {len(queries)}")
+    for label, calls, latencies in (("always evaluate", ungated_calls, ungated_latencies),
+                                    ("gated", gated_calls, gated_latencies)):
+        print(f"{label:15s} {statistics.mean(calls):5.2f} Gemma calls/query | p50 {statistics.median(latencies):6.2f} s "
+              f"| p95 {percentile(latencies, 95):6.2f} s")
+    print(f"Saved: {statistics.mean(ungated_calls) - statistics.mean(gated_calls):.2f} Gemma calls/query")
+
+    skipped = sum(1 for s in gated_states if s.get('evaluation') is None and not s.get('requeried'))
+    requeried = sum(1 for s in gated_states if s.get('requeried'))
+    print(f"Routes: {skipped} skipped evaluation, {requeried} re-retrieved, "
+          f"{len(queries) - skipped - requeried} evaluated")
+    threshold = calibrate(ungated_states, target_yes_rate)
+    if threshold is None:
+        print(f"No confidence threshold reaches a {target_yes_rate:.0%} 'yes' rate on this log")
+    else:
+        print(f"EVAL_SKIP_CONFIDENCE for a {target_yes_rate:.0%} 'yes' rate: {threshold:.3f} "
+              f"(configured {agents.EVAL_SKIP_CONFIDENCE})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Minimal stand-in for the Ollama HTTP API, used by the benchmark scripts.
+
+Each request pays a fixed dispatch overhead plus a per-input cost, which is
+roughly how a local Ollama behaves on CPU. Embeddings are deterministic
+pseudo-vectors derived from the input text.
+"""
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBED_DIM = 768
+REQUEST_OVERHEAD = 0.004  # seconds per HTTP request (dispatch, model lookup)
+PER_INPUT_COST = 0.001  # seconds per embedded text
+
+
+def fake_vector(text):
+    seed = hashlib.sha256(text.encode("utf-8")).digest()
+    return [((seed[i % len(seed)] + i) % 255) / 255.0 for i in range(EMBED_DIM)]
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, obj):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        time.sleep(REQUEST_OVERHEAD)
+        if self.path == "/api/embeddings":
+            time.sleep(PER_INPUT_COST)
+            self._send_json({"embedding": fake_vector(payload.get("prompt", ""))})
+        elif self.path == "/api/embed":
+            inputs = payload.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            time.sleep(PER_INPUT_COST * len(inputs))
+            self._send_json({"model": payload.get("model"), "embeddings": [fake_vector(t) for t in inputs]})
+        elif self.path == "/api/generate":
+            self._send_json({"model": payload.get("model"), "response": "ok", "done": True})
+        else:
+            self.send_error(404)
+
+
+def start_fake_ollama(port=0):
+    """
+    Start the stand-in server on a background thread. Returns (server, base_url).
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeOllamaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
@@ -0,0 +1,32 @@
+"""
+Measure per-request LangGraph setup cost: rebuilding and compiling the workflow
+on every query (the old behaviour) vs. reusing the module-level compiled graph.
+
+Usage: python -m bench.graph_setup [iterations]
+"""
+import sys
+import time
+
+from rag.agents import build_rag_graph, get_rag_graph
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        build_rag_graph().compile()
+    rebuild = (time.perf_counter() - start) / iterations
+
+    get_rag_graph()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        get_rag_graph()
+    cached = (time.perf_counter() - start) / iterations
+
+    print(f"Rebuild + compile per request: {rebuild * 1000:8.3f} ms")
+    print(f"Shared compiled graph:         {cached * 1000:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
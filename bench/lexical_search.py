@@ -0,0 +1,63 @@
+"""
+Measure BM25 lexical search latency (p50/p95) on the chunk store's full-text index.
+
+Builds a chunk store of synthetic chunks (random vocabulary plus ordinance-style identifiers)
+in a scratch file and runs resident-style queries against it:
+    python -m bench.lexical_search [num_chunks] [num_queries] [words_per_chunk]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from bench import percentile
+from rag.chunk_store import ChunkStore
+
+INDEX_NAME = "bench_lexical"
+
+
+def main():
+    num_chunks = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    num_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    words_per_chunk = int(sys.argv[3]) if len(sys.argv) > 3 else 300
+
+    rng = random.Random(0)
+    vocabulary = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 10)))
+                  for _ in range(20000)]
+    identifiers = [f"{rng.randint(2000, 2025)}-{rng.randint(1, 99)}" for _ in range(2000)]
+    # Zipf-like word frequencies, as in real text
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_chunk_store.db")
+    store = ChunkStore(path)
+    start = time.perf_counter()
+    for offset in range(0, num_chunks, 1000):
+        metadatas = []
+        for i in range(offset, min(offset + 1000, num_chunks)):
+            words = rng.choices(vocabulary, weights=weights, k=words_per_chunk)
+            words.insert(rng.randrange(len(words)), identifiers[i % len(identifiers)])
+            metadatas.append({"content_hash": str(i), "text": " ".join(words), "url": f"https://example.gov/{i}",
+                              "date": "2024-01-01", "section": f"section{i % 10}"})
+        store.put_many(INDEX_NAME, metadatas)
+    print(f"Indexed {num_chunks} chunks of {words_per_chunk} words in {time.perf_counter() - start:.1f} s "
+          f"({os.path.getsize(path) / 1e6:.0f} MB with text)")
+
+    queries = [f"what does ordinance {rng.choice(identifiers)} say about {' '.join(rng.choices(vocabulary[:2000], k=3))}"
+               for _ in range(num_queries)]
+    # Warm the per-term document counts, as a running app would have
+    for query in queries:
+        store.lexical_search(INDEX_NAME, query, 20)
+    for label, section in (("all sections", None), ("one section", "section3")):
+        samples = []
+        for query in queries:
+            start = time.perf_counter()
+            store.lexical_search(INDEX_NAME, query, 20, section=section)
+            samples.append((time.perf_counter() - start) * 1000)
+        print(f"{label:13s} p50 {statistics.median(samples):6.2f} ms | p95 {percentile(samples, 95):6.2f} ms")
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
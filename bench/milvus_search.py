@@ -0,0 +1,71 @@
+"""
+Compare search latency with a fresh connect/list/load on every call (the old
+connect_milvus behaviour) against the cached connection and collection handles.
+
+Chunk text and index bookkeeping go to a temporary directory, and the bench collection is
+dropped at the end. Runs against a local Milvus Lite file by default, so no server is needed:
+    python -m bench.milvus_search [num_rows] [num_queries] [milvus_uri]
+"""
+import random
+import statistics
+import sys
+import time
+
+from pymilvus import connections, utility, Collection
+
+from bench import drop_collections, isolated_stores, percentile
+from rag import milvus_utils
+
+INDEX_NAME = "bench_search"
+
+
+def random_vector(dim=768):
+    return [random.random() for _ in range(dim)]
+
+
+def uncached_search(query):
+    # What every search paid before: connect, list collections, load, then search
+    connections.connect(alias=milvus_utils.MILVUS_ALIAS, uri=milvus_utils.MILVUS_URI)
+    utility.list_collections(using=milvus_utils.MILVUS_ALIAS)
+    col = Collection(INDEX_NAME, using=milvus_utils.MILVUS_ALIAS)
+    col.load()
+    return col.search(data=[query], anns_field="embedding", param={"metric_type": "L2", "params": {"nprobe": 10}},
+                      limit=5, output_fields=["content_hash", "url", "date", "section"])
+
+
+def main():
+    num_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    num_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    milvus_utils.MILVUS_URI = sys.argv[3] if len(sys.argv) > 3 else "./bench_milvus.db"
+    with isolated_stores():
+        try:
+            run(num_rows, num_queries)
+        finally:
+            drop_collections([INDEX_NAME])
+
+
+def run(num_rows, num_queries):
+    metadatas = [{"text": f"chunk {i}", "url": f"https://example.gov/page{i}", "date": "2024-01-01",
+                  "section": f"section{i % 10}"} for i in range(num_rows)]
+    milvus_utils.insert_embeddings([random_vector() for _ in range(num_rows)], metadatas, index_name=INDEX_NAME)
+    queries = [random_vector() for _ in range(num_queries)]
+
+    timings = {}
+    for label, search in (
+        ("per-call connect", uncached_search),
+        ("cached handles", lambda q: milvus_utils.search_embeddings(q, top_k=5, index_name=INDEX_NAME)),
+    ):
+        samples = []
+        for q in queries:
+            start = time.perf_counter()
+            search(q)
+            samples.append((time.perf_counter() - start) * 1000)
+        timings[label] = samples
+
+    print(f"Rows: {num_rows} | queries: {num_queries}")
+    for label, samples in timings.items():
+        print(f"{label:18s} p50 {statistics.median(samples):7.2f} ms | p95 {percentile(samples, 95):7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
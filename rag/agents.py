@@ -1,24 +1,260 @@
-from rag.ollama_utils import run_gemma3n, generate_embedding
-from rag.milvus_utils import list_indexes, search_embeddings, connect_milvus
-from langdetect import detect
+from rag.ollama_utils import run_gemma3n, run_gemma3n_stream, generate_embedding, warm_up_models
+from rag.milvus_utils import list_indexes, hybrid_search, multi_index_search
+from rag.llm_cache import cached_gemma3n, DETERMINISTIC_OPTIONS
+from rag.context_packer import pack_context
+from rag.contacts import get_contact_store, format_contact
+from rag.index_state import index_version_key, list_sections
+from rag.semantic_cache import get_semantic_cache, SEMANTIC_CACHE_ENABLED
+from rag import routing
+from rag import metrics
+from rag.translation import (detect_language, recall_translation, remember_translation, needs_translation,
+                             parse_translations)
 from langgraph.graph import StateGraph, END
-import os
+from langgraph.config import get_stream_writer
+from typing import Dict, List, Optional, TypedDict
+import threading
+import json
+import re
+
+# Plan translation, index, section and search query in one Gemma call,
+# falling back to the per-node path when the plan cannot be parsed. With embedding routing
+# (routing.ROUTING_MODE) English queries are routed by embeddings first and only
+# non-English or ambiguous ones reach the planner.
+PLANNER_MODE = True
+# Number of indexes query_node searches concurrently: the selected index plus the next best
+# routed ones. 1 searches only the selected index; 0 searches every index.
+FANOUT_INDEXES = 2
+# Route on retrieval confidence (the best packed chunk's cosine similarity to the search query)
+# instead of always asking Gemma whether the context answers the question
+EVAL_GATING = True
+# At or above this confidence the context is used without an evaluation call
+EVAL_SKIP_CONFIDENCE = 0.7
+# Below this confidence the search is retried once, wider, instead of being evaluated
+REQUERY_CONFIDENCE = 0.45
+REQUERY_TOP_K = 10
+LOW_CONFIDENCE_NOTE = "no - the retrieved context is only loosely related to the question"
+
+# --- Prompt templates ---
+# Each template is (system prompt, user prompt). The system prompt holds the fixed instructions and is
+# passed to Ollama as the system prompt, so it leads the model input unchanged from query to query and
+# Ollama can reuse its evaluated prefix. Per-query values go in the user prompt, the most variable last.
+PROMPT_TEMPLATES = {
+    'planner': (
+        "Plan a search for a local government search tool. Respond with a JSON object with keys: "
+        "\"language\" (ISO 639-1 code of the user query), "
+        "\"english_query\" (the query translated to English, or unchanged if already English), "
+        "\"index\" (one index name from the list), "
+        "\"section\" (one section of that index, or null if none fits), "
+        "\"search_query\" (a concise, search-friendly English rewrite of the query).",
+        "Available indexes:\n{indexes}\nUser query: '{query}'",
+    ),
+    'translation': (
+        "Translate the user's text to English for a government search tool. Respond with the translation only.",
+        "{query}",
+    ),
+    'index_selection': (
+        "Decide which of the available indexes should be searched for the user query. "
+        "Respond with the index name only.",
+        "Available indexes:\n{indexes}\nUser query: '{query}'",
+    ),
+    'section_prediction': (
+        "Decide which of the available website sections is most relevant to the user query. "
+        "Respond with the section path only.",
+        "Available website sections: {sections}\nUser query: '{query}'",
+    ),
+    'query_rewrite': (
+        "Rewrite the user question to be as concise and search-friendly as possible for a government "
+        "document search. Respond with the rewritten question only.",
+        "{query}",
+    ),
+    'evaluation': (
+        "Decide whether the retrieved context fully answers the user question. "
+        "Respond 'yes' or 'no' and explain briefly.",
+        "Retrieved context: {context}\nUser question: {query}",
+    ),
+    'response': (
+        "You are a local government assistant for a rural community. When answering, always quote directly from "
+        "the provided information using quotation marks whenever possible. For each fact or statement, include a "
+        "citation to the source document (URL and date). If you cannot find an answer in the provided context, say "
+        "so and suggest contacting the local office. Use clear, trustworthy, and professional language. Include next "
+        "steps and who to contact if more help is needed. If you determine the user needs to contact someone, select "
+        "and include only the most relevant contact(s) from the Contacts given, based on the user's question and the "
+        "context. Only present the contact(s) that best match the topic or section of the user's query.",
+        "Relevant information: {context}\nCitations: {citations}\n{evaluation}{section}{contacts}User question: {query}",
+    ),
+    'translation_back': (
+        "Translate each string in the JSON list you are given to the requested language for a government search "
+        "tool user. Keep URLs, phone numbers and quoted names unchanged. Respond with a JSON object "
+        "{\"translations\": [...]} holding the translations in the same order.",
+        "Language: {language}\n{segments}",
+    ),
+    'translation_back_whole': (
+        "Translate the answer you are given to the requested language for a government search tool user.",
+        "Language: {language}\n{answer}",
+    ),
+}
+
+# System prompts evaluated at startup. Ollama keeps one evaluated prompt per parallel slot
+# (OLLAMA_NUM_PARALLEL), so with fewer slots only the last ones stay cached: the answer prompt goes last.
+WARM_UP_TEMPLATES = ('planner', 'evaluation', 'response')
+
+def build_prompt(name, **fields):
+    """
+    Return (system prompt, user prompt) for the named template, filling the user prompt from fields.
+    """
+    system, template = PROMPT_TEMPLATES[name]
+    return system, template.format(**fields)
+
+def warm_up_pipeline():
+    """
+    Load the Gemma and embedding models and evaluate the per-query system prompts, so the first
+    query after startup does not wait for model loading. Returns True if Ollama answered.
+    """
+    return warm_up_models([PROMPT_TEMPLATES[name][0] for name in WARM_UP_TEMPLATES])
 
 # --- State Definition ---
-# The state is a dictionary with keys:
-# 'user_query', 'source_lang', 'translated_query', 'index_name', 'section', 'search_query', 'context_chunks', 'evaluation', 'answer', 'citations'
+# The state is a dictionary (typed as RAGState below) with keys:
+# 'user_query', 'query_embedding', 'cache_hit', 'routed', 'planned', 'source_lang', 'translated_query', 'index_name', 'section', 'search_query', 'searched_indexes', 'context_chunks', 'context_tokens', 'retrieval_confidence', 'requeried', 'evaluation', 'answer', 'citations'
 
-def translation_node(state):
+def cache_lookup_node(state):
+    # Serve paraphrases of already-answered questions without running the pipeline
+    state['cache_hit'] = False
+    if not SEMANTIC_CACHE_ENABLED:
+        return state
+    embedding = generate_embedding(state['user_query'])
+    state['query_embedding'] = embedding
+    entry = get_semantic_cache().lookup(embedding) if embedding else None
+    if entry:
+        state['cache_hit'] = True
+        state['answer'] = entry['answer']
+        state['citations'] = entry['citations']
+    return state
+
+def route_after_cache_lookup(state):
+    if state.get('cache_hit'):
+        return END
+    if not PLANNER_MODE:
+        return 'translation'
+    return 'embedding_route' if routing.ROUTING_MODE == "embedding" else 'planner'
+
+def embedding_route_node(state):
+    # Settle English queries whose index and section are clear from embeddings without a Gemma call;
+    # the planner only sees non-English queries and ambiguous routes
+    state['routed'] = False
     user_query = state['user_query']
+    indexes = list_indexes()
+    if not indexes or detect_language(user_query) != 'en':
+        return state
+    embedding = state.get('query_embedding') or generate_embedding(user_query)
+    routing.ensure_index_embeddings(indexes)
+    index_name, margin = routing.route_index(embedding, list(indexes.keys()))
+    if not index_name or margin < routing.ROUTING_MIN_MARGIN:
+        return state
+    section = None
+    sections = get_sections(index_name)
+    if sections:
+        section, margin = routing.route_section(index_name, embedding)
+        if section not in sections or margin < routing.ROUTING_MIN_MARGIN:
+            return state
+    state['routed'] = True
+    state['source_lang'] = 'en'
+    state['translated_query'] = user_query
+    state['index_name'] = index_name
+    state['section'] = section
+    return state
+
+def route_after_embedding_route(state):
+    return 'query' if state.get('routed') else 'planner'
+
+def get_sections(index_name):
+    """
+    Return the sorted website sections of an index from the section catalog kept at ingest.
+    """
+    return list_sections(index_name)
+
+def parse_plan(response, sections_by_index):
+    """
+    Parse and validate the planner's JSON reply. Returns the plan dict, or None if it is unusable.
+    """
+    match = re.search(r"\{.*\}", response or "", re.DOTALL)
+    if not match:
+        return None
     try:
-        source_lang = detect(user_query)
-    except Exception:
-        source_lang = 'en'
+        plan = json.loads(match.group(0))
+    except ValueError:
+        return None
+    if not isinstance(plan, dict):
+        return None
+    language = str(plan.get('language') or '').strip().lower()
+    english_query = str(plan.get('english_query') or '').strip()
+    search_query = str(plan.get('search_query') or '').strip()
+    index_name = plan.get('index')
+    section = plan.get('section') or None
+    # Only strings can name an index or section (a list would not even be hashable)
+    if not isinstance(index_name, str):
+        return None
+    if not isinstance(section, str):
+        section = None
+    if not re.fullmatch(r"[a-z]{2,3}(-[a-z]{2,4})?", language) or not english_query or not search_query:
+        return None
+    if index_name not in sections_by_index:
+        return None
+    if section not in sections_by_index[index_name]:
+        # An unknown section only loses the filter, not the whole plan
+        section = None
+    return {'language': language.split('-')[0], 'english_query': english_query, 'index': index_name,
+            'section': section, 'search_query': search_query}
+
+def planner_node(state):
+    # One structured call replacing translation, index selection, section prediction and rewrite
+    state['planned'] = False
+    user_query = state['user_query']
+    indexes = list_indexes()
+    if not indexes:
+        return state
+    sections_by_index = {name: get_sections(name) for name in indexes}
+    index_lines = []
+    for name, meta in indexes.items():
+        sections = ', '.join(sections_by_index[name]) or 'none'
+        index_lines.append(f"- {name}: {meta['description']} (sections: {sections})")
+    system, prompt = build_prompt('planner', indexes="\n".join(index_lines), query=user_query)
+    response = cached_gemma3n(prompt, node='planner', index_version=index_version_key(indexes), format="json",
+                              system=system)
+    plan = parse_plan(response, sections_by_index)
+    if not plan:
+        print("[Agents] Planner reply could not be used; falling back to step-by-step routing.")
+        return state
+    state['planned'] = True
+    state['source_lang'] = plan['language']
+    state['translated_query'] = plan['english_query']
+    state['index_name'] = plan['index']
+    state['section'] = plan['section']
+    state['search_query'] = plan['search_query']
+    return state
+
+def route_after_planner(state):
+    return 'query' if state.get('planned') else 'translation'
+
+def cache_store_node(state):
+    embedding = state.get('query_embedding')
+    answer = state.get('answer')
+    if (SEMANTIC_CACHE_ENABLED and embedding and answer and answer != FALLBACK_ANSWER
+            and state.get('context_chunks') and state.get('index_name')):
+        # The answer may cite any index searched after fan-out, so it depends on all of them
+        index_names = state.get('searched_indexes') or [state['index_name']]
+        get_semantic_cache().add(embedding, state['user_query'], state['answer'], state['citations'], index_names)
+    return state
+
+def translation_node(state):
+    user_query = state['user_query']
+    source_lang = detect_language(user_query)
+    translated_query = user_query
     if source_lang != 'en':
-        prompt = f"Translate the following to English for a government search tool: {user_query}"
-        translated_query = run_gemma3n(prompt)
-    else:
-        translated_query = user_query
+        translated_query = recall_translation(user_query, source_lang, 'en')
+        if translated_query is None:
+            system, prompt = build_prompt('translation', query=user_query)
+            translated_query = cached_gemma3n(prompt, node='translation', system=system)
+            remember_translation(user_query, source_lang, 'en', translated_query)
     state['source_lang'] = source_lang
     state['translated_query'] = translated_query
     return state
@@ -30,13 +266,16 @@ def index_selection_node(state):
         state['index_name'] = None
         return state
     index_names = list(indexes.keys())
+    if routing.ROUTING_MODE == "embedding":
+        routing.ensure_index_embeddings(indexes)
+        name, margin = routing.route_index(generate_embedding(query), index_names)
+        if name and margin >= routing.ROUTING_MIN_MARGIN:
+            state['index_name'] = name
+            return state
     index_descs = [f"{name}: {meta['description']}" for name, meta in indexes.items()]
-    prompt = (
-        f"User query: '{query}'\n"
-        f"Available indexes:\n" + "\n".join(index_descs) +
-        "\nWhich index should be searched? Respond with the index name only."
-    )
-    response = run_gemma3n(prompt)
+    system, prompt = build_prompt('index_selection', indexes="\n".join(index_descs), query=query)
+    response = cached_gemma3n(prompt, node='index_selection', index_version=index_version_key(index_names),
+                              system=system)
     for name in index_names:
         if name.lower() in response.lower():
             state['index_name'] = name
@@ -50,25 +289,18 @@ def section_prediction_node(state):
     if not index_name:
         state['section'] = None
         return state
-    col = connect_milvus(index_name)
-    try:
-        all_sections = set()
-        for entities in col.query(expr=None, output_fields=["section"]):
-            section = entities.get("section")
-            if section:
-                all_sections.add(section)
-        sections = list(sorted(all_sections))
-    except Exception:
-        sections = []
+    sections = get_sections(index_name)
     if not sections:
         state['section'] = None
         return state
-    prompt = (
-        f"User query: '{query}'\n"
-        f"Available website sections: {', '.join(sections)}\n"
-        "Which section is most relevant? Respond with the section path only."
-    )
-    response = run_gemma3n(prompt)
+    if routing.ROUTING_MODE == "embedding":
+        section, margin = routing.route_section(index_name, generate_embedding(query))
+        if section in sections and margin >= routing.ROUTING_MIN_MARGIN:
+            state['section'] = section
+            return state
+    system, prompt = build_prompt('section_prediction', sections=', '.join(sections), query=query)
+    response = cached_gemma3n(prompt, node='section_prediction', index_version=index_version_key([index_name]),
+                              system=system)
     for s in sections:
         if s.lower() in response.lower():
             state['section'] = s
@@ -80,82 +312,119 @@ def query_node(state):
     query = state['translated_query']
     index_name = state['index_name']
     section = state['section']
-    prompt = f"Rewrite the following user question to be as concise and search-friendly as possible for a government document search: {query}"
-    search_query = run_gemma3n(prompt)
+    search_query = state.get('search_query')
+    if not search_query:
+        system, prompt = build_prompt('query_rewrite', query=query)
+        search_query = cached_gemma3n(prompt, node='query_rewrite', system=system)
     embedding = generate_embedding(search_query)
-    expr = None
-    if section:
-        expr = f'section == "{section}"'
-    results = search_embeddings(embedding, top_k=5, index_name=index_name, expr=expr)
+    index_names = fanout_indexes(index_name, embedding)
     state['search_query'] = search_query
-    state['context_chunks'] = results
+    state['searched_indexes'] = index_names
+    return retrieve(state, embedding, top_k=5, section=section)
+
+def requery_node(state):
+    # One cheap retry for weak retrieval: more results and no section filter, no LLM call
+    state['requeried'] = True
+    retrieve(state, generate_embedding(state['search_query']), top_k=REQUERY_TOP_K, section=None)
+    if (state['retrieval_confidence'] or 0.0) < REQUERY_CONFIDENCE:
+        state['evaluation'] = LOW_CONFIDENCE_NOTE
+    return state
+
+def retrieve(state, embedding, top_k, section):
+    """
+    Search the state's indexes and pack the hits into context_chunks, setting retrieval_confidence.
+    """
+    index_name = state['index_name']
+    index_names = state['searched_indexes']
+    # The lexical side also sees the user's own wording, which keeps exact identifiers the rewrite may drop
+    lexical_query = f"{state['translated_query']} {state['search_query']}"
+    if len(index_names) > 1:
+        # The predicted section only applies to the index it was predicted for
+        results = multi_index_search(lexical_query, embedding, index_names, top_k=top_k,
+                                     sections={index_name: section} if section else None)
+    else:
+        results = hybrid_search(lexical_query, embedding, top_k=top_k, index_name=index_name, section=section)
+    # Keep the prompts small: prompt evaluation dominates answer time on CPU
+    state['context_chunks'], state['context_tokens'] = pack_context(lexical_query, embedding, results)
+    state['retrieval_confidence'] = state['context_tokens']['top_similarity'] if results else 0.0
     return state
 
+def route_after_query(state):
+    confidence = state.get('retrieval_confidence')
+    if not EVAL_GATING or confidence is None:
+        return 'evaluation'
+    if confidence >= EVAL_SKIP_CONFIDENCE:
+        return 'contacts'
+    if confidence < REQUERY_CONFIDENCE and not state.get('requeried'):
+        return 'requery'
+    return 'evaluation'
+
+def fanout_indexes(index_name, query_embedding):
+    """
+    The indexes to search: the selected one first, then the best routed others, up to FANOUT_INDEXES.
+    """
+    names = list(list_indexes().keys())
+    if FANOUT_INDEXES == 1 or len(names) < 2 or index_name not in names:
+        return [index_name]
+    others = [name for name in routing.rank_indexes(query_embedding, names) if name != index_name]
+    return ([index_name] + others)[:FANOUT_INDEXES or None]
+
 def evaluation_node(state):
     query = state['search_query']
     context_chunks = state['context_chunks']
     context_text = "\n".join([c['text'] for c in context_chunks])
-    prompt = (
-        f"User question: {query}\n"
-        f"Retrieved context: {context_text}\n"
-        "Does the context fully answer the question? Respond 'yes' or 'no' and explain briefly."
-    )
-    response = run_gemma3n(prompt)
+    system, prompt = build_prompt('evaluation', context=context_text, query=query)
+    response = run_gemma3n(prompt, system=system)
     state['evaluation'] = response
     return state
 
-CONTACTS_FILE = "contacts.txt"
-
-def load_contacts():
-    contacts = []
-    if os.path.exists(CONTACTS_FILE):
-        with open(CONTACTS_FILE, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if line:
-                    contacts.append(line)
-    return contacts
-
 def contacts_node(state):
-    # Load contacts and add to state
-    state['contacts'] = load_contacts()
+    # Only the few contacts matching the retrieved pages and section, so the prompt stays bounded
+    urls = [c['url'] for c in state.get('context_chunks') or []]
+    contacts = get_contact_store().relevant(state['search_query'] or state['user_query'], state.get('section'), urls)
+    state['contacts'] = [format_contact(c) for c in contacts]
     return state
 
+FALLBACK_ANSWER = ("Sorry, I was unable to generate an answer at this time. "
+                   "Please try again or contact your local IT administrator.")
+
 def response_node(state):
     query = state['search_query']
     context_chunks = state['context_chunks']
-    evaluation = state['evaluation']
+    evaluation = state.get('evaluation')
     section = state['section']
     contacts = state.get('contacts', [])
     context_text = "\n".join([c['text'] for c in context_chunks])
     citations = [f"Source: {c['url']} (Indexed: {c['date']})" for c in context_chunks]
     section_info = f"Section searched: {section}\n" if section else ""
-    # Provide contacts as a resource, but instruct to only use the most relevant one(s)
-    contacts_instruction = (
-        f"\nIf you determine the user needs to contact someone, select and include only the most relevant contact(s) from the following list, based on the user's question and the context. Do NOT list all contacts. Only present the contact(s) that best match the topic or section of the user's query: {', '.join(contacts)}"
-        if contacts else ""
-    )
-    prompt = (
-        f"User question: {query}\n"
-        f"Relevant information: {context_text}\n"
-        f"Citations: {'; '.join(citations)}\n"
-        f"Evaluation: {evaluation}\n"
-        f"{section_info}"
-        f"{contacts_instruction}"
-        "You are a local government assistant for a rural community. When answering, always quote directly from the provided information using quotation marks whenever possible. For each fact or statement, include a citation to the source document (URL and date). If you cannot find an answer in the provided context, say so and suggest contacting the local office. Use clear, trustworthy, and professional language. Include next steps and who to contact if more help is needed."
-    )
+    # Evaluation is skipped when retrieval confidence already settles it
+    evaluation_info = f"Evaluation: {evaluation}\n" if evaluation else ""
+    # Provide contacts as a resource; the system prompt says to use only the most relevant one(s)
+    contacts_info = f"Contacts: {'; '.join(contacts)}\n" if contacts else ""
+    system, prompt = build_prompt('response', context=context_text, citations='; '.join(citations),
+                                  evaluation=evaluation_info, section=section_info, contacts=contacts_info, query=query)
+    # Stream tokens to rag_pipeline_stream consumers as they arrive
+    writer = get_stream_writer()
     max_retries = 2
     for _ in range(max_retries):
         try:
-            response = run_gemma3n(prompt)
-            if response and response.strip() and not response.startswith("[Error"):
+            tokens = []
+            failed = False
+            for token in run_gemma3n_stream(prompt, system=system):
+                if token.startswith("[Error"):
+                    # A stream cut off part-way is retried, never kept (or cached) as the answer
+                    failed = True
+                    break
+                tokens.append(token)
+                writer({'token': token, 'partial_answer': "".join(tokens)})
+            response = "".join(tokens)
+            if not failed and response.strip():
                 state['answer'] = response
                 break
         except Exception:
             continue
     else:
-        state['answer'] = ("Sorry, I was unable to generate an answer at this time. "
-                          "Please try again or contact your local IT administrator.")
+        state['answer'] = FALLBACK_ANSWER
     state['citations'] = [c['url'] for c in context_chunks]
     return state
 
@@ -163,82 +432,167 @@ def translation_back_node(state):
     source_lang = state.get('source_lang', 'en')
     answer = state.get('answer', '')
     if source_lang != 'en' and answer:
-        prompt = f"Translate the following answer back to {source_lang} for a government search tool user: {answer}"
-        answer = run_gemma3n(prompt)
-        state['answer'] = answer
+        state['answer'] = translate_answer(answer, source_lang)
     return state
 
+def translate_answer(answer, target_lang):
+    """
+    Translate an answer line by line through the translation memory. Lines not remembered for
+    this language are translated together in one Gemma call; if that reply cannot be split back
+    into lines, the whole answer is translated in one piece instead.
+    """
+    lines = answer.split("\n")
+    translated = {}
+    missing = []
+    for line in lines:
+        if line in translated or line in missing or not needs_translation(line):
+            continue
+        remembered = recall_translation(line, 'en', target_lang)
+        if remembered is not None:
+            translated[line] = remembered
+        else:
+            missing.append(line)
+    if missing:
+        system, prompt = build_prompt('translation_back', language=target_lang,
+                                      segments=json.dumps(missing, ensure_ascii=False))
+        response = run_gemma3n(prompt, options=DETERMINISTIC_OPTIONS, format="json", system=system)
+        translations = parse_translations(response, len(missing))
+        if translations is None:
+            system, prompt = build_prompt('translation_back_whole', language=target_lang, answer=answer)
+            response = run_gemma3n(prompt, system=system)
+            return answer if response.startswith("[Error") else response
+        for line, translation in zip(missing, translations):
+            translated[line] = translation
+            remember_translation(line, 'en', target_lang, translation)
+    return "\n".join(translated.get(line, line) for line in lines)
+
 # --- LangGraph Workflow ---
-def rag_pipeline(user_query):
-    # Initial state
-    state = {
+class RAGState(TypedDict, total=False):
+    user_query: str
+    query_embedding: Optional[List[float]]
+    cache_hit: bool
+    routed: bool
+    planned: bool
+    source_lang: Optional[str]
+    translated_query: Optional[str]
+    index_name: Optional[str]
+    section: Optional[str]
+    search_query: Optional[str]
+    searched_indexes: Optional[List[str]]
+    context_chunks: Optional[List[Dict]]
+    context_tokens: Optional[Dict]
+    retrieval_confidence: Optional[float]
+    requeried: bool
+    evaluation: Optional[str]
+    answer: Optional[str]
+    citations: Optional[List[str]]
+    contacts: Optional[List[str]]
+
+def initial_state(user_query):
+    return {
         'user_query': user_query,
+        'query_embedding': None,
+        'cache_hit': False,
+        'routed': False,
+        'planned': False,
         'source_lang': None,
         'translated_query': None,
         'index_name': None,
         'section': None,
         'search_query': None,
+        'searched_indexes': None,
         'context_chunks': None,
+        'context_tokens': None,
+        'retrieval_confidence': None,
+        'requeried': False,
         'evaluation': None,
         'answer': None,
         'citations': None,
         'contacts': None,
     }
-    # Build the graph
-    graph = StateGraph()
-    graph.add_node('translation', translation_node)
-    graph.add_node('index_selection', index_selection_node)
-    graph.add_node('section_prediction', section_prediction_node)
-    graph.add_node('query', query_node)
-    graph.add_node('evaluation', evaluation_node)
-    graph.add_node('contacts', contacts_node)
-    graph.add_node('response', response_node)
-    graph.add_node('translation_back', translation_back_node)
+
+def traced(name, node):
+    """
+    Wrap a graph node so each run is timed into the 'node_seconds' metric, labelled with the node name.
+    """
+    def run(state):
+        with metrics.span("node_seconds", node=name):
+            return node(state)
+    run.__name__ = node.__name__
+    return run
+
+def build_rag_graph():
+    """
+    Build the (uncompiled) RAG workflow graph. Every node is timed (see traced).
+    """
+    graph = StateGraph(RAGState)
+    graph.add_node('cache_lookup', traced('cache_lookup', cache_lookup_node))
+    graph.add_node('embedding_route', traced('embedding_route', embedding_route_node))
+    graph.add_node('planner', traced('planner', planner_node))
+    graph.add_node('translation', traced('translation', translation_node))
+    graph.add_node('index_selection', traced('index_selection', index_selection_node))
+    graph.add_node('section_prediction', traced('section_prediction', section_prediction_node))
+    graph.add_node('query', traced('query', query_node))
+    graph.add_node('requery', traced('requery', requery_node))
+    graph.add_node('evaluation', traced('evaluation', evaluation_node))
+    graph.add_node('contacts', traced('contacts', contacts_node))
+    graph.add_node('response', traced('response', response_node))
+    graph.add_node('translation_back', traced('translation_back', translation_back_node))
+    graph.add_node('cache_store', traced('cache_store', cache_store_node))
     # Edges
+    graph.set_entry_point('cache_lookup')
+    graph.add_conditional_edges('cache_lookup', route_after_cache_lookup)
+    graph.add_conditional_edges('embedding_route', route_after_embedding_route)
+    graph.add_conditional_edges('planner', route_after_planner)
     graph.add_edge('translation', 'index_selection')
     graph.add_edge('index_selection', 'section_prediction')
     graph.add_edge('section_prediction', 'query')
-    graph.add_edge('query', 'evaluation')
+    graph.add_conditional_edges('query', route_after_query)
+    graph.add_edge('requery', 'contacts')
     graph.add_edge('evaluation', 'contacts')
     graph.add_edge('contacts', 'response')
     graph.add_edge('response', 'translation_back')
-    graph.add_edge('translation_back', END)
-    # Run the workflow
-    result = graph.run(state)
+    graph.add_edge('translation_back', 'cache_store')
+    graph.add_edge('cache_store', END)
+    return graph
+
+_compiled_graph = None
+_graph_lock = threading.Lock()
+
+def get_rag_graph():
+    """
+    Return the compiled RAG workflow. It is compiled once and shared by all entry points.
+    """
+    global _compiled_graph
+    if _compiled_graph is None:
+        with _graph_lock:
+            if _compiled_graph is None:
+                _compiled_graph = build_rag_graph().compile()
+    return _compiled_graph
+
+def rag_pipeline(user_query):
+    with metrics.span("query_seconds"):
+        result = get_rag_graph().invoke(initial_state(user_query))
     return result['answer'], result['citations']
 
+async def arag_pipeline(user_query):
+    with metrics.span("query_seconds"):
+        result = await get_rag_graph().ainvoke(initial_state(user_query))
+    return result['answer'], result['citations']
+
+def _stream_update(mode, update):
+    if mode == "custom":
+        # Token emitted by response_node while the answer is generated
+        return {'response_token': update}
+    # update is a dict: {node_name: {state_key: value, ...}}
+    return update
+
 def rag_pipeline_stream(user_query):
-    state = {
-        'user_query': user_query,
-        'source_lang': None,
-        'translated_query': None,
-        'index_name': None,
-        'section': None,
-        'search_query': None,
-        'context_chunks': None,
-        'evaluation': None,
-        'answer': None,
-        'citations': None,
-        'contacts': None,
-    }
-    graph = StateGraph()
-    graph.add_node('translation', translation_node)
-    graph.add_node('index_selection', index_selection_node)
-    graph.add_node('section_prediction', section_prediction_node)
-    graph.add_node('query', query_node)
-    graph.add_node('evaluation', evaluation_node)
-    graph.add_node('contacts', contacts_node)
-    graph.add_node('response', response_node)
-    graph.add_node('translation_back', translation_back_node)
-    graph.add_edge('translation', 'index_selection')
-    graph.add_edge('index_selection', 'section_prediction')
-    graph.add_edge('section_prediction', 'query')
-    graph.add_edge('query', 'evaluation')
-    graph.add_edge('evaluation', 'contacts')
-    graph.add_edge('contacts', 'response')
-    graph.add_edge('response', 'translation_back')
-    graph.add_edge('translation_back', END)
-    compiled = graph.compile()
-    for update in compiled.stream(state, stream_mode="updates"):
-        # update is a dict: {node_name: {state_key: value, ...}}
-        yield update 
\ No newline at end of file
+    with metrics.span("query_seconds"):
+        for mode, update in get_rag_graph().stream(initial_state(user_query), stream_mode=["updates", "custom"]):
+            yield _stream_update(mode, update)
+
+async def arag_pipeline_stream(user_query):
+    with metrics.span("query_seconds"):
+        async for mode, update in get_rag_graph().astream(initial_state(user_query), stream_mode=["updates", "custom"]):
+            yield _stream_update(mode, update)
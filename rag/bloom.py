@@ -0,0 +1,52 @@
+import hashlib
+import math
+import os
+import struct
+from typing import Iterable
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings. "Not present" answers are exact;
+    "present" answers are wrong with probability around error_rate at full capacity.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # Double hashing: position_i = h1 + i * h2
+        digest = hashlib.sha256(item.encode("utf-8")).digest()
+        h1, h2 = struct.unpack_from("<QQ", digest)
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def update(self, items: Iterable[str]):
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def save(self, path: str):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(struct.pack("<QQQ", self.num_bits, self.num_hashes, self.count))
+            f.write(self.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BloomFilter":
+        with open(path, "rb") as f:
+            num_bits, num_hashes, count = struct.unpack("<QQQ", f.read(24))
+            bloom = cls.__new__(cls)
+            bloom.num_bits, bloom.num_hashes, bloom.count = num_bits, num_hashes, count
+            bloom.bits = bytearray(f.read())
+        return bloom
@@ -0,0 +1,170 @@
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+CHUNK_STORE_FILE = "chunk_store.db"
+# Stay well under SQLite's bound-parameter limit
+CHUNK_STORE_BATCH_SIZE = 500
+# Query words too common to help lexical ranking; dropping them keeps the postings scanned short
+LEXICAL_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i", "in", "is",
+    "it", "me", "my", "of", "on", "or", "the", "to", "was", "what", "when", "where", "which", "who", "why",
+    "will", "with", "you",
+}
+# Words, keeping joined identifiers such as ordinance numbers ("2023-14", "A.12") together
+LEXICAL_TOKEN_PATTERN = re.compile(r"\w+(?:[-./]\w+)*")
+# Query words found in more than this fraction of chunks are dropped: their BM25 weight is
+# near zero, but their long posting lists dominate query time
+LEXICAL_MAX_DOC_FRACTION = 0.1
+
+
+class ChunkStore:
+    """
+    On-disk store of chunk text and metadata keyed by (index, content hash).
+    Milvus holds only vectors and small scalar fields; search hits are hydrated from here.
+    An FTS5 full-text index over the text, kept in step by triggers, serves BM25 lexical search.
+    It is not stemmed: the lexical side exists to match exact tokens (ordinance numbers, street
+    names, form IDs), while the embeddings cover paraphrases.
+    """
+
+    def __init__(self, path: str = CHUNK_STORE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._doc_counts = {}  # term -> number of chunks containing it, cleared on every write
+        self._num_chunks = None
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "index_name TEXT NOT NULL, content_hash TEXT NOT NULL, url TEXT NOT NULL, date TEXT NOT NULL, "
+            "section TEXT NOT NULL, text TEXT NOT NULL, PRIMARY KEY (index_name, content_hash))"
+        )
+        has_fts = self._conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'chunks_fts'").fetchone()
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5("
+            "text, content='chunks', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2')"
+        )
+        self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS chunks_vocab USING fts5vocab(chunks_fts, 'row')")
+        self._conn.executescript(
+            "CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN "
+            "INSERT INTO chunks_fts(rowid, text) VALUES (new.rowid, new.text); END;"
+            "CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN "
+            "INSERT INTO chunks_fts(chunks_fts, rowid, text) VALUES ('delete', old.rowid, old.text); END;"
+            "CREATE TRIGGER IF NOT EXISTS chunks_au AFTER UPDATE ON chunks BEGIN "
+            "INSERT INTO chunks_fts(chunks_fts, rowid, text) VALUES ('delete', old.rowid, old.text); "
+            "INSERT INTO chunks_fts(rowid, text) VALUES (new.rowid, new.text); END;"
+        )
+        if not has_fts:
+            # Index chunks stored before full-text search existed
+            self._conn.execute("INSERT INTO chunks_fts(chunks_fts) VALUES ('rebuild')")
+        self._conn.commit()
+
+    def put_many(self, index_name: str, metadatas: List[Dict]):
+        """
+        Store chunks; each metadata dict needs 'content_hash', 'text', 'url' and 'date', and may have 'section'.
+        """
+        rows = [(index_name, m["content_hash"], m["url"], m["date"], m.get("section") or "", m["text"])
+                for m in metadatas]
+        with self._lock:
+            # An upsert rather than INSERT OR REPLACE, so the update trigger keeps the full-text index in step
+            self._conn.executemany(
+                "INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (index_name, content_hash) DO UPDATE SET "
+                "url = excluded.url, date = excluded.date, section = excluded.section, text = excluded.text",
+                rows,
+            )
+            self._conn.commit()
+            self._doc_counts.clear()
+            self._num_chunks = None
+
+    def get_many(self, index_name: str, hashes: List[str]) -> Dict[str, Dict]:
+        """
+        Return {content_hash: {text, url, date, section}} for the stored chunks among hashes.
+        """
+        found = {}
+        unique = list(set(hashes))
+        with self._lock:
+            for i in range(0, len(unique), CHUNK_STORE_BATCH_SIZE):
+                batch = unique[i:i + CHUNK_STORE_BATCH_SIZE]
+                rows = self._conn.execute(
+                    f"SELECT content_hash, text, url, date, section FROM chunks "
+                    f"WHERE index_name = ? AND content_hash IN ({','.join('?' * len(batch))})",
+                    [index_name] + batch,
+                ).fetchall()
+                for chunk_hash, text, url, date, section in rows:
+                    found[chunk_hash] = {"text": text, "url": url, "date": date, "section": section,
+                                         "content_hash": chunk_hash}
+        return found
+
+    def lexical_search(self, index_name: str, query: str, limit: int, section: Optional[str] = None) -> List[Dict]:
+        """
+        Return up to limit chunks of the index ranked by BM25 against the query's words,
+        each with text, url, date, section, content_hash and score (higher is better).
+        """
+        with self._lock:
+            terms = [t for t in lexical_terms(query) if not self._too_common(t)]
+        if not terms:
+            return []
+        match = " OR ".join(f'"{term}"' for term in terms)
+        # Rank on the narrow columns first and read the (large) text of the winners only
+        ranked = ("SELECT f.rowid AS id, bm25(chunks_fts) AS rank FROM chunks_fts f JOIN chunks m ON m.rowid = f.rowid "
+                  "WHERE chunks_fts MATCH ? AND m.index_name = ?")
+        params = [match, index_name]
+        if section:
+            ranked += " AND m.section = ?"
+            params.append(section)
+        sql = (f"SELECT c.content_hash, c.text, c.url, c.date, c.section, r.rank "
+               f"FROM ({ranked} ORDER BY rank LIMIT ?) r JOIN chunks c ON c.rowid = r.id ORDER BY r.rank")
+        with self._lock:
+            rows = self._conn.execute(sql, params + [limit]).fetchall()
+        # SQLite's bm25() is negated so that ascending order is best-first
+        return [{"content_hash": chunk_hash, "text": text, "url": url, "date": date, "section": sec, "score": -rank}
+                for chunk_hash, text, url, date, sec, rank in rows]
+
+    def _too_common(self, term: str) -> bool:
+        # Called with the lock held. Identifiers (multi-token phrases) are always kept.
+        if not term.isalnum():
+            return False
+        if self._num_chunks is None:
+            self._num_chunks = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        if term not in self._doc_counts:
+            row = self._conn.execute("SELECT doc FROM chunks_vocab WHERE term = ?", (term,)).fetchone()
+            self._doc_counts[term] = row[0] if row else 0
+        return self._doc_counts[term] > LEXICAL_MAX_DOC_FRACTION * self._num_chunks
+
+    def delete_many(self, index_name: str, hashes: List[str]):
+        with self._lock:
+            for i in range(0, len(hashes), CHUNK_STORE_BATCH_SIZE):
+                batch = hashes[i:i + CHUNK_STORE_BATCH_SIZE]
+                self._conn.execute(
+                    f"DELETE FROM chunks WHERE index_name = ? AND content_hash IN ({','.join('?' * len(batch))})",
+                    [index_name] + batch,
+                )
+            self._conn.commit()
+            self._doc_counts.clear()
+            self._num_chunks = None
+
+
+def lexical_terms(query: str) -> List[str]:
+    """
+    Distinct non-stopword terms of a query. They are matched as quoted FTS5 strings, so identifiers
+    such as "2023-14" become exact phrases and user text can never inject FTS5 syntax.
+    """
+    terms = []
+    for token in LEXICAL_TOKEN_PATTERN.findall(query.lower()):
+        if token not in LEXICAL_STOPWORDS and token not in terms:
+            terms.append(token)
+    return terms
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_chunk_store() -> ChunkStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ChunkStore()
+    return _store
@@ -0,0 +1,146 @@
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional
+from rag.chunk_store import lexical_terms
+
+CONTACTS_FILE = "contacts.jsonl"
+# Contacts put into one answer prompt, however many the site has
+CONTACTS_LIMIT = 3
+# Characters of page text kept on each side of a phone number or email, e.g. the office it belongs to
+CONTACT_CONTEXT_CHARS = 80
+
+PHONE_REGEX = re.compile(r"\b(?:\+?1[-.\s]?)?(?:\(?\d{3}\)?[-.\s]?)?\d{3}[-.\s]?\d{4}\b")
+EMAIL_REGEX = re.compile(r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+")
+
+
+def extract_contacts(text: str, url: str, section: str) -> List[Dict]:
+    """
+    Find phone numbers and emails in a page's text, each with the page URL, section and surrounding text.
+    """
+    contacts = []
+    seen = set()
+    for kind, pattern in (("phone", PHONE_REGEX), ("email", EMAIL_REGEX)):
+        for match in pattern.finditer(text):
+            value = match.group(0)
+            if value in seen:
+                continue
+            seen.add(value)
+            start = max(0, match.start() - CONTACT_CONTEXT_CHARS)
+            end = match.end() + CONTACT_CONTEXT_CHARS
+            words = text[start:end].split()
+            # Drop words cut off at either edge of the window
+            words = words[1 if start > 0 else 0:-1 if end < len(text) else None]
+            contacts.append({"kind": kind, "value": value, "url": url, "section": section or "",
+                             "context": " ".join(words)})
+    return contacts
+
+
+def format_contact(contact: Dict) -> str:
+    label = "Phone" if contact["kind"] == "phone" else "Email"
+    return f"{label}: {contact['value']} (found on {contact['url']}: \"{contact['context']}\")"
+
+
+class ContactStore:
+    """
+    Contacts found while crawling, one JSON line per (value, page) in CONTACTS_FILE.
+    The file is loaded once and reloaded when its size or modification time changes, so a crawl
+    in another process is picked up without re-reading the file on every query. Lookups go through
+    in-memory indexes by page URL and by section.
+    """
+
+    def __init__(self, path: str = CONTACTS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._signature = None
+        self._contacts = {}  # (value, url) -> contact
+        self._by_url = {}
+        self._by_section = {}
+        self._pages_per_value = {}
+
+    def _refresh(self):
+        # Called with the lock held
+        try:
+            stat = os.stat(self.path)
+            signature = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            signature = None
+        if signature == self._signature:
+            return
+        contacts = {}
+        if signature is not None:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        contact = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line of an interrupted append
+                    contacts[(contact["value"], contact["url"])] = contact
+        self._contacts = {}
+        self._by_url = {}
+        self._by_section = {}
+        self._pages_per_value = {}
+        for contact in contacts.values():
+            self._index(contact)
+        self._signature = signature
+
+    def _index(self, contact: Dict):
+        self._contacts[(contact["value"], contact["url"])] = contact
+        self._by_url.setdefault(contact["url"], []).append(contact)
+        self._by_section.setdefault(contact["section"], []).append(contact)
+        self._pages_per_value[contact["value"]] = self._pages_per_value.get(contact["value"], 0) + 1
+
+    def add(self, contacts: List[Dict]) -> int:
+        """
+        Store contacts not already recorded for their page. Returns how many were new.
+        """
+        with self._lock:
+            self._refresh()
+            new = [c for c in contacts if (c["value"], c["url"]) not in self._contacts]
+            if not new:
+                return 0
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(c) + "\n" for c in new))
+            for contact in new:
+                self._index(contact)
+            stat = os.stat(self.path)
+            self._signature = (stat.st_size, stat.st_mtime_ns)
+            return len(new)
+
+    def relevant(self, query: str, section: Optional[str], urls: List[str], limit: int = CONTACTS_LIMIT) -> List[Dict]:
+        """
+        Return up to limit distinct contacts for a query: those on the pages the context came from
+        rank first, then those in the predicted section, with words shared between the query and
+        the contact's surrounding text breaking ties. Without any match, the contact found on the
+        most pages (usually the main office in the site footer) is returned.
+        """
+        terms = set(lexical_terms(query))
+        with self._lock:
+            self._refresh()
+            candidates = {}
+            for weight, contacts in [(2, self._by_url.get(url, [])) for url in urls] + \
+                                    [(1, self._by_section.get(section, []) if section else [])]:
+                for contact in contacts:
+                    words = set(lexical_terms(contact["context"]))
+                    score = (weight, len(terms & words), -self._pages_per_value[contact["value"]])
+                    if contact["value"] not in candidates or score > candidates[contact["value"]][0]:
+                        candidates[contact["value"]] = (score, contact)
+            if not candidates and self._pages_per_value:
+                value = max(self._pages_per_value, key=self._pages_per_value.get)
+                return [next(c for c in self._contacts.values() if c["value"] == value)]
+        ranked = sorted(candidates.values(), key=lambda entry: entry[0], reverse=True)
+        return [contact for _, contact in ranked[:limit]]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_contact_store() -> ContactStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ContactStore()
+    return _store
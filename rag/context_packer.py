@@ -0,0 +1,139 @@
+import re
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from rag import metrics
+from rag.ollama_utils import generate_embeddings
+from rag.chunk_store import lexical_terms
+
+# Tokens of retrieved context allowed into a prompt; prompt evaluation dominates answer latency on CPU
+CONTEXT_TOKEN_BUDGET = 1200
+# Rough characters per token for English text with Gemma's tokenizer
+CHARS_PER_TOKEN = 4
+# MMR trade-off between relevance to the query (1.0) and novelty against chunks already picked (0.0)
+MMR_LAMBDA = 0.7
+# A chunk at least this similar to one already picked is a near-duplicate and is dropped
+DUPLICATE_SIMILARITY = 0.95
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _unit_rows(vectors: List[Optional[List[float]]]) -> Optional[np.ndarray]:
+    if not vectors or any(not v for v in vectors):
+        return None
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def query_similarities(query_embedding: Optional[List[float]],
+                       chunk_embeddings: List[Optional[List[float]]]) -> Optional[np.ndarray]:
+    """
+    Cosine similarity of each chunk to the query, or None without usable embeddings.
+    """
+    chunks = _unit_rows(chunk_embeddings)
+    query = _unit_rows([query_embedding]) if query_embedding else None
+    if chunks is None or query is None or query.shape[1] != chunks.shape[1]:
+        return None
+    return chunks @ query[0]
+
+
+def mmr_order(query_embedding: Optional[List[float]], chunk_embeddings: List[Optional[List[float]]]) -> List[int]:
+    """
+    Order chunks by maximal marginal relevance, leaving out near-duplicates.
+    Without usable embeddings the retrieval order is kept.
+    """
+    relevance = query_similarities(query_embedding, chunk_embeddings)
+    if relevance is None:
+        return list(range(len(chunk_embeddings)))
+    chunks = _unit_rows(chunk_embeddings)
+    similarity = chunks @ chunks.T
+    picked = []
+    remaining = list(range(len(chunks)))
+    while remaining:
+        if picked:
+            redundancy = similarity[np.ix_(remaining, picked)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining), dtype=np.float32)
+        scores = MMR_LAMBDA * relevance[remaining] - (1 - MMR_LAMBDA) * redundancy
+        best = int(np.argmax(scores))
+        if redundancy[best] < DUPLICATE_SIMILARITY:
+            picked.append(remaining[best])
+        remaining.pop(best)
+    return picked
+
+
+def extract_sentences(text: str, terms: List[str], token_allowance: int) -> str:
+    """
+    Shorten a chunk to its sentences sharing the most words with the query, in their original
+    order, within token_allowance. A chunk that already fits is returned whole; one with no
+    sentence sharing a query word keeps its opening sentences.
+    """
+    if estimate_tokens(text) <= token_allowance:
+        return text
+    sentences = [s.strip() for s in SENTENCE_SPLIT.split(text) if s.strip()]
+    scored = []
+    for position, sentence in enumerate(sentences):
+        words = set(re.findall(r"[\w-]+", sentence.lower()))
+        scored.append((sum(term in words for term in terms), -position, sentence))
+    if any(overlap for overlap, _, _ in scored):
+        scored = [entry for entry in scored if entry[0]]
+    kept = []
+    used = 0
+    for overlap, neg_position, sentence in sorted(scored, reverse=True):
+        cost = estimate_tokens(sentence)
+        if used + cost > token_allowance:
+            if kept:
+                continue
+            # A single long sentence still contributes its beginning
+            sentence = sentence[:token_allowance * CHARS_PER_TOKEN]
+            cost = token_allowance
+        kept.append((-neg_position, sentence))
+        used += cost
+    return " ".join(sentence for _, sentence in sorted(kept))
+
+
+def pack_context(query: str, query_embedding: Optional[List[float]], chunks: List[Dict],
+                 budget: int = CONTEXT_TOKEN_BUDGET) -> Tuple[List[Dict], Dict]:
+    """
+    Fit retrieved chunks into a token budget: drop near-duplicates, order by MMR, and cut each chunk
+    down to its most query-relevant sentences. Chunk embeddings are the vectors the index returned
+    with each hit; only chunks found by lexical search alone are embedded here (normally from the
+    embedding cache filled at indexing time). Returns (packed chunks, stats) and records the
+    'context_tokens_packed' and 'context_tokens_saved' metrics. stats['top_similarity'] is the
+    best chunk's cosine similarity to the query (None without embeddings).
+    """
+    if not chunks:
+        return [], {"tokens_before": 0, "tokens_after": 0, "chunks_dropped": 0, "top_similarity": None}
+    tokens_before = sum(estimate_tokens(c['text']) for c in chunks)
+    chunk_embeddings = [c.get('embedding') for c in chunks]
+    missing = [i for i, embedding in enumerate(chunk_embeddings) if not embedding]
+    if missing:
+        for i, embedding in zip(missing, generate_embeddings([chunks[i]['text'] for i in missing])):
+            chunk_embeddings[i] = embedding
+    order = mmr_order(query_embedding, chunk_embeddings)
+    relevance = query_similarities(query_embedding, chunk_embeddings)
+    terms = lexical_terms(query)
+    packed = []
+    remaining = budget
+    for position, i in enumerate(order):
+        if remaining <= 0:
+            break
+        # Share what is left evenly among the chunks still to place; unused tokens carry forward.
+        # When less is left than one token per chunk, the best-ranked chunk takes all of it.
+        allowance = remaining // (len(order) - position) or remaining
+        text = extract_sentences(chunks[i]['text'], terms, allowance)
+        if not text.strip():
+            continue
+        remaining -= estimate_tokens(text)
+        # The vectors have served their purpose; keep them out of the pipeline state
+        packed.append(dict({key: value for key, value in chunks[i].items() if key != 'embedding'}, text=text))
+    tokens_after = sum(estimate_tokens(c['text']) for c in packed)
+    metrics.record("context_tokens_packed", tokens_after)
+    metrics.record("context_tokens_saved", tokens_before - tokens_after)
+    return packed, {"tokens_before": tokens_before, "tokens_after": tokens_after,
+                    "chunks_dropped": len(chunks) - len(packed),
+                    "top_similarity": float(relevance.max()) if relevance is not None else None}
@@ -0,0 +1,138 @@
+import sqlite3
+import hashlib
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional
+
+EMBED_CACHE_FILE = "embedding_cache.db"
+EMBED_CACHE_MAX_ENTRIES = 200000
+# Fraction of entries removed when the cache grows past its bound
+EMBED_CACHE_EVICT_FRACTION = 0.1
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache keyed by (model, sha256(text)) with LRU eviction.
+    Entries for any other model are dropped the first time a new model is used.
+    """
+
+    def __init__(self, path: str = EMBED_CACHE_FILE, max_entries: int = EMBED_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._model = None
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, last_access REAL NOT NULL, "
+            "PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _use_model(self, model: str):
+        # Called with the lock held
+        if model == self._model:
+            return
+        deleted = self._conn.execute("DELETE FROM embeddings WHERE model != ?", (model,)).rowcount
+        self._conn.commit()
+        if deleted:
+            print(f"[EmbeddingCache] Embedding model changed to {model}; dropped {deleted} stale entries.")
+        self._model = model
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Return the cached embedding for each text, or None where it is not cached.
+        """
+        hashes = [self.text_hash(t) for t in texts]
+        found = {}
+        with self._lock:
+            self._use_model(model)
+            unique = list(set(hashes))
+            # Stay well under SQLite's bound-parameter limit
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model] + part,
+                )
+                for text_hash, blob in rows:
+                    found[text_hash] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, h) for h in found],
+                )
+                self._conn.commit()
+            results = [found.get(h) for h in hashes]
+            hit_count = sum(1 for r in results if r is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+        return results
+
+    def put_many(self, model: str, texts: List[str], embeddings: List[List[float]]):
+        """
+        Store embeddings for the given texts. Empty embeddings (failed calls) are skipped.
+        """
+        now = time.time()
+        rows = [
+            (model, self.text_hash(t), array("f", e).tobytes(), now)
+            for t, e in zip(texts, embeddings) if e
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._use_model(model)
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+            self._evict_if_needed()
+
+    def _evict_if_needed(self):
+        # Called with the lock held
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        excess = count - self.max_entries + int(self.max_entries * EMBED_CACHE_EVICT_FRACTION)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_access LIMIT ?)",
+            (excess,),
+        )
+        self._conn.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """
+    Return the process-wide embedding cache, opening it on first use.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
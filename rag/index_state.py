@@ -0,0 +1,217 @@
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+INDEX_STATE_FILE = "index_state.db"
+
+_conn = None
+_state_lock = threading.RLock()
+_versions = {}
+
+
+def get_state_db() -> sqlite3.Connection:
+    """
+    Return the shared SQLite connection holding per-index bookkeeping. Callers must hold state_lock().
+    """
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(INDEX_STATE_FILE, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS index_versions ("
+            "index_name TEXT PRIMARY KEY, version INTEGER NOT NULL, updated TEXT NOT NULL)"
+        )
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS section_catalog ("
+            "index_name TEXT NOT NULL, section TEXT NOT NULL, chunk_count INTEGER NOT NULL, last_updated TEXT NOT NULL, "
+            "PRIMARY KEY (index_name, section))"
+        )
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS url_documents ("
+            "index_name TEXT NOT NULL, url TEXT NOT NULL, version INTEGER NOT NULL, last_updated TEXT NOT NULL, "
+            "PRIMARY KEY (index_name, url))"
+        )
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS url_chunks ("
+            "index_name TEXT NOT NULL, url TEXT NOT NULL, content_hash TEXT NOT NULL, section TEXT NOT NULL, "
+            "PRIMARY KEY (index_name, url, content_hash))"
+        )
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS compaction_state ("
+            "index_name TEXT PRIMARY KEY, deleted_since_compaction INTEGER NOT NULL, last_compacted TEXT)"
+        )
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS ann_indexes ("
+            "index_name TEXT PRIMARY KEY, index_type TEXT NOT NULL, built_rows INTEGER NOT NULL, built TEXT NOT NULL)"
+        )
+        _conn.commit()
+    return _conn
+
+
+def state_lock() -> threading.RLock:
+    return _state_lock
+
+
+def get_index_version(index_name: str) -> int:
+    """
+    Return the content version of an index. It increases every time the index is written to,
+    so anything derived from the index's contents can be keyed on it.
+    """
+    with _state_lock:
+        if index_name not in _versions:
+            row = get_state_db().execute(
+                "SELECT version FROM index_versions WHERE index_name = ?", (index_name,)
+            ).fetchone()
+            _versions[index_name] = row[0] if row else 0
+        return _versions[index_name]
+
+
+def bump_index_version(index_name: str) -> int:
+    """
+    Mark an index as changed. Returns the new version.
+    """
+    with _state_lock:
+        version = get_index_version(index_name) + 1
+        conn = get_state_db()
+        conn.execute(
+            "INSERT OR REPLACE INTO index_versions VALUES (?, ?, ?)",
+            (index_name, version, datetime.utcnow().isoformat()),
+        )
+        conn.commit()
+        _versions[index_name] = version
+        return version
+
+
+def index_version_key(index_names: Iterable[str]) -> str:
+    """
+    Combined version string for a set of indexes, e.g. 'rag_documents:3'.
+    """
+    return ",".join(f"{name}:{get_index_version(name)}" for name in sorted(index_names))
+
+
+def update_section_catalog(index_name: str, sections: Iterable[str], delta: int = 1):
+    """
+    Adjust per-section chunk counts after chunks are inserted (delta=1) or deleted (delta=-1).
+    Sections whose count drops to zero are removed from the catalog.
+    """
+    changes = {}
+    for section in sections:
+        if section:
+            changes[section] = changes.get(section, 0) + delta
+    if not changes:
+        return
+    now = datetime.utcnow().isoformat()
+    with _state_lock:
+        conn = get_state_db()
+        for section, change in changes.items():
+            conn.execute(
+                "INSERT INTO section_catalog VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (index_name, section) DO UPDATE SET "
+                "chunk_count = chunk_count + excluded.chunk_count, last_updated = excluded.last_updated",
+                (index_name, section, change, now),
+            )
+        conn.execute("DELETE FROM section_catalog WHERE index_name = ? AND chunk_count <= 0", (index_name,))
+        conn.commit()
+
+
+def get_section_catalog(index_name: str) -> List[Dict]:
+    """
+    Return the catalog entries (section, chunk_count, last_updated) of an index, sorted by section.
+    """
+    with _state_lock:
+        rows = get_state_db().execute(
+            "SELECT section, chunk_count, last_updated FROM section_catalog WHERE index_name = ? ORDER BY section",
+            (index_name,),
+        ).fetchall()
+    return [{"section": r[0], "chunk_count": r[1], "last_updated": r[2]} for r in rows]
+
+
+def list_sections(index_name: str) -> List[str]:
+    return [entry["section"] for entry in get_section_catalog(index_name)]
+
+
+def get_url_chunks(index_name: str) -> Dict[str, Dict[str, str]]:
+    """
+    Return the chunks currently indexed per URL as {url: {content_hash: section}}.
+    """
+    documents = {}
+    with _state_lock:
+        rows = get_state_db().execute(
+            "SELECT url, content_hash, section FROM url_chunks WHERE index_name = ?", (index_name,)
+        ).fetchall()
+    for url, chunk_hash, section in rows:
+        documents.setdefault(url, {})[chunk_hash] = section
+    return documents
+
+
+def set_url_chunks(index_name: str, url: str, chunks: Dict[str, str]):
+    """
+    Record the chunk set of a URL as a new document version; an empty set forgets the URL.
+    """
+    with _state_lock:
+        conn = get_state_db()
+        conn.execute("DELETE FROM url_chunks WHERE index_name = ? AND url = ?", (index_name, url))
+        if chunks:
+            conn.executemany(
+                "INSERT INTO url_chunks VALUES (?, ?, ?, ?)",
+                [(index_name, url, chunk_hash, section) for chunk_hash, section in chunks.items()],
+            )
+            conn.execute(
+                "INSERT INTO url_documents VALUES (?, ?, 1, ?) "
+                "ON CONFLICT (index_name, url) DO UPDATE SET "
+                "version = version + 1, last_updated = excluded.last_updated",
+                (index_name, url, datetime.utcnow().isoformat()),
+            )
+        else:
+            conn.execute("DELETE FROM url_documents WHERE index_name = ? AND url = ?", (index_name, url))
+        conn.commit()
+
+
+def record_deletions(index_name: str, count: int) -> int:
+    """
+    Add to the rows deleted since the last compaction. Returns the new total.
+    """
+    with _state_lock:
+        conn = get_state_db()
+        conn.execute(
+            "INSERT INTO compaction_state VALUES (?, ?, NULL) "
+            "ON CONFLICT (index_name) DO UPDATE SET "
+            "deleted_since_compaction = deleted_since_compaction + excluded.deleted_since_compaction",
+            (index_name, count),
+        )
+        conn.commit()
+        return conn.execute(
+            "SELECT deleted_since_compaction FROM compaction_state WHERE index_name = ?", (index_name,)
+        ).fetchone()[0]
+
+
+def record_compaction(index_name: str):
+    with _state_lock:
+        conn = get_state_db()
+        conn.execute(
+            "INSERT OR REPLACE INTO compaction_state VALUES (?, 0, ?)",
+            (index_name, datetime.utcnow().isoformat()),
+        )
+        conn.commit()
+
+
+def get_ann_index(index_name: str) -> Optional[Tuple[str, int]]:
+    """
+    Return (index type, row count its parameters were chosen for) of an index's vector index, if recorded.
+    """
+    with _state_lock:
+        row = get_state_db().execute(
+            "SELECT index_type, built_rows FROM ann_indexes WHERE index_name = ?", (index_name,)
+        ).fetchone()
+    return (row[0], row[1]) if row else None
+
+
+def record_ann_index(index_name: str, index_type: str, built_rows: int):
+    with _state_lock:
+        conn = get_state_db()
+        conn.execute(
+            "INSERT OR REPLACE INTO ann_indexes VALUES (?, ?, ?, ?)",
+            (index_name, index_type, built_rows, datetime.utcnow().isoformat()),
+        )
+        conn.commit()
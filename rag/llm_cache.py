@@ -0,0 +1,129 @@
+import sqlite3
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from rag import ollama_utils
+
+LLM_CACHE_FILE = "llm_cache.db"
+LLM_CACHE_TTL = 24 * 3600  # seconds a cached response stays valid
+LLM_CACHE_MAX_MEMORY = 2000  # entries kept in the in-memory tier
+LLM_CACHE_MAX_DISK = 50000  # entries kept in SQLite
+# Routing prompts and image descriptions expect the same answer every time, so sample greedily
+DETERMINISTIC_OPTIONS = {"temperature": 0, "seed": 0}
+
+
+class LLMCache:
+    """
+    Two-tier (memory LRU over SQLite) cache of LLM responses with a TTL.
+    Hit/miss counters are kept per node so each caller's hit rate can be reported.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_FILE):
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._stats = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, node TEXT NOT NULL, value TEXT NOT NULL, "
+            "expires REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._conn.commit()
+
+    def _count(self, node: str, hit: bool):
+        counts = self._stats.setdefault(node, {"hits": 0, "misses": 0})
+        counts["hits" if hit else "misses"] += 1
+
+    def get(self, key: str, node: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[1] > now:
+                self._memory.move_to_end(key)
+                self._count(node, True)
+                return entry[0]
+            row = self._conn.execute("SELECT value, expires FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and row[1] > now:
+                self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+                self._remember(key, row[0], row[1])
+                self._count(node, True)
+                return row[0]
+            self._count(node, False)
+            return None
+
+    def put(self, key: str, node: str, value: str, ttl: float = LLM_CACHE_TTL):
+        now = time.time()
+        expires = now + ttl
+        with self._lock:
+            self._remember(key, value, expires)
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (key, node, value, expires, now))
+            count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > LLM_CACHE_MAX_DISK:
+                self._conn.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+                self._conn.execute(
+                    "DELETE FROM responses WHERE rowid IN (SELECT rowid FROM responses ORDER BY last_access LIMIT ?)",
+                    (max(0, count - LLM_CACHE_MAX_DISK),),
+                )
+            self._conn.commit()
+
+    def _remember(self, key: str, value: str, expires: float):
+        # Called with the lock held
+        self._memory[key] = (value, expires)
+        self._memory.move_to_end(key)
+        while len(self._memory) > LLM_CACHE_MAX_MEMORY:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            result = {}
+            for node, counts in self._stats.items():
+                total = counts["hits"] + counts["misses"]
+                result[node] = dict(counts, hit_rate=counts["hits"] / total if total else 0.0)
+            return result
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMCache()
+    return _cache
+
+
+def cache_key(prompt: str, index_version: str = "", format: Optional[str] = None, system: Optional[str] = None) -> str:
+    raw = f"{ollama_utils.LLM_MODEL}\0{index_version}\0{format or ''}\0{system or ''}\0{prompt}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def cached_gemma3n(prompt: str, node: str, index_version: str = "", format: Optional[str] = None,
+                   system: Optional[str] = None) -> str:
+    """
+    Run a short deterministic prompt through Gemma, memoized on (model, index version, system prompt, prompt).
+    Error responses are never cached.
+    """
+    cache = get_llm_cache()
+    key = cache_key(prompt, index_version, format, system)
+    cached = cache.get(key, node)
+    if cached is not None:
+        return cached
+    response = ollama_utils.run_gemma3n(prompt, options=DETERMINISTIC_OPTIONS, format=format, system=system)
+    if response and not response.startswith("[Error"):
+        cache.put(key, node, response)
+    return response
+
+
+def cache_stats() -> Dict[str, Dict]:
+    """
+    Per-node hits, misses and hit rate.
+    """
+    return get_llm_cache().stats()
@@ -0,0 +1,111 @@
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, Tuple
+
+# Number of most recent samples kept per metric
+METRICS_WINDOW = 500
+PERCENTILES = (50, 95, 99)
+
+_samples = {}  # (name, labels) -> recent values
+_totals = {}  # (name, labels) -> [count, sum] since start, for Prometheus counters
+_metrics_lock = threading.Lock()
+
+
+def _key(name: str, labels: Dict[str, str]) -> Tuple[str, Tuple]:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def record(name: str, value: float, **labels):
+    """
+    Record one sample (e.g. a latency in seconds) for the named metric.
+    Keyword arguments are labels, e.g. record("node_seconds", 0.2, node="query").
+    """
+    key = _key(name, labels)
+    with _metrics_lock:
+        if key not in _samples:
+            _samples[key] = deque(maxlen=METRICS_WINDOW)
+            _totals[key] = [0, 0.0]
+        _samples[key].append(value)
+        _totals[key][0] += 1
+        _totals[key][1] += value
+
+
+@contextmanager
+def span(name: str, **labels) -> Iterator[None]:
+    """
+    Time the enclosed block and record its duration in seconds, whether or not it raises.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start, **labels)
+
+
+def _percentile(values, pct):
+    # values sorted ascending
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def _summarize(values) -> Dict:
+    if not values:
+        return {"count": 0, "mean": 0.0, "last": 0.0, **{f"p{p}": 0.0 for p in PERCENTILES}}
+    ordered = sorted(values)
+    return {"count": len(values), "mean": sum(values) / len(values), "last": values[-1],
+            **{f"p{p}": _percentile(ordered, p) for p in PERCENTILES}}
+
+
+def summary(name: str, **labels) -> Dict:
+    """
+    Return count, mean, last value and p50/p95/p99 over the recent samples of a metric.
+    """
+    with _metrics_lock:
+        values = list(_samples.get(_key(name, labels), ()))
+    return _summarize(values)
+
+
+def all_summaries() -> Dict[str, Dict]:
+    """
+    Summaries of every metric, keyed by name with labels, e.g. 'node_seconds{node=query}'.
+    """
+    with _metrics_lock:
+        snapshot = {key: list(values) for key, values in _samples.items()}
+    result = {}
+    for (name, labels), values in sorted(snapshot.items()):
+        label_text = ",".join(f"{k}={v}" for k, v in labels)
+        result[f"{name}{{{label_text}}}" if labels else name] = _summarize(values)
+    return result
+
+
+def _prometheus_labels(labels, extra=()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def prometheus_text() -> str:
+    """
+    All metrics in the Prometheus text exposition format, as summaries: quantiles over the
+    recent window plus _sum and _count since the process started. Names get a rag_ prefix,
+    so node_seconds is exported as rag_node_seconds.
+    """
+    with _metrics_lock:
+        snapshot = {key: (sorted(values), list(_totals[key])) for key, values in _samples.items()}
+    lines = []
+    typed = set()
+    for (name, labels), (ordered, (count, total)) in sorted(snapshot.items()):
+        metric = "rag_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+        if metric not in typed:
+            lines.append(f"# TYPE {metric} summary")
+            typed.add(metric)
+        for p in PERCENTILES:
+            value = _percentile(ordered, p) if ordered else 0.0
+            lines.append(f"{metric}{_prometheus_labels(labels, [('quantile', p / 100)])} {value}")
+        lines.append(f"{metric}_sum{_prometheus_labels(labels)} {total}")
+        lines.append(f"{metric}_count{_prometheus_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
@@ -1,10 +1,78 @@
-from pymilvus import connections, Collection, FieldSchema, CollectionSchema, DataType
-from typing import List, Dict, Optional
+from pymilvus import connections, utility, Collection, FieldSchema, CollectionSchema, DataType
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Set
+import hashlib
+import json
+import math
+import os
+import numpy as np
+import threading
 import time
+from rag.index_state import (bump_index_version, update_section_catalog, get_url_chunks, set_url_chunks,
+                             record_deletions, record_compaction, get_ann_index, record_ann_index)
+from rag.routing import update_section_centroids
+from rag import metrics
+from rag.bloom import BloomFilter
+from rag.chunk_store import get_chunk_store
+from rag.vector_index import VectorIndex
+from rag.numpy_index import NumpyVectorIndex
 
 MILVUS_HOST = "localhost"
 MILVUS_PORT = "19530"
+# Optional URI (e.g. a Milvus Lite file such as "./milvus.db"); overrides host/port when set
+MILVUS_URI = None
+MILVUS_ALIAS = "default"
 DEFAULT_COLLECTION_NAME = "rag_documents"
+# "milvus": the Milvus server (or Milvus Lite file) configured above
+# "numpy": in-process exact search over memory-mapped files (rag/numpy_index.py); nothing to run
+#          alongside the app, suited to corpora up to a few hundred thousand chunks
+VECTOR_BACKEND = "milvus"
+VECTOR_DIM = 768
+# Vector index type, overridable per index with an "ann_index" entry in INDEX_REGISTRY:
+#   "FLAT"      exact search, no training; fine up to a few tens of thousands of chunks
+#   "IVF_FLAT"  clustered full vectors (4 bytes/dim)
+#   "IVF_SQ8"   clustered 8-bit scalar-quantized vectors, about 4x less memory than IVF_FLAT
+#   "IVF_PQ"    clustered product-quantized vectors, about 30x less memory, lowest recall
+#   "HNSW"      graph index, best recall and latency, most memory (full vectors plus graph links)
+# bench/ann_recall.py measures recall and latency of each on the same data.
+ANN_INDEX_TYPE = "IVF_FLAT"
+# Rebuild the vector index once the collection has grown this many times past the
+# row count its parameters were chosen for (nlist, M); checked by tune_indexes
+ANN_REBUILD_GROWTH = 4
+# Collections smaller than this are tuned as if they had this many rows
+ANN_MIN_TUNING_ROWS = 1000
+# Seconds between server health checks on the shared connection
+MILVUS_HEALTH_CHECK_INTERVAL = 30
+# Hashes per "content_hash in [...]" dedup query
+DEDUP_BATCH_SIZE = 2000
+# Local Bloom filter of indexed content hashes, so most new chunks skip the Milvus lookup
+DEDUP_BLOOM_ENABLED = True
+DEDUP_BLOOM_CAPACITY = 2000000
+DEDUP_BLOOM_DIR = "dedup_bloom"
+# Hybrid retrieval: vector and BM25 candidates merged by reciprocal rank fusion
+HYBRID_SEARCH_ENABLED = True
+# Candidates taken from each retriever before fusion
+HYBRID_CANDIDATES = 20
+# RRF damping constant: a hit at rank r contributes 1 / (RRF_K + r)
+RRF_K = 60
+# Worker threads for searching several indexes at once
+FANOUT_MAX_WORKERS = 4
+# Compact an index once this many rows have been deleted since its last compaction
+COMPACTION_MIN_DELETED = 5000
+# Skip removing vanished pages if a crawl reached less than this fraction of the known URLs
+# (e.g. the site was down), so a failed crawl cannot empty the index
+GC_MIN_CRAWL_FRACTION = 0.5
+
+# One gRPC connection per process (pymilvus multiplexes concurrent calls over it)
+# and one loaded Collection handle per index
+_collections = {}
+_milvus_lock = threading.RLock()
+_last_health_check = 0.0
+_blooms = {}
+_bloom_locks = {}  # index name -> lock serializing that index's filter builds and updates
+_ann_states = {}  # index name -> (vector index type, tuned row count)
+_vector_indexes = {}
+_fanout_executor = None
 
 # Example index registry (can be persisted)
 INDEX_REGISTRY = {
@@ -13,14 +81,16 @@ INDEX_REGISTRY = {
     # "farming_data": {"description": "Farming and agriculture policies", "domain": "farming"},
 }
 
-# Define schema (all indexes use same schema for now)
+# Define schema (all indexes use same schema for now). Chunk text lives in the chunk store,
+# not in Milvus, so it is neither length-capped nor loaded into Milvus memory.
 def get_schema():
     return CollectionSchema([
         FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=768),
-        FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=2048),
+        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=VECTOR_DIM),
         FieldSchema(name="url", dtype=DataType.VARCHAR, max_length=512),
         FieldSchema(name="date", dtype=DataType.VARCHAR, max_length=32),
+        FieldSchema(name="section", dtype=DataType.VARCHAR, max_length=256),
+        FieldSchema(name="content_hash", dtype=DataType.VARCHAR, max_length=64),
     ], description="RAG document collection")
 
 
@@ -31,59 +101,376 @@ def list_indexes() -> Dict[str, Dict]:
     return INDEX_REGISTRY.copy()
 
 
+def _ensure_connection():
+    # Called with _milvus_lock held. Reuses the live connection, health-checking it
+    # at most every MILVUS_HEALTH_CHECK_INTERVAL seconds, and reconnects if it is gone.
+    global _last_health_check
+    now = time.monotonic()
+    if connections.has_connection(MILVUS_ALIAS):
+        if now - _last_health_check < MILVUS_HEALTH_CHECK_INTERVAL:
+            return
+        try:
+            utility.get_server_version(using=MILVUS_ALIAS)
+            _last_health_check = now
+            return
+        except Exception as e:
+            print(f"[Milvus] Health check failed, reconnecting: {e}")
+            reset_milvus_connection()
+    if MILVUS_URI:
+        connections.connect(alias=MILVUS_ALIAS, uri=MILVUS_URI)
+    else:
+        connections.connect(alias=MILVUS_ALIAS, host=MILVUS_HOST, port=MILVUS_PORT)
+    _last_health_check = now
+
+
+def reset_milvus_connection():
+    """
+    Drop the shared connection and all cached collection handles; the next call reconnects.
+    """
+    with _milvus_lock:
+        _collections.clear()
+        try:
+            connections.disconnect(MILVUS_ALIAS)
+        except Exception:
+            pass
+
+
 def connect_milvus(index_name: Optional[str] = None) -> Collection:
     """
-    Connect to Milvus and return the collection object for the given index.
+    Return the loaded collection object for the given index over the shared connection.
     Create collection if not exists. Defaults to DEFAULT_COLLECTION_NAME.
     """
-    connections.connect(host=MILVUS_HOST, port=MILVUS_PORT)
     name = index_name or DEFAULT_COLLECTION_NAME
-    if name not in Collection.list_collections():
-        col = Collection(name, get_schema())
-        col.create_index("embedding", {"index_type": "IVF_FLAT", "metric_type": "L2", "params": {"nlist": 128}})
-        col.load()
+    with _milvus_lock:
+        _ensure_connection()
+        if name not in _collections:
+            _collections[name] = _open_collection(name)
+        return _collections[name]
+
+
+def _create_scalar_index(col: Collection, field: str):
+    # Scalar index so filters on the field don't scan every row. INVERTED needs Milvus 2.4+;
+    # 2.3 servers only offer the Trie index for VARCHAR fields.
+    for index_type in ("INVERTED", "Trie"):
+        try:
+            col.create_index(field, {"index_type": index_type}, index_name=f"{field}_idx")
+            return
+        except Exception as e:
+            error = e
+    print(f"[Milvus] Could not create {field} index (filters will scan): {error}")
+
+
+def ann_index_type(index_name: str) -> str:
+    return INDEX_REGISTRY.get(index_name, {}).get("ann_index", ANN_INDEX_TYPE)
+
+
+def ann_index_params(index_type: str, num_rows: int) -> Dict:
+    """
+    Build parameters for a vector index sized for num_rows vectors.
+    """
+    rows = max(num_rows, ANN_MIN_TUNING_ROWS)
+    if index_type == "HNSW":
+        params = {"M": 16 if rows < 1000000 else 32, "efConstruction": 200}
+    elif index_type.startswith("IVF_"):
+        # About 4 * sqrt(rows) clusters keeps both the centroid scan and each cluster small
+        params = {"nlist": min(65536, max(16, int(4 * math.sqrt(rows))))}
+        if index_type == "IVF_PQ":
+            # 8 dimensions per sub-quantizer, one byte each: 96 bytes per 768-dim vector
+            params.update(m=VECTOR_DIM // 8, nbits=8)
     else:
-        col = Collection(name)
-        col.load()
-    return col
+        params = {}
+    return {"index_type": index_type, "metric_type": "L2", "params": params}
 
 
-def insert_embeddings(embeddings: List[List[float]], metadatas: List[Dict], index_name: Optional[str] = None):
+def ann_search_params(index_type: str, num_rows: int, top_k: int) -> Dict:
     """
-    Insert embeddings and metadata into the specified Milvus index.
-    Each metadata dict should have 'text', 'url', and 'date'.
+    Search parameters matching ann_index_params for the same type and row count.
+    """
+    build = ann_index_params(index_type, num_rows)["params"]
+    if index_type == "HNSW":
+        params = {"ef": max(64, 2 * top_k)}
+    elif "nlist" in build:
+        # Probe about 1/16 of the clusters, at least 8
+        params = {"nprobe": min(build["nlist"], max(8, build["nlist"] // 16))}
+    else:
+        params = {}
+    return {"metric_type": "L2", "params": params}
+
+
+def _build_ann_index(col: Collection, index_type: str, num_rows: int):
+    col.create_index("embedding", ann_index_params(index_type, num_rows), index_name="embedding_idx")
+    record_ann_index(col.name, index_type, num_rows)
+    _ann_states[col.name] = (index_type, num_rows)
+
+
+def _ann_state(col: Collection):
+    # (index type, tuned row count) of the collection's vector index
+    if col.name in _ann_states:
+        return _ann_states[col.name]
+    state = get_ann_index(col.name)
+    if state is None:
+        # Collection indexed before the type was recorded: read it back from Milvus,
+        # inverting nlist = 4 * sqrt(rows) for the row count
+        index = next((i for i in col.indexes if i.field_name == "embedding"), None)
+        index_type = index.params.get("index_type", ANN_INDEX_TYPE) if index else ANN_INDEX_TYPE
+        nlist = (index.params.get("params") or {}).get("nlist") if index else None
+        state = (index_type, (nlist // 4) ** 2 if nlist else col.num_entities)
+        record_ann_index(col.name, *state)
+    _ann_states[col.name] = state
+    return state
+
+
+def tune_ann_index(index_name: Optional[str] = None, force: bool = False) -> bool:
+    """
+    Rebuild the vector index if its configured type changed or the collection has grown
+    ANN_REBUILD_GROWTH times past the size its parameters were chosen for.
+    The collection is released while the index rebuilds, so run this off-hours (see tune_indexes), not during queries.
+    Returns True if the index was rebuilt.
     """
     col = connect_milvus(index_name)
-    data = [
-        [None] * len(embeddings),  # id (auto)
-        embeddings,
-        [m["text"] for m in metadatas],
-        [m["url"] for m in metadatas],
-        [m["date"] for m in metadatas],
-    ]
+    index_type = ann_index_type(col.name)
+    built_type, built_rows = _ann_state(col)
+    num_rows = col.num_entities
+    if not force and built_type == index_type and \
+            max(num_rows, ANN_MIN_TUNING_ROWS) <= ANN_REBUILD_GROWTH * max(built_rows, ANN_MIN_TUNING_ROWS):
+        return False
+    with _milvus_lock:
+        try:
+            _replace_ann_index(col, index_type, num_rows)
+            print(f"[Milvus] Rebuilt {index_type} index of '{col.name}' for {num_rows} rows.")
+            return True
+        except Exception as e:
+            # e.g. a type this server does not support; put the previous index back
+            fallback = built_type if built_type != index_type else ANN_INDEX_TYPE
+            print(f"[Milvus] Could not build {index_type} index of '{col.name}', restoring {fallback}: {e}")
+            try:
+                _replace_ann_index(col, fallback, built_rows)
+            except Exception as e:
+                print(f"[Milvus] Index restore error: {e}")
+                reset_milvus_connection()
+            return False
+
+
+def _replace_ann_index(col: Collection, index_type: str, num_rows: int):
+    # Called with _milvus_lock held
+    col.release()
+    index = next((i for i in col.indexes if i.field_name == "embedding"), None)
+    if index:
+        col.drop_index(index_name=index.index_name)
+    _build_ann_index(col, index_type, num_rows)
+    col.load()
+
+
+def _open_collection(name: str) -> Collection:
+    if not utility.has_collection(name, using=MILVUS_ALIAS):
+        col = Collection(name, get_schema(), using=MILVUS_ALIAS)
+        _build_ann_index(col, ann_index_type(name), 0)
+        _create_scalar_index(col, "section")
+        _create_scalar_index(col, "content_hash")
+        try:
+            col.load()
+        except Exception as e:
+            print(f"[Milvus] Could not load '{name}' with a {ann_index_type(name)} index, using {ANN_INDEX_TYPE}: {e}")
+            _replace_ann_index(col, ANN_INDEX_TYPE, 0)
+    else:
+        col = Collection(name, using=MILVUS_ALIAS)
+        field_names = [f.name for f in col.schema.fields]
+        if "section" not in field_names or "content_hash" not in field_names:
+            print(f"[Milvus] Collection '{name}' predates the section/content_hash fields; "
+                  "drop it and recrawl to enable section filters and hash deduplication.")
+        elif "text" in field_names:
+            print(f"[Milvus] Collection '{name}' still stores chunk text; "
+                  "drop it and recrawl to move the text to the chunk store.")
+        col.load()
+    return col
+
+
+def _read_with_retry(index_name: Optional[str], read: Callable[[Collection], object]):
+    # Run a read-only call; if it fails, reconnect once and retry before giving up
     try:
-        col.insert(data)
-        col.flush()
+        return read(connect_milvus(index_name))
     except Exception as e:
-        print(f"[Milvus] Insert error: {e}")
+        print(f"[Milvus] Call failed, reconnecting and retrying: {e}")
+        reset_milvus_connection()
+        return read(connect_milvus(index_name))
 
 
-def search_embeddings(query_embedding: List[float], top_k: int = 5, index_name: Optional[str] = None) -> List[Dict]:
+class MilvusVectorIndex(VectorIndex):
     """
-    Search the specified Milvus index for similar embeddings. Returns list of dicts with text, url, and score.
+    VectorIndex over a Milvus collection, using the shared connection and cached handles.
     """
-    col = connect_milvus(index_name)
-    try:
-        results = col.search(
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def count(self) -> int:
+        return connect_milvus(self.name).num_entities
+
+    def insert(self, embeddings: List[List[float]], rows: List[Dict]):
+        col = connect_milvus(self.name)
+        columns = {"embedding": embeddings}
+        for field in ("url", "date", "section", "content_hash"):
+            columns[field] = [r[field] for r in rows]
+        fields = {f.name: f for f in col.schema.fields}
+        if "text" in fields:
+            # Older collections still have a capped text column; fill it with a prefix
+            max_bytes = fields["text"].params.get("max_length", 2048)
+            columns["text"] = [r["text"].encode("utf-8")[:max_bytes].decode("utf-8", "ignore") for r in rows]
+        # Follow the collection's own schema so older collections keep accepting inserts
+        data = [columns[f.name] for f in col.schema.fields if not f.auto_id]
+        try:
+            col.insert(data)
+            col.flush()
+        except Exception:
+            # Inserts are not retried (a partial write could duplicate rows), but reconnect next time
+            reset_milvus_connection()
+            raise
+
+    def search(self, query_embedding: List[float], top_k: int, filters: Optional[Dict[str, str]] = None,
+               expr: Optional[str] = None) -> List[Dict]:
+        conditions = [f"{field} == {expr_string(value)}" for field, value in (filters or {}).items() if value is not None]
+        if expr:
+            conditions.append(f"({expr})")
+        results = _read_with_retry(self.name, lambda col: col.search(
             data=[query_embedding],
             anns_field="embedding",
-            param={"metric_type": "L2", "params": {"nprobe": 10}},
+            param=ann_search_params(*_ann_state(col), top_k),
             limit=top_k,
-            output_fields=["text", "url", "date"]
-        )
-        hits = results[0]
+            expr=" and ".join(conditions) or None,
+            output_fields=[f.name for f in col.schema.fields
+                           if f.name in ("text", "url", "date", "section", "content_hash", "embedding")]
+        ))
+        return [
+            {"url": hit.entity.get("url"), "date": hit.entity.get("date"), "section": hit.entity.get("section"),
+             "content_hash": hit.entity.get("content_hash"), "text": hit.entity.get("text"), "score": hit.distance,
+             "embedding": hit.entity.get("embedding")}
+            for hit in results[0]
+        ]
+
+    def existing(self, hashes: List[str]) -> Set[str]:
+        found = set()
+        for i in range(0, len(hashes), DEDUP_BATCH_SIZE):
+            expr = f"content_hash in {json.dumps(hashes[i:i + DEDUP_BATCH_SIZE])}"
+            rows = _read_with_retry(self.name, lambda col: col.query(expr=expr, output_fields=["content_hash"]))
+            found.update(r["content_hash"] for r in rows)
+        return found
+
+    def embeddings(self, hashes: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        for i in range(0, len(hashes), DEDUP_BATCH_SIZE):
+            expr = f"content_hash in {json.dumps(hashes[i:i + DEDUP_BATCH_SIZE])}"
+            rows = _read_with_retry(self.name, lambda col: col.query(expr=expr, output_fields=["content_hash", "embedding"]))
+            found.update((r["content_hash"], r["embedding"]) for r in rows)
+        return found
+
+    def delete(self, hashes: List[str]):
+        col = connect_milvus(self.name)
+        try:
+            col.delete(f"content_hash in {json.dumps(hashes)}")
+            col.flush()
+        except Exception:
+            reset_milvus_connection()
+            raise
+
+    def scan(self, fields: List[str]) -> Iterator[List[Dict]]:
+        iterator = connect_milvus(self.name).query_iterator(batch_size=DEDUP_BATCH_SIZE, expr="", output_fields=fields)
+        while True:
+            rows = iterator.next()
+            if not rows:
+                iterator.close()
+                return
+            yield rows
+
+    def compact(self):
+        connect_milvus(self.name).compact()
+
+    def tune(self, force: bool = False) -> bool:
+        return tune_ann_index(self.name, force=force)
+
+
+def get_vector_index(index_name: Optional[str] = None) -> VectorIndex:
+    """
+    Return the storage backend (see VECTOR_BACKEND) of the given index.
+    """
+    name = index_name or DEFAULT_COLLECTION_NAME
+    with _milvus_lock:
+        if name not in _vector_indexes:
+            if VECTOR_BACKEND == "numpy":
+                _vector_indexes[name] = NumpyVectorIndex(name, VECTOR_DIM)
+            else:
+                _vector_indexes[name] = MilvusVectorIndex(name)
+        return _vector_indexes[name]
+
+
+def expr_string(value: str) -> str:
+    """
+    Quote a string literal for use in a Milvus boolean expression.
+    """
+    return json.dumps(value)
+
+
+def section_expr(section: str) -> str:
+    return f"section == {expr_string(section)}"
+
+
+def content_hash(url: str, text: str) -> str:
+    """
+    Deduplication key of a chunk: the same text at the same URL is the same chunk, whenever it was crawled.
+    """
+    return hashlib.sha256(f"{url}\n{text}".encode("utf-8")).hexdigest()
+
+
+def insert_embeddings(embeddings: List[List[float]], metadatas: List[Dict], index_name: Optional[str] = None) -> bool:
+    """
+    Insert embeddings and metadata into the specified index, and the chunk text into the chunk store.
+    Each metadata dict should have 'text', 'url', and 'date', and may have 'section'.
+    Returns True if the insert succeeded.
+    """
+    index = get_vector_index(index_name)
+    rows = [dict(m, section=m.get("section") or "", content_hash=m.get("content_hash") or content_hash(m["url"], m["text"]))
+            for m in metadatas]
+    sections = [r["section"] for r in rows]
+    try:
+        # Store the text first so a vector never points at a missing chunk
+        get_chunk_store().put_many(index.name, rows)
+        with metrics.span("vector_request_seconds", op="insert", backend=VECTOR_BACKEND):
+            index.insert(embeddings, rows)
+        bump_index_version(index.name)
+        update_section_catalog(index.name, sections)
+        update_section_centroids(index.name, embeddings, sections)
+        if DEDUP_BLOOM_ENABLED and VECTOR_BACKEND == "milvus":
+            _add_to_bloom(index.name, [r["content_hash"] for r in rows])
+        return True
+    except Exception as e:
+        print(f"[Milvus] Insert error: {e}")
+        return False
+
+
+def search_embeddings(query_embedding: List[float], top_k: int = 5, index_name: Optional[str] = None,
+                      section: Optional[str] = None, expr: Optional[str] = None) -> List[Dict]:
+    """
+    Search the specified index for similar embeddings, optionally restricted to one section or, on the
+    Milvus backend, by a boolean expression. Returns list of dicts with text, url, date, section, score
+    and the chunk's stored embedding.
+    The backend returns only content hashes and scalar fields; the text is read from the chunk store in one batch.
+    """
+    index = get_vector_index(index_name)
+    filters = {"section": section} if section else None
+    try:
+        with metrics.span("vector_request_seconds", op="search", backend=VECTOR_BACKEND):
+            if expr:
+                if not isinstance(index, MilvusVectorIndex):
+                    raise ValueError("boolean expressions need the Milvus backend")
+                hits = index.search(query_embedding, top_k, filters, expr=expr)
+            else:
+                hits = index.search(query_embedding, top_k, filters)
+        with metrics.span("chunk_store_seconds", op="get_many"):
+            chunks = get_chunk_store().get_many(index.name, [hit["content_hash"] for hit in hits if hit.get("content_hash")])
         return [
-            {"text": hit.entity.get("text"), "url": hit.entity.get("url"), "date": hit.entity.get("date"), "score": hit.distance}
+            dict(chunks.get(hit.get("content_hash")) or
+                 {"text": hit.get("text") or "", "url": hit["url"], "date": hit["date"], "section": hit["section"],
+                  "content_hash": hit.get("content_hash")},
+                 score=hit["score"], embedding=hit.get("embedding"))
             for hit in hits
         ]
     except Exception as e:
@@ -91,22 +478,312 @@ def search_embeddings(query_embedding: List[float], top_k: int = 5, index_name:
         return []
 
 
-def register_index(index_name: str, description: str, domain: str):
+def hybrid_search(query_text: str, query_embedding: List[float], top_k: int = 5, index_name: Optional[str] = None,
+                  section: Optional[str] = None) -> List[Dict]:
+    """
+    Search with both the query embedding and BM25 over the query's words, merging the two rankings
+    by reciprocal rank fusion. Returns the same dicts as search_embeddings, but score is the fused
+    score (higher is better) and chunks found only by BM25 have no embedding. Exact tokens such as ordinance numbers or form IDs are found by the
+    lexical side even when the vectors miss them.
+    """
+    if not HYBRID_SEARCH_ENABLED:
+        return search_embeddings(query_embedding, top_k=top_k, index_name=index_name, section=section)
+    name = index_name or DEFAULT_COLLECTION_NAME
+    vector_hits = search_embeddings(query_embedding, top_k=HYBRID_CANDIDATES, index_name=name, section=section)
+    try:
+        with metrics.span("chunk_store_seconds", op="lexical_search"):
+            lexical_hits = get_chunk_store().lexical_search(name, query_text, HYBRID_CANDIDATES, section=section)
+    except Exception as e:
+        print(f"[Milvus] Lexical search error: {e}")
+        lexical_hits = []
+    fused = {}
+    for hits in (vector_hits, lexical_hits):
+        for rank, hit in enumerate(hits, start=1):
+            key = hit.get("content_hash") or hit["text"]
+            entry = fused.setdefault(key, dict(hit, score=0.0))
+            entry["score"] += 1.0 / (RRF_K + rank)
+    return sorted(fused.values(), key=lambda hit: hit["score"], reverse=True)[:top_k]
+
+
+def similarity_scores(query_embedding: List[float], hits: List[Dict], index_name: Optional[str] = None) -> List[float]:
     """
-    Register a new index (collection) in the registry.
+    Cosine similarity between the query and each hit's stored embedding, a 0-1-ish score that means
+    the same thing in every index (fused RRF scores only reflect rank, so every index's first hit
+    would look equally good). Hits found only by BM25 have their embedding read from the index;
+    hits with no embedding at all score 0.
+    """
+    missing = [hit["content_hash"] for hit in hits if hit.get("embedding") is None and hit.get("content_hash")]
+    found = get_vector_index(index_name).embeddings(missing) if missing else {}
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query_norm = np.linalg.norm(query)
+    scores = []
+    for hit in hits:
+        embedding = hit.get("embedding")
+        if embedding is None:
+            embedding = hit["embedding"] = found.get(hit.get("content_hash"))
+        vector = np.asarray(embedding if embedding is not None else [], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if vector.shape != query.shape or not norm or not query_norm:
+            scores.append(0.0)
+        else:
+            scores.append(float(vector @ query / (norm * query_norm)))
+    return scores
+
+
+def _get_fanout_executor() -> ThreadPoolExecutor:
+    global _fanout_executor
+    with _milvus_lock:
+        if _fanout_executor is None:
+            _fanout_executor = ThreadPoolExecutor(max_workers=FANOUT_MAX_WORKERS, thread_name_prefix="index-fanout")
+        return _fanout_executor
+
+
+def multi_index_search(query_text: str, query_embedding: List[float], index_names: List[str], top_k: int = 5,
+                       sections: Optional[Dict[str, str]] = None) -> List[Dict]:
+    """
+    Run hybrid_search on several indexes concurrently and merge the hits into one ranked list,
+    so retrieval takes about as long as the slowest index rather than the sum.
+    sections optionally restricts individual indexes to a section. Each hit is scored by its cosine
+    similarity to the query (see similarity_scores) and tagged with its index_name.
+    """
+    sections = sections or {}
+    futures = {
+        name: _get_fanout_executor().submit(hybrid_search, query_text, query_embedding, top_k, name, sections.get(name))
+        for name in index_names
+    }
+    merged = {}
+    for name, future in futures.items():
+        try:
+            hits = future.result()
+        except Exception as e:
+            print(f"[Milvus] Search of '{name}' failed: {e}")
+            continue
+        try:
+            scores = similarity_scores(query_embedding, hits, name)
+        except Exception as e:
+            print(f"[Milvus] Reading embeddings from '{name}' failed: {e}")
+            scores = [0.0] * len(hits)
+        for hit, score in zip(hits, scores):
+            hit = dict(hit, index_name=name, score=score)
+            key = hit.get("content_hash") or hit["text"]
+            # The same chunk indexed twice keeps its best score
+            if key not in merged or hit["score"] > merged[key]["score"]:
+                merged[key] = hit
+    return sorted(merged.values(), key=lambda hit: hit["score"], reverse=True)[:top_k]
+
+
+def register_index(index_name: str, description: str, domain: str, ann_index: Optional[str] = None):
+    """
+    Register a new index (collection) in the registry, optionally with its own vector index type.
     """
     INDEX_REGISTRY[index_name] = {"description": description, "domain": domain}
+    if ann_index:
+        INDEX_REGISTRY[index_name]["ann_index"] = ann_index
+
+
+def _bloom_path(index_name: str) -> str:
+    return os.path.join(DEDUP_BLOOM_DIR, f"{index_name}.bloom")
+
+
+def _bloom_lock(index_name: str) -> threading.RLock:
+    with _milvus_lock:
+        return _bloom_locks.setdefault(index_name, threading.RLock())
+
 
+def _get_bloom(index_name: str) -> BloomFilter:
+    # Load the index's Bloom filter, building it from the stored hashes the first time.
+    # A build scans the whole collection, so it holds only this index's lock: searches,
+    # which need _milvus_lock, carry on meanwhile.
+    with _bloom_lock(index_name):
+        with _milvus_lock:
+            bloom = _blooms.get(index_name)
+        if bloom is not None:
+            return bloom
+        path = _bloom_path(index_name)
+        if os.path.exists(path):
+            bloom = BloomFilter.load(path)
+        else:
+            bloom = BloomFilter(DEDUP_BLOOM_CAPACITY)
+            for rows in get_vector_index(index_name).scan(["content_hash"]):
+                bloom.update(r["content_hash"] for r in rows)
+            os.makedirs(DEDUP_BLOOM_DIR, exist_ok=True)
+            bloom.save(path)
+        with _milvus_lock:
+            _blooms[index_name] = bloom
+        return bloom
 
-def chunk_exists(url: str, text: str, date: str, index_name: Optional[str] = None) -> bool:
+
+def _add_to_bloom(index_name: str, hashes: Iterable[str]):
+    try:
+        with _bloom_lock(index_name):
+            bloom = _get_bloom(index_name)
+            bloom.update(hashes)
+            bloom.save(_bloom_path(index_name))
+    except Exception as e:
+        print(f"[Milvus] Bloom filter update error: {e}")
+        with _bloom_lock(index_name):
+            with _milvus_lock:
+                _blooms.pop(index_name, None)
+            if os.path.exists(_bloom_path(index_name)):
+                # A filter missing some hashes would let duplicates through; rebuild it next time
+                os.remove(_bloom_path(index_name))
+
+
+def existing_hashes(hashes: List[str], index_name: Optional[str] = None) -> Set[str]:
     """
-    Check if a chunk with the same url, text, and date already exists in the index.
+    Return the subset of content hashes already stored in the index.
+    On Milvus, hashes the Bloom filter has never seen are new without a query; the rest are
+    looked up with batched "content_hash in [...]" queries.
     """
-    col = connect_milvus(index_name)
-    expr = f'url == "{url}" && text == "{text}" && date == "{date}"'
+    name = index_name or DEFAULT_COLLECTION_NAME
+    candidates = list(set(hashes))
+    if DEDUP_BLOOM_ENABLED and VECTOR_BACKEND == "milvus" and candidates:
+        try:
+            bloom = _get_bloom(name)
+            candidates = [h for h in candidates if h in bloom]
+        except Exception as e:
+            print(f"[Milvus] Bloom filter unavailable, querying all hashes: {e}")
+    try:
+        with metrics.span("vector_request_seconds", op="existing", backend=VECTOR_BACKEND):
+            return get_vector_index(name).existing(candidates)
+    except Exception as e:
+        print(f"[Milvus] Dedup query error: {e}")
+        return set()
+
+
+def chunk_exists(url: str, text: str, index_name: Optional[str] = None) -> bool:
+    """
+    Check if a chunk with the same url and text already exists in the index.
+    """
+    return bool(existing_hashes([content_hash(url, text)], index_name=index_name))
+
+
+def delete_chunks(hashes: List[str], sections: List[str], index_name: Optional[str] = None) -> int:
+    """
+    Delete chunks by content hash. sections (parallel to hashes) keep the section catalog and the
+    routing centroids in step.
+    Returns the number of chunks deleted.
+    """
+    if not hashes:
+        return 0
+    index = get_vector_index(index_name)
+    deleted = 0
     try:
-        results = col.query(expr=expr, output_fields=["url", "text", "date"])
-        return len(results) > 0
+        for i in range(0, len(hashes), DEDUP_BATCH_SIZE):
+            batch = hashes[i:i + DEDUP_BATCH_SIZE]
+            batch_sections = sections[i:i + DEDUP_BATCH_SIZE]
+            # Read the vectors first so they can be taken back out of their section centroids
+            vectors = index.embeddings(batch)
+            with metrics.span("vector_request_seconds", op="delete", backend=VECTOR_BACKEND):
+                index.delete(batch)
+            update_section_catalog(index.name, batch_sections, delta=-1)
+            stored = [(vectors[h], section) for h, section in zip(batch, batch_sections) if h in vectors]
+            update_section_centroids(index.name, [v for v, _ in stored], [s for _, s in stored], delta=-1)
+            get_chunk_store().delete_many(index.name, batch)
+            deleted += len(batch)
     except Exception as e:
-        print(f"[Milvus] Query error: {e}")
-        return False 
\ No newline at end of file
+        print(f"[Milvus] Delete error: {e}")
+    if deleted:
+        bump_index_version(index.name)
+        if record_deletions(index.name, deleted) >= COMPACTION_MIN_DELETED:
+            compact_index(index.name)
+    return deleted
+
+
+def compact_index(index_name: Optional[str] = None):
+    """
+    Compact the index, physically dropping deleted rows (in the background on Milvus).
+    """
+    index = get_vector_index(index_name)
+    try:
+        index.compact()
+        record_compaction(index.name)
+        print(f"[Milvus] Compaction started for '{index.name}'.")
+    except Exception as e:
+        print(f"[Milvus] Compaction error: {e}")
+
+
+def _seed_url_chunks(index: VectorIndex):
+    # First sync of an index created before per-URL tracking: learn its current chunks from the backend
+    documents = {}
+    for rows in index.scan(["url", "content_hash", "section"]):
+        for r in rows:
+            if r.get("content_hash"):
+                documents.setdefault(r["url"], {})[r["content_hash"]] = r.get("section") or ""
+    for url, chunks in documents.items():
+        set_url_chunks(index.name, url, chunks)
+    return documents
+
+
+def sync_documents(embeddings: List[List[float]], metadatas: List[Dict], index_name: Optional[str] = None,
+                   retain_urls: Optional[Iterable[str]] = None, scope: Optional[Iterable[str]] = None) -> Dict:
+    """
+    Bring the index in line with a full crawl, one document version per URL:
+    - a URL whose chunks are unchanged is left alone;
+    - a changed URL gets its new chunks inserted, then its old chunks deleted, so it is never
+      without content (Milvus has no multi-statement transactions; readers may briefly see both);
+    - a known URL absent from the crawl has all its chunks deleted if it starts with one of the
+      scope prefixes (what this crawl covers, e.g. its site and file folder), unless it is in
+      retain_urls (pages that failed to fetch this time). Without a scope nothing is removed, so
+      crawling one site never deletes another site sharing the index.
+    Each metadata dict needs 'url', 'text', 'date' and 'content_hash', and may have 'section'.
+    Returns counts of rows added (new URLs), replaced (changed URLs), deleted, and unchanged URLs.
+    """
+    index = get_vector_index(index_name)
+    name = index.name
+    known = get_url_chunks(name)
+    if not known and index.count():
+        known = _seed_url_chunks(index)
+    crawled = {}
+    for emb, meta in zip(embeddings, metadatas):
+        crawled.setdefault(meta["url"], {}).setdefault(meta["content_hash"], (emb, meta))
+    stats = {"rows_added": 0, "rows_replaced": 0, "rows_deleted": 0, "urls_unchanged": 0}
+    fresh, delete_hashes, delete_sections, new_versions = [], [], [], {}
+    for url, chunks in crawled.items():
+        old_chunks = known.get(url, {})
+        if chunks.keys() == old_chunks.keys():
+            stats["urls_unchanged"] += 1
+            continue
+        fresh.extend((url, emb, meta) for chunk_hash, (emb, meta) in chunks.items() if chunk_hash not in old_chunks)
+        for chunk_hash, section in old_chunks.items():
+            if chunk_hash not in chunks:
+                delete_hashes.append(chunk_hash)
+                delete_sections.append(section)
+        new_versions[url] = {chunk_hash: meta.get("section") or "" for chunk_hash, (_, meta) in chunks.items()}
+    retained = set(retain_urls or ())
+    prefixes = tuple(scope or ())
+    owned = [url for url in known if prefixes and url.startswith(prefixes)]
+    vanished = [url for url in owned if url not in crawled and url not in retained]
+    reached = sum(url in crawled for url in owned)
+    if vanished and reached < GC_MIN_CRAWL_FRACTION * len(owned):
+        print(f"[Milvus] Crawl reached {reached} of {len(owned)} known URLs; not removing vanished pages.")
+        vanished = []
+    for url in vanished:
+        for chunk_hash, section in known[url].items():
+            delete_hashes.append(chunk_hash)
+            delete_sections.append(section)
+        new_versions[url] = {}
+    # Skip chunks already stored by an earlier run whose bookkeeping was lost
+    stored = existing_hashes([meta["content_hash"] for _, _, meta in fresh], index_name=name)
+    fresh = [(url, emb, meta) for url, emb, meta in fresh if meta["content_hash"] not in stored]
+    # Insert before deleting so a changed page always has at least one version searchable
+    if fresh and not insert_embeddings([emb for _, emb, _ in fresh], [meta for _, _, meta in fresh], index_name=name):
+        return stats
+    for url, _, _ in fresh:
+        stats["rows_replaced" if url in known else "rows_added"] += 1
+    stats["rows_deleted"] = delete_chunks(delete_hashes, delete_sections, index_name=name)
+    if stats["rows_deleted"] < len(delete_hashes):
+        # Keep remembering the old chunks so the next sync retries their deletion
+        new_versions = {url: {**known.get(url, {}), **chunks} for url, chunks in new_versions.items()}
+    for url, chunks in new_versions.items():
+        set_url_chunks(name, url, chunks)
+    return stats
+
+
+def tune_indexes(force: bool = False) -> List[str]:
+    """
+    Retune every registered index for its current size (see tune_ann_index). A rebuild takes
+    its collection offline, so this is an admin or scheduled off-hours action, never run by a crawl.
+    Returns the names of the indexes that were rebuilt.
+    """
+    return [name for name in list_indexes() if get_vector_index(name).tune(force=force)]
@@ -0,0 +1,232 @@
+import json
+import os
+import shutil
+import threading
+import numpy as np
+from typing import Dict, Iterator, List, Optional, Set
+from rag.vector_index import VectorIndex
+
+NUMPY_INDEX_DIR = "vector_index"
+# "float16" halves memory and disk use at a small cost in score precision
+NUMPY_INDEX_DTYPE = "float32"
+# Rows scored per matrix-vector product, bounding the float32 working set for float16 storage
+NUMPY_SEARCH_BLOCK = 65536
+SCAN_BATCH_SIZE = 2000
+
+
+class NumpyVectorIndex(VectorIndex):
+    """
+    In-process vector index: a memory-mapped matrix searched exactly with NumPy.
+    Each generation directory holds append-only files (vectors, squared norms, a JSON-lines
+    row log and a deleted-row log). The row log is written last, so a torn append is truncated
+    away on the next open. compact() writes a new generation without deleted rows and switches
+    to it by atomically replacing the CURRENT file.
+    """
+
+    def __init__(self, name: str, dim: int, directory: str = NUMPY_INDEX_DIR, dtype: str = NUMPY_INDEX_DTYPE):
+        self.name = name
+        self.path = os.path.join(directory, name)
+        self._lock = threading.RLock()
+        os.makedirs(self.path, exist_ok=True)
+        current = os.path.join(self.path, "CURRENT")
+        if os.path.exists(current):
+            with open(current, encoding="utf-8") as f:
+                self._generation = f.read().strip()
+        else:
+            self._generation = "gen-0"
+        settings_path = os.path.join(self.path, "settings.json")
+        if os.path.exists(settings_path):
+            with open(settings_path, encoding="utf-8") as f:
+                settings = json.load(f)
+        else:
+            # The storage format is fixed when the index is created
+            settings = {"dim": dim, "dtype": dtype}
+            with open(settings_path, "w", encoding="utf-8") as f:
+                json.dump(settings, f)
+        self.dim = settings["dim"]
+        self.dtype = np.dtype(settings["dtype"])
+        self._load()
+
+    def _file(self, kind: str, generation: Optional[str] = None) -> str:
+        return os.path.join(self.path, generation or self._generation, kind)
+
+    def _load(self):
+        os.makedirs(os.path.join(self.path, self._generation), exist_ok=True)
+        rows = []
+        offsets = [0]  # byte offset of the end of each complete line
+        if os.path.exists(self._file("rows.jsonl")):
+            with open(self._file("rows.jsonl"), "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # torn last line
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError:
+                        break
+                    offsets.append(offsets[-1] + len(line))
+        row_bytes = self.dim * self.dtype.itemsize
+        n = len(rows)
+        for kind, size in (("vectors", row_bytes), ("norms", 4)):
+            path = self._file(kind)
+            stored = os.path.getsize(path) // size if os.path.exists(path) else 0
+            n = min(n, stored)
+        # Drop anything past the last complete row so later appends line up
+        for kind, size in (("vectors", row_bytes), ("norms", 4)):
+            with open(self._file(kind), "ab") as f:
+                f.truncate(n * size)
+        with open(self._file("rows.jsonl"), "ab") as f:
+            f.truncate(offsets[n])
+        rows = rows[:n]
+        self._urls = [r[0] for r in rows]
+        self._dates = [r[1] for r in rows]
+        self._sections = [r[2] for r in rows]
+        self._hashes = [r[3] for r in rows]
+        self._section_ids = {}
+        self._url_ids = {}
+        self._section_codes = np.array([self._section_ids.setdefault(s, len(self._section_ids)) for s in self._sections],
+                                       dtype=np.int32)
+        self._url_codes = np.array([self._url_ids.setdefault(u, len(self._url_ids)) for u in self._urls], dtype=np.int32)
+        self._alive = np.ones(n, dtype=bool)
+        if os.path.exists(self._file("deleted")):
+            with open(self._file("deleted"), "ab") as f:
+                f.truncate(os.path.getsize(self._file("deleted")) // 8 * 8)
+            deleted = np.fromfile(self._file("deleted"), dtype=np.int64)
+            self._alive[deleted[deleted < n]] = False
+        self._row_of = {h: i for i, h in enumerate(self._hashes) if self._alive[i]}
+        self._norms = np.fromfile(self._file("norms"), dtype=np.float32, count=n)
+        self._map_vectors()
+
+    def _map_vectors(self):
+        n = len(self._hashes)
+        self._vectors = np.memmap(self._file("vectors"), dtype=self.dtype, mode="r", shape=(n, self.dim)) if n else None
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._row_of)
+
+    def insert(self, embeddings: List[List[float]], rows: List[Dict]):
+        if not rows:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.shape != (len(rows), self.dim):
+            raise ValueError(f"embeddings have shape {vectors.shape}, index '{self.name}' expects ({len(rows)}, {self.dim})")
+        stored = vectors.astype(self.dtype)
+        norms = (stored.astype(np.float32) ** 2).sum(axis=1).astype(np.float32)
+        records = [[r["url"], r["date"], r.get("section") or "", r["content_hash"]] for r in rows]
+        with self._lock:
+            with open(self._file("vectors"), "ab") as f:
+                f.write(stored.tobytes())
+            with open(self._file("norms"), "ab") as f:
+                f.write(norms.tobytes())
+            with open(self._file("rows.jsonl"), "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(r) + "\n" for r in records))
+            start = len(self._hashes)
+            replaced = [self._row_of[r[3]] for r in records if r[3] in self._row_of]
+            for url, date, section, chunk_hash in records:
+                self._urls.append(url)
+                self._dates.append(date)
+                self._sections.append(section)
+                self._hashes.append(chunk_hash)
+            self._section_codes = np.concatenate([self._section_codes, np.array(
+                [self._section_ids.setdefault(r[2], len(self._section_ids)) for r in records], dtype=np.int32)])
+            self._url_codes = np.concatenate([self._url_codes, np.array(
+                [self._url_ids.setdefault(r[0], len(self._url_ids)) for r in records], dtype=np.int32)])
+            self._alive = np.concatenate([self._alive, np.ones(len(records), dtype=bool)])
+            self._norms = np.concatenate([self._norms, norms])
+            for i, r in enumerate(records):
+                self._row_of[r[3]] = start + i
+            self._map_vectors()
+            if replaced:
+                # Re-inserting a hash supersedes its old row
+                self._mark_deleted(replaced)
+
+    def _mark_deleted(self, row_ids: List[int]):
+        # Called with the lock held
+        with open(self._file("deleted"), "ab") as f:
+            f.write(np.asarray(row_ids, dtype=np.int64).tobytes())
+        self._alive[row_ids] = False
+
+    def search(self, query_embedding: List[float], top_k: int, filters: Optional[Dict[str, str]] = None) -> List[Dict]:
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if query.shape != (self.dim,):
+            raise ValueError(f"query has dimension {query.shape}, index '{self.name}' expects {self.dim}")
+        with self._lock:
+            # Snapshot under the lock; scoring runs outside it
+            vectors, norms, mask = self._vectors, self._norms, self._alive.copy()
+            for field, ids, codes in (("section", self._section_ids, self._section_codes),
+                                      ("url", self._url_ids, self._url_codes)):
+                if filters and filters.get(field) is not None:
+                    code = ids.get(filters[field])
+                    mask &= (codes == code) if code is not None else False
+            urls, dates, sections, hashes = self._urls, self._dates, self._sections, self._hashes
+        if vectors is None or not mask.any():
+            return []
+        candidates = None if mask.all() else np.flatnonzero(mask)
+        total = len(mask) if candidates is None else len(candidates)
+        distances = np.empty(total, dtype=np.float32)
+        for start in range(0, total, NUMPY_SEARCH_BLOCK):
+            end = min(start + NUMPY_SEARCH_BLOCK, total)
+            block = vectors[start:end] if candidates is None else vectors[candidates[start:end]]
+            block_norms = norms[start:end] if candidates is None else norms[candidates[start:end]]
+            distances[start:end] = block_norms - 2 * (np.asarray(block, dtype=np.float32) @ query)
+        distances += float(query @ query)
+        k = min(top_k, total)
+        best = np.argpartition(distances, k - 1)[:k]
+        best = best[np.argsort(distances[best])]
+        rows = best if candidates is None else candidates[best]
+        embeddings = np.asarray(vectors[rows], dtype=np.float32)
+        return [{"url": urls[i], "date": dates[i], "section": sections[i], "content_hash": hashes[i],
+                 "score": float(max(0.0, d)), "embedding": embedding.tolist()}
+                for i, d, embedding in zip(rows, distances[best], embeddings)]
+
+    def existing(self, hashes: List[str]) -> Set[str]:
+        with self._lock:
+            return {h for h in hashes if h in self._row_of}
+
+    def embeddings(self, hashes: List[str]) -> Dict[str, List[float]]:
+        with self._lock:
+            rows = {h: self._row_of[h] for h in hashes if h in self._row_of}
+            vectors = self._vectors
+        return {h: np.asarray(vectors[i], dtype=np.float32).tolist() for h, i in rows.items()}
+
+    def delete(self, hashes: List[str]):
+        with self._lock:
+            row_ids = [self._row_of.pop(h) for h in hashes if h in self._row_of]
+            if row_ids:
+                self._mark_deleted(row_ids)
+
+    def scan(self, fields: List[str]) -> Iterator[List[Dict]]:
+        with self._lock:
+            columns = {"url": self._urls, "date": self._dates, "section": self._sections, "content_hash": self._hashes}
+            alive = np.flatnonzero(self._alive)
+            rows = [{field: columns[field][i] for field in fields} for i in alive]
+        for start in range(0, len(rows), SCAN_BATCH_SIZE):
+            yield rows[start:start + SCAN_BATCH_SIZE]
+
+    def compact(self):
+        """
+        Rewrite the index without deleted rows into a new generation and switch to it.
+        """
+        with self._lock:
+            alive = np.flatnonzero(self._alive)
+            if len(alive) == len(self._alive):
+                return
+            old = self._generation
+            new = f"gen-{int(old.split('-')[1]) + 1}"
+            os.makedirs(os.path.join(self.path, new), exist_ok=True)
+            for start in range(0, len(alive), NUMPY_SEARCH_BLOCK):
+                rows = alive[start:start + NUMPY_SEARCH_BLOCK]
+                with open(self._file("vectors", new), "ab") as f:
+                    f.write(np.ascontiguousarray(self._vectors[rows]).tobytes())
+            with open(self._file("norms", new), "wb") as f:
+                f.write(self._norms[alive].tobytes())
+            with open(self._file("rows.jsonl", new), "w", encoding="utf-8") as f:
+                f.write("".join(json.dumps([self._urls[i], self._dates[i], self._sections[i], self._hashes[i]]) + "\n"
+                                for i in alive))
+            tmp = os.path.join(self.path, "CURRENT.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(new)
+            os.replace(tmp, os.path.join(self.path, "CURRENT"))
+            self._generation = new
+            self._load()
+            shutil.rmtree(os.path.join(self.path, old), ignore_errors=True)
@@ -0,0 +1,154 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict
+from rag import metrics
+
+PRIORITY_INTERACTIVE = "interactive"  # resident chat queries
+PRIORITY_INGEST = "ingest"  # crawling, embedding and image descriptions
+
+# Maximum concurrent Ollama calls per priority class, and overall
+BROKER_CLASS_LIMITS = {PRIORITY_INTERACTIVE: 2, PRIORITY_INGEST: 2}
+BROKER_TOTAL_LIMIT = 3
+# Seconds a single HTTP call to Ollama may take
+BROKER_CALL_TIMEOUTS = {PRIORITY_INTERACTIVE: 120, PRIORITY_INGEST: 300}
+# Seconds a call may wait for a free slot before giving up
+BROKER_QUEUE_TIMEOUTS = {PRIORITY_INTERACTIVE: 60, PRIORITY_INGEST: 900}
+# Consecutive failures that open the circuit, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_COOLDOWN = 30
+
+
+class OllamaUnavailable(Exception):
+    """
+    Raised when the broker refuses a call: the circuit is open or no slot freed up in time.
+    """
+
+
+class OllamaBroker:
+    """
+    Admission control for Ollama calls. Interactive calls are admitted before queued
+    ingest calls, each class has its own concurrency bound, and a circuit breaker fails
+    calls fast after repeated errors instead of letting every caller hang.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._inflight = {p: 0 for p in BROKER_CLASS_LIMITS}
+        self._waiting = {p: 0 for p in BROKER_CLASS_LIMITS}
+        self._failures = 0
+        self._open_until = 0.0
+
+    def _can_start(self, priority: str) -> bool:
+        if self._inflight[priority] >= BROKER_CLASS_LIMITS[priority]:
+            return False
+        if sum(self._inflight.values()) >= BROKER_TOTAL_LIMIT:
+            return False
+        # Ingest yields to any waiting interactive call
+        if priority == PRIORITY_INGEST and self._waiting[PRIORITY_INTERACTIVE]:
+            return False
+        return True
+
+    def _check_circuit(self):
+        if time.monotonic() < self._open_until:
+            raise OllamaUnavailable("circuit open: Ollama failed repeatedly, retrying later")
+
+    def acquire(self, priority: str):
+        """
+        Block until a slot for the priority class is free. Raises OllamaUnavailable
+        if the circuit is open or the queue timeout expires.
+        """
+        start = time.monotonic()
+        with self._cond:
+            self._check_circuit()
+            self._waiting[priority] += 1
+            try:
+                admitted = self._cond.wait_for(lambda: self._can_start(priority), timeout=BROKER_QUEUE_TIMEOUTS[priority])
+            finally:
+                self._waiting[priority] -= 1
+                # A slot this caller did not take may suit a waiter of the other class
+                self._cond.notify_all()
+            if not admitted:
+                raise OllamaUnavailable(f"no {priority} slot free after {BROKER_QUEUE_TIMEOUTS[priority]}s")
+            self._check_circuit()
+            self._inflight[priority] += 1
+        metrics.record(f"ollama_queue_wait_{priority}", time.monotonic() - start)
+
+    def release(self, priority: str, failed: bool = False):
+        with self._cond:
+            self._inflight[priority] -= 1
+            if failed:
+                self._failures += 1
+                if self._failures >= BREAKER_FAILURE_THRESHOLD:
+                    self._open_until = time.monotonic() + BREAKER_COOLDOWN
+                    print(f"[Broker] Circuit opened for {BREAKER_COOLDOWN}s after {self._failures} consecutive Ollama failures.")
+            else:
+                self._failures = 0
+                self._open_until = 0.0
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: str):
+        """
+        Hold a slot for one Ollama call; yields the per-call timeout in seconds.
+        Exceptions raised inside the block count as failures for the circuit breaker.
+        """
+        self.acquire(priority)
+        failed = False
+        try:
+            yield BROKER_CALL_TIMEOUTS[priority]
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.release(priority, failed)
+
+    @asynccontextmanager
+    async def aslot(self, priority: str):
+        """
+        Async version of slot(); waits for admission on a worker thread.
+        """
+        future = asyncio.get_running_loop().run_in_executor(None, self.acquire, priority)
+        try:
+            await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # Give back the slot if admission completes after cancellation
+            future.add_done_callback(lambda f: f.exception() is None and self.release(priority))
+            raise
+        failed = False
+        try:
+            yield BROKER_CALL_TIMEOUTS[priority]
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.release(priority, failed)
+
+    def stats(self) -> Dict:
+        """
+        Return queue depth, in-flight count and mean queue wait per class, plus breaker state.
+        """
+        with self._cond:
+            inflight = dict(self._inflight)
+            waiting = dict(self._waiting)
+            circuit_open = time.monotonic() < self._open_until
+            failures = self._failures
+        classes = {}
+        for priority in BROKER_CLASS_LIMITS:
+            wait = metrics.summary(f"ollama_queue_wait_{priority}")
+            classes[priority] = {
+                "queued": waiting[priority],
+                "inflight": inflight[priority],
+                "limit": BROKER_CLASS_LIMITS[priority],
+                "mean_wait": wait["mean"],
+                "recent_calls": wait["count"],
+            }
+        return {"classes": classes, "circuit_open": circuit_open, "consecutive_failures": failures}
+
+
+_broker = OllamaBroker()
+
+
+def get_broker() -> OllamaBroker:
+    return _broker
@@ -1,37 +1,301 @@
 import requests
-from typing import List
+from requests.adapters import HTTPAdapter
+import aiohttp
+import asyncio
+import json
+import threading
+import time
+from typing import Iterator, List, Optional
+from rag.embedding_cache import get_embedding_cache
+from rag import metrics
+from rag.ollama_broker import get_broker, PRIORITY_INTERACTIVE
 
 OLLAMA_BASE_URL = "http://localhost:11434"
 EMBED_MODEL = "nomic-embed-text"
 LLM_MODEL = "gemma:3n"
 
+# Number of texts sent per /api/embed request
+EMBED_BATCH_SIZE = 32
+# Keep-alive connections kept open to Ollama
+HTTP_POOL_SIZE = 10
+# Serve repeated texts from the on-disk embedding cache
+EMBED_CACHE_ENABLED = True
+# Maximum concurrent requests from the async client (per event loop)
+ASYNC_MAX_INFLIGHT = 4
+# How long Ollama keeps a model loaded after a request. Its default (5m) unloads the models
+# between quiet-hour queries, and reloading costs seconds; -1 keeps them loaded indefinitely.
+OLLAMA_KEEP_ALIVE = "24h"
 
-def generate_embedding(text: str) -> List[float]:
+_session = None
+_session_lock = threading.Lock()
+# aiohttp sessions are bound to the event loop that created them
+_async_state = {"loop": None, "session": None, "semaphore": None}
+
+
+def get_session() -> requests.Session:
+    """
+    Return the shared keep-alive HTTP session used for all Ollama calls.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def generate_embedding(text: str, priority: str = PRIORITY_INTERACTIVE) -> List[float]:
     """
     Generate an embedding for the given text using Ollama's embedding model.
     """
+    if EMBED_CACHE_ENABLED:
+        cached = get_embedding_cache().get_many(EMBED_MODEL, [text])[0]
+        if cached is not None:
+            return cached
     url = f"{OLLAMA_BASE_URL}/api/embeddings"
-    payload = {"model": EMBED_MODEL, "prompt": text}
+    payload = {"model": EMBED_MODEL, "prompt": text, "keep_alive": OLLAMA_KEEP_ALIVE}
     try:
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
-        return response.json()["embedding"]
+        with metrics.span("ollama_request_seconds", endpoint="embeddings"), get_broker().slot(priority) as timeout:
+            response = get_session().post(url, json=payload, timeout=timeout)
+            response.raise_for_status()
+            embedding = response.json()["embedding"]
     except Exception as e:
         print(f"[Ollama] Embedding error: {e}")
         return []
+    if EMBED_CACHE_ENABLED:
+        get_embedding_cache().put_many(EMBED_MODEL, [text], [embedding])
+    return embedding
+
+
+def generate_embeddings(texts: List[str], batch_size: int = EMBED_BATCH_SIZE, priority: str = PRIORITY_INTERACTIVE) -> List[List[float]]:
+    """
+    Generate embeddings for many texts using Ollama's multi-input /api/embed endpoint.
+    Returns one embedding per input text, in order; failed batches yield empty lists.
+    Texts already in the embedding cache are not sent to Ollama.
+    """
+    if not EMBED_CACHE_ENABLED:
+        return _embed_batches(texts, batch_size, priority)
+    cache = get_embedding_cache()
+    results = cache.get_many(EMBED_MODEL, texts)
+    missing = [i for i, r in enumerate(results) if r is None]
+    if missing:
+        missing_texts = [texts[i] for i in missing]
+        fresh = _embed_batches(missing_texts, batch_size, priority)
+        cache.put_many(EMBED_MODEL, missing_texts, fresh)
+        for i, emb in zip(missing, fresh):
+            results[i] = emb
+    return results
+
+
+def _embed_batches(texts: List[str], batch_size: int, priority: str) -> List[List[float]]:
+    url = f"{OLLAMA_BASE_URL}/api/embed"
+    embeddings = []
+    for i in range(0, len(texts), batch_size):
+        batch = texts[i:i + batch_size]
+        payload = {"model": EMBED_MODEL, "input": batch, "keep_alive": OLLAMA_KEEP_ALIVE}
+        try:
+            with metrics.span("ollama_request_seconds", endpoint="embed"), get_broker().slot(priority) as timeout:
+                response = get_session().post(url, json=payload, timeout=timeout)
+                response.raise_for_status()
+                batch_embeddings = response.json()["embeddings"]
+            if len(batch_embeddings) != len(batch):
+                raise ValueError(f"expected {len(batch)} embeddings, got {len(batch_embeddings)}")
+            embeddings.extend(batch_embeddings)
+        except Exception as e:
+            print(f"[Ollama] Batch embedding error: {e}")
+            embeddings.extend([] for _ in batch)
+    return embeddings
+
+
+def _record_prompt_stats(data: dict):
+    # Ollama reports how many prompt and generated tokens it evaluated and how long each took (in ns)
+    if data.get("prompt_eval_count"):
+        metrics.record("llm_prompt_tokens", data["prompt_eval_count"])
+    if data.get("prompt_eval_duration"):
+        metrics.record("llm_prompt_eval_seconds", data["prompt_eval_duration"] / 1e9)
+    if data.get("eval_count"):
+        metrics.record("llm_eval_tokens", data["eval_count"])
+    if data.get("eval_duration"):
+        metrics.record("llm_eval_seconds", data["eval_duration"] / 1e9)
 
 
-def run_gemma3n(prompt: str) -> str:
+def _generate_payload(prompt: str, stream: bool, system: Optional[str] = None, options: Optional[dict] = None,
+                      format: Optional[str] = None) -> dict:
+    payload = {"model": LLM_MODEL, "prompt": prompt, "stream": stream, "keep_alive": OLLAMA_KEEP_ALIVE}
+    if system:
+        payload["system"] = system
+    if options:
+        payload["options"] = options
+    if format:
+        payload["format"] = format
+    return payload
+
+
+def run_gemma3n(prompt: str, priority: str = PRIORITY_INTERACTIVE, options: Optional[dict] = None,
+                format: Optional[str] = None, system: Optional[str] = None) -> str:
     """
     Run a prompt through Gemma 3n via Ollama and return the response.
+    options are passed through as Ollama model options (e.g. temperature);
+    format="json" constrains the output to a JSON value. system is sent as the system prompt,
+    which comes first in the model's input: keeping it identical across calls lets Ollama reuse
+    the already evaluated prefix.
+    Prompt size and evaluation time are recorded as the 'llm_prompt_tokens' and 'llm_prompt_eval_seconds' metrics,
+    generated tokens and generation time as 'llm_eval_tokens' and 'llm_eval_seconds'.
     """
     url = f"{OLLAMA_BASE_URL}/api/generate"
-    payload = {"model": LLM_MODEL, "prompt": prompt}
+    payload = _generate_payload(prompt, False, system, options, format)
     try:
-        response = requests.post(url, json=payload, stream=False)
-        response.raise_for_status()
-        data = response.json()
+        with metrics.span("ollama_request_seconds", endpoint="generate"), get_broker().slot(priority) as timeout:
+            response = get_session().post(url, json=payload, timeout=timeout)
+            response.raise_for_status()
+            data = response.json()
+        _record_prompt_stats(data)
         return data.get("response", "")
     except Exception as e:
         print(f"[Ollama] LLM error: {e}")
-        return "[Error: LLM unavailable]" 
\ No newline at end of file
+        return "[Error: LLM unavailable]"
+
+
+def run_gemma3n_stream(prompt: str, priority: str = PRIORITY_INTERACTIVE, system: Optional[str] = None) -> Iterator[str]:
+    """
+    Run a prompt through Gemma 3n via Ollama and yield response tokens as they are generated.
+    Time to first token is recorded as the 'llm_time_to_first_token' metric, prompt size and
+    evaluation time as 'llm_prompt_tokens' and 'llm_prompt_eval_seconds' (and likewise 'llm_eval_*' for
+    the generated tokens). A failure yields a final "[Error: ...]" token, also after partial output,
+    so callers can tell a truncated answer from a complete one.
+    """
+    url = f"{OLLAMA_BASE_URL}/api/generate"
+    payload = _generate_payload(prompt, True, system)
+    start = time.perf_counter()
+    first_token = True
+    try:
+        with metrics.span("ollama_request_seconds", endpoint="generate_stream"), get_broker().slot(priority) as timeout, \
+                get_session().post(url, json=payload, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                token = data.get("response", "")
+                if token:
+                    if first_token:
+                        metrics.record("llm_time_to_first_token", time.perf_counter() - start)
+                        first_token = False
+                    yield token
+                if data.get("done"):
+                    _record_prompt_stats(data)
+                    break
+    except Exception as e:
+        print(f"[Ollama] LLM stream error: {e}")
+        yield "[Error: LLM unavailable]" if first_token else "[Error: LLM stream interrupted]"
+
+
+# --- Async client (used by the crawler so Ollama calls do not block the event loop) ---
+
+def _get_async_state():
+    loop = asyncio.get_running_loop()
+    if _async_state["loop"] is not loop or _async_state["session"].closed:
+        connector = aiohttp.TCPConnector(limit=HTTP_POOL_SIZE)
+        _async_state["loop"] = loop
+        _async_state["session"] = aiohttp.ClientSession(connector=connector)
+        _async_state["semaphore"] = asyncio.Semaphore(ASYNC_MAX_INFLIGHT)
+    return _async_state["session"], _async_state["semaphore"]
+
+
+async def close_async_session():
+    """
+    Close the shared aiohttp session for the running event loop, if any.
+    """
+    session = _async_state["session"]
+    if session is not None and _async_state["loop"] is asyncio.get_running_loop():
+        await session.close()
+    _async_state.update(loop=None, session=None, semaphore=None)
+
+
+async def _apost_json(path: str, payload: dict, priority: str) -> dict:
+    session, semaphore = _get_async_state()
+    with metrics.span("ollama_request_seconds", endpoint=path.rsplit("/", 1)[-1]):
+        async with semaphore, get_broker().aslot(priority) as timeout:
+            client_timeout = aiohttp.ClientTimeout(total=timeout)
+            async with session.post(f"{OLLAMA_BASE_URL}{path}", json=payload, timeout=client_timeout) as response:
+                response.raise_for_status()
+                return await response.json()
+
+
+async def agenerate_embeddings(texts: List[str], batch_size: int = EMBED_BATCH_SIZE, priority: str = PRIORITY_INTERACTIVE) -> List[List[float]]:
+    """
+    Async version of generate_embeddings. Batches are sent concurrently, bounded by ASYNC_MAX_INFLIGHT.
+    """
+    cache = get_embedding_cache() if EMBED_CACHE_ENABLED else None
+    results = cache.get_many(EMBED_MODEL, texts) if cache else [None] * len(texts)
+    missing = [i for i, r in enumerate(results) if r is None]
+
+    async def embed_batch(batch):
+        try:
+            data = await _apost_json("/api/embed", {"model": EMBED_MODEL, "input": batch, "keep_alive": OLLAMA_KEEP_ALIVE},
+                                     priority)
+            batch_embeddings = data["embeddings"]
+            if len(batch_embeddings) != len(batch):
+                raise ValueError(f"expected {len(batch)} embeddings, got {len(batch_embeddings)}")
+            return batch_embeddings
+        except Exception as e:
+            print(f"[Ollama] Async batch embedding error: {e}")
+            return [[] for _ in batch]
+
+    missing_texts = [texts[i] for i in missing]
+    batches = [missing_texts[i:i + batch_size] for i in range(0, len(missing_texts), batch_size)]
+    fresh = [emb for batch in await asyncio.gather(*(embed_batch(b) for b in batches)) for emb in batch]
+    if cache and missing_texts:
+        cache.put_many(EMBED_MODEL, missing_texts, fresh)
+    for i, emb in zip(missing, fresh):
+        results[i] = emb
+    return results
+
+
+async def agenerate_embedding(text: str, priority: str = PRIORITY_INTERACTIVE) -> List[float]:
+    """
+    Async version of generate_embedding.
+    """
+    return (await agenerate_embeddings([text], priority=priority))[0]
+
+
+async def arun_gemma3n(prompt: str, priority: str = PRIORITY_INTERACTIVE, system: Optional[str] = None,
+                       options: Optional[dict] = None) -> str:
+    """
+    Async version of run_gemma3n.
+    """
+    try:
+        data = await _apost_json("/api/generate", _generate_payload(prompt, False, system, options), priority)
+        _record_prompt_stats(data)
+        return data.get("response", "")
+    except Exception as e:
+        print(f"[Ollama] Async LLM error: {e}")
+        return "[Error: LLM unavailable]"
+
+
+def warm_up_models(system_prompts: Optional[List[str]] = None) -> bool:
+    """
+    Load LLM_MODEL and EMBED_MODEL into Ollama (kept for OLLAMA_KEEP_ALIVE) so the first query
+    does not pay for loading them. Each of system_prompts is evaluated once with a one-token
+    reply, leaving its prefix ready for reuse. Returns True if both models answered.
+    """
+    ok = True
+    try:
+        with get_broker().slot(PRIORITY_INTERACTIVE) as timeout:
+            # A generate request without a prompt only loads the model
+            get_session().post(f"{OLLAMA_BASE_URL}/api/generate", json=_generate_payload("", False),
+                               timeout=timeout).raise_for_status()
+            get_session().post(f"{OLLAMA_BASE_URL}/api/embed",
+                               json={"model": EMBED_MODEL, "input": ["warm-up"], "keep_alive": OLLAMA_KEEP_ALIVE},
+                               timeout=timeout).raise_for_status()
+    except Exception as e:
+        print(f"[Ollama] Warm-up error: {e}")
+        ok = False
+    for system in system_prompts or []:
+        if run_gemma3n("Reply with OK.", system=system, options={"num_predict": 1}).startswith("[Error"):
+            ok = False
+    return ok
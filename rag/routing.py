@@ -0,0 +1,175 @@
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from rag.index_state import get_state_db, list_sections, state_lock
+from rag.ollama_utils import generate_embeddings
+
+# "embedding": route by cosine similarity, asking Gemma only when the choice is ambiguous
+# "llm": always ask Gemma
+ROUTING_MODE = "embedding"
+# Minimum gap between the best and second-best cosine similarity to trust the embedding route
+ROUTING_MIN_MARGIN = 0.03
+
+# In-memory routing matrices, rebuilt from SQLite after any change
+_index_matrix = None  # (names, matrix)
+_section_matrices = {}  # index_name -> (sections, matrix)
+
+
+def _ensure_tables(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS index_embeddings ("
+        "index_name TEXT PRIMARY KEY, description TEXT NOT NULL, vector BLOB NOT NULL)"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS section_centroids ("
+        "index_name TEXT NOT NULL, section TEXT NOT NULL, vector_sum BLOB NOT NULL, count INTEGER NOT NULL, "
+        "PRIMARY KEY (index_name, section))"
+    )
+
+
+def _normalized_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def ensure_index_embeddings(indexes: Dict[str, Dict]):
+    """
+    Embed each index description that is new or has changed since it was last embedded.
+    """
+    global _index_matrix
+    with state_lock():
+        conn = get_state_db()
+        _ensure_tables(conn)
+        stored = dict(conn.execute("SELECT index_name, description FROM index_embeddings"))
+    stale = [name for name, meta in indexes.items() if stored.get(name) != meta['description']]
+    if not stale:
+        return
+    embeddings = generate_embeddings([f"{name}: {indexes[name]['description']}" for name in stale])
+    with state_lock():
+        conn = get_state_db()
+        conn.executemany(
+            "INSERT OR REPLACE INTO index_embeddings VALUES (?, ?, ?)",
+            [(name, indexes[name]['description'], np.asarray(emb, dtype=np.float32).tobytes())
+             for name, emb in zip(stale, embeddings) if emb],
+        )
+        conn.commit()
+        _index_matrix = None
+
+
+def update_section_centroids(index_name: str, embeddings: List[List[float]], sections: List[Optional[str]],
+                             delta: int = 1):
+    """
+    Fold chunk embeddings into (delta=1, after insert) or out of (delta=-1, after delete) the
+    running centroid of their section. A section left with no chunks loses its centroid.
+    """
+    sums = {}
+    counts = {}
+    for emb, section in zip(embeddings, sections):
+        if not section:
+            continue
+        vec = np.asarray(emb, dtype=np.float32)
+        sums[section] = sums.get(section, 0) + vec
+        counts[section] = counts.get(section, 0) + 1
+    if not sums:
+        return
+    with state_lock():
+        conn = get_state_db()
+        _ensure_tables(conn)
+        for section, vec_sum in sums.items():
+            row = conn.execute(
+                "SELECT vector_sum, count FROM section_centroids WHERE index_name = ? AND section = ?",
+                (index_name, section),
+            ).fetchone()
+            count = delta * counts[section]
+            vec_sum = delta * vec_sum
+            if row and len(row[0]) == vec_sum.nbytes:
+                vec_sum = vec_sum + np.frombuffer(row[0], dtype=np.float32)
+                count += row[1]
+            if count <= 0:
+                conn.execute("DELETE FROM section_centroids WHERE index_name = ? AND section = ?", (index_name, section))
+                continue
+            conn.execute(
+                "INSERT OR REPLACE INTO section_centroids VALUES (?, ?, ?, ?)",
+                (index_name, section, vec_sum.astype(np.float32).tobytes(), count),
+            )
+        conn.commit()
+        _section_matrices.pop(index_name, None)
+
+
+def _load_index_matrix():
+    global _index_matrix
+    with state_lock():
+        if _index_matrix is None:
+            conn = get_state_db()
+            _ensure_tables(conn)
+            rows = conn.execute("SELECT index_name, vector FROM index_embeddings").fetchall()
+            names = [r[0] for r in rows]
+            matrix = np.array([np.frombuffer(r[1], dtype=np.float32) for r in rows]) if rows else None
+            _index_matrix = (names, _normalized_rows(matrix) if matrix is not None else None)
+        return _index_matrix
+
+
+def _load_section_matrix(index_name: str):
+    with state_lock():
+        if index_name not in _section_matrices:
+            conn = get_state_db()
+            _ensure_tables(conn)
+            rows = conn.execute(
+                "SELECT section, vector_sum FROM section_centroids WHERE index_name = ?", (index_name,)
+            ).fetchall()
+            sections = [r[0] for r in rows]
+            matrix = np.array([np.frombuffer(r[1], dtype=np.float32) for r in rows]) if rows else None
+            _section_matrices[index_name] = (sections, _normalized_rows(matrix) if matrix is not None else None)
+        return _section_matrices[index_name]
+
+
+def _best_match(labels: List[str], matrix: Optional[np.ndarray], query_embedding: List[float],
+                allowed: Optional[List[str]] = None) -> Tuple[Optional[str], float]:
+    if matrix is None or not query_embedding:
+        return None, 0.0
+    query = np.asarray(query_embedding, dtype=np.float32)
+    if query.shape[0] != matrix.shape[1] or not np.linalg.norm(query):
+        return None, 0.0
+    sims = matrix @ (query / np.linalg.norm(query))
+    if allowed is not None:
+        allowed = set(allowed)
+        sims[[label not in allowed for label in labels]] = -np.inf
+    order = np.argsort(sims)[::-1]
+    best = order[0]
+    if not np.isfinite(sims[best]):
+        return None, 0.0
+    # With a single candidate there is nothing to be ambiguous about
+    if len(order) < 2 or not np.isfinite(sims[order[1]]):
+        return labels[best], 1.0
+    return labels[best], float(sims[best] - sims[order[1]])
+
+
+def route_index(query_embedding: List[float], index_names: List[str]) -> Tuple[Optional[str], float]:
+    """
+    Return (best index, margin over the runner-up) among index_names by cosine similarity
+    between the query and each index description.
+    """
+    names, matrix = _load_index_matrix()
+    return _best_match(names, matrix, query_embedding, allowed=index_names)
+
+
+def rank_indexes(query_embedding: List[float], index_names: List[str]) -> List[str]:
+    """
+    Order index_names by cosine similarity between the query and each index description, best first.
+    Indexes without a description vector keep their order, after the others.
+    """
+    names, matrix = _load_index_matrix()
+    query = np.asarray(query_embedding or [], dtype=np.float32)
+    if matrix is None or query.shape != (matrix.shape[1],) or not np.linalg.norm(query):
+        return list(index_names)
+    sims = dict(zip(names, matrix @ (query / np.linalg.norm(query))))
+    return sorted(index_names, key=lambda name: -sims.get(name, -np.inf))
+
+
+def route_section(index_name: str, query_embedding: List[float]) -> Tuple[Optional[str], float]:
+    """
+    Return (best section, margin over the runner-up) by cosine similarity between the query
+    and each section's centroid, among the sections the index still holds.
+    """
+    sections, matrix = _load_section_matrix(index_name)
+    return _best_match(sections, matrix, query_embedding, allowed=list_sections(index_name))
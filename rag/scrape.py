@@ -1,22 +1,26 @@
 import asyncio
+import base64
+import hashlib
 import aiohttp
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
 import time
 from datetime import datetime
-from .ollama_utils import generate_embedding, run_gemma3n
-from .milvus_utils import insert_embeddings, register_index, chunk_exists
+from .ollama_utils import agenerate_embeddings, arun_gemma3n, close_async_session
+from .ollama_broker import PRIORITY_INGEST
+from .milvus_utils import sync_documents, register_index, content_hash, list_indexes
+from .routing import ensure_index_embeddings
+from .embedding_cache import get_embedding_cache
+from .llm_cache import DETERMINISTIC_OPTIONS, cache_key, get_llm_cache
+from .contacts import extract_contacts, get_contact_store
 import os
 import requests
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import tempfile
-import re
-from docling.datamodel.base_models import InputFormat
-from docling.datamodel.pipeline_options import PdfPipelineOptions
-from docling.document_converter import PdfFormatOption
-
 try:
-    from docling.document_converter import DocumentConverter
+    from docling.datamodel.base_models import InputFormat
+    from docling.datamodel.pipeline_options import PdfPipelineOptions
+    from docling.document_converter import DocumentConverter, PdfFormatOption
 except ImportError:
     DocumentConverter = None  # Docling must be installed
 
@@ -27,33 +31,9 @@ MAX_DEPTH = 2  # How deep to crawl
 CHUNK_SIZE = 8192  # Number of characters per chunk (was 512)
 SUPPORTED_FILE_EXTS = [".pdf", ".xml", ".docx", ".xlsx", ".csv", ".html", ".htm"]
 LOG_FILE = "search_index.log"
-CONTACTS_FILE = "contacts.txt"
-
-# Utility to extract phone numbers and emails
-PHONE_REGEX = re.compile(r"\b(?:\+?1[-.\s]?)?(?:\(?\d{3}\)?[-.\s]?)?\d{3}[-.\s]?\d{4}\b")
-EMAIL_REGEX = re.compile(r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+")
-
-def extract_contacts(text):
-    phones = set(PHONE_REGEX.findall(text))
-    emails = set(EMAIL_REGEX.findall(text))
-    return phones, emails
-
-def save_contacts(phones, emails):
-    # Append unique contacts to the contacts file
-    existing = set()
-    if os.path.exists(CONTACTS_FILE):
-        with open(CONTACTS_FILE, "r", encoding="utf-8") as f:
-            for line in f:
-                existing.add(line.strip())
-    with open(CONTACTS_FILE, "a", encoding="utf-8") as f:
-        for phone in phones:
-            if phone not in existing:
-                f.write(f"Phone: {phone}\n")
-                existing.add(phone)
-        for email in emails:
-            if email not in existing:
-                f.write(f"Email: {email}\n")
-                existing.add(email)
+# Image descriptions are remembered by image content: an unchanged image is never described
+# again, so the text (and embeddings) of its page stay the same from crawl to crawl
+IMAGE_DESCRIPTION_TTL = 30 * 24 * 3600
 
 
 def log_admin(msg):
@@ -108,6 +88,17 @@ def process_files_with_docling(file_paths):
     return results, errors
 
 
+def section_from_url(url):
+    """
+    Derive the website section from the first path segment of a URL, e.g.
+    https://town.gov/public-works/trash.html -> 'public-works'. Pages at the site root are 'home'.
+    """
+    segments = [s for s in urlparse(url).path.split("/") if s]
+    if not segments or (len(segments) == 1 and "." in segments[0]):
+        return "home"
+    return segments[0].lower()
+
+
 def chunk_text(text, chunk_size=CHUNK_SIZE):
     # Simple chunking by character count
     return [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
@@ -134,61 +125,70 @@ async def fetch_image(session, url):
 
 async def process_image(session, img_url):
     img_bytes = await fetch_image(session, img_url)
-    if img_bytes:
-        import base64
+    if not img_bytes:
+        return None
+    cache = get_llm_cache()
+    key = cache_key(hashlib.sha256(img_bytes).hexdigest(), index_version="image_description")
+    description = cache.get(key, "image_description")
+    if description is None:
         b64 = base64.b64encode(img_bytes).decode()
         prompt = f"Describe the following image or extract any text from it. Image (base64): {b64}"
-        description = run_gemma3n(prompt)
-        return description
-    return None
+        description = await arun_gemma3n(prompt, priority=PRIORITY_INGEST, options=DETERMINISTIC_OPTIONS)
+        if not description or description.startswith("[Error"):
+            return None
+        cache.put(key, "image_description", description, ttl=IMAGE_DESCRIPTION_TTL)
+    return description
 
-async def scrape_page(session, url, base_url, seen_urls, depth, file_queue, log_msgs):
+async def scrape_page(session, url, base_url, seen_urls, depth, file_queue, log_msgs, failed_urls):
     if url in seen_urls or depth > MAX_DEPTH:
         return []
     seen_urls.add(url)
     await asyncio.sleep(REQUEST_DELAY)
     html = await fetch(session, url)
     if not html:
+        failed_urls.add(url)
         return []
     soup = BeautifulSoup(html, "html.parser")
     texts = [t for t in soup.stripped_strings]
     page_text = "\n".join(texts)
-    # --- Extract and save contacts ---
-    phones, emails = extract_contacts(page_text)
-    if phones or emails:
-        save_contacts(phones, emails)
-    image_descriptions = []
-    for img in soup.find_all("img"):
-        src = img.get("src")
-        if src:
-            img_url = urljoin(url, src)
-            desc = await process_image(session, img_url)
-            if desc:
-                image_descriptions.append(desc)
+    # --- Extract and save contacts, with the page and text they were found in ---
+    get_contact_store().add(extract_contacts(page_text, url, section_from_url(url)))
+    img_urls = [urljoin(url, img.get("src")) for img in soup.find_all("img") if img.get("src")]
+    # Describe images and embed in the background so the crawler keeps fetching pages
+    embed_task = asyncio.create_task(embed_page(session, url, page_text, img_urls))
+    # Find internal links and file links
+    links = set()
+    for a in soup.find_all("a", href=True):
+        link = urljoin(url, a["href"])
+        if any(link.lower().endswith(ext) for ext in SUPPORTED_FILE_EXTS):
+            file_queue.append(link)
+            log_msgs.append(f"Queued file for download: {link}")
+        elif link.startswith(base_url):
+            links.add(link)
+    return [(embed_task, links)]
+
+async def embed_page(session, url, page_text, img_urls):
+    """
+    Describe a page's images, chunk the page text and embed the chunks.
+    Returns (url, embeddings, metadatas, complete); complete is False if any chunk failed to embed.
+    """
+    descriptions = await asyncio.gather(*(process_image(session, img_url) for img_url in img_urls))
+    image_descriptions = [d for d in descriptions if d]
     full_text = page_text + ("\n" + "\n".join(image_descriptions) if image_descriptions else "")
     now = datetime.utcnow().isoformat()
     chunks = chunk_text(full_text)
     embeddings = []
     metadatas = []
-    for chunk in chunks:
-        emb = generate_embedding(chunk)
+    for chunk, emb in zip(chunks, await agenerate_embeddings(chunks, priority=PRIORITY_INGEST)):
         if emb:
             embeddings.append(emb)
             metadatas.append({
                 "text": chunk,
                 "url": url,
-                "date": now
+                "date": now,
+                "section": section_from_url(url)
             })
-    # Find internal links and file links
-    links = set()
-    for a in soup.find_all("a", href=True):
-        link = urljoin(url, a["href"])
-        if any(link.lower().endswith(ext) for ext in SUPPORTED_FILE_EXTS):
-            file_queue.append(link)
-            log_msgs.append(f"Queued file for download: {link}")
-        elif link.startswith(base_url):
-            links.add(link)
-    return [(embeddings, metadatas, links)]
+    return url, embeddings, metadatas, len(embeddings) == len(chunks)
 
 async def crawl_and_index_async(start_url, index_name=None):
     """
@@ -203,69 +203,87 @@ async def crawl_and_index_async(start_url, index_name=None):
     all_metadatas = []
     file_queue = []
     log_msgs = []
+    # Pages and files that could not be fetched or embedded this run keep their indexed chunks
+    failed_urls = set()
     file_stats = {"found": 0, "downloaded": 0, "processed": 0, "failed": 0, "skipped": 0, "errors": []}
-    temp_dir = os.path.join(tempfile.gettempdir(), "website_files")
+    # One folder per site, so a site's files can be told apart from other sites' in a shared index
+    temp_dir = os.path.join(tempfile.gettempdir(), "website_files", urlparse(start_url).netloc)
+    # Keep routing vectors for index descriptions current before new chunks arrive
+    ensure_index_embeddings(list_indexes())
+    embed_tasks = []
     async with aiohttp.ClientSession(headers={"User-Agent": "Gemma3nRAGBot/1.0"}) as session:
         while to_crawl:
             batch = to_crawl[:MAX_CONCURRENCY]
             to_crawl = to_crawl[MAX_CONCURRENCY:]
-            tasks = [scrape_page(session, url, base_url, seen_urls, depth, file_queue, log_msgs) for url, depth in batch]
+            tasks = [scrape_page(session, url, base_url, seen_urls, depth, file_queue, log_msgs, failed_urls) for url, depth in batch]
             results = await asyncio.gather(*tasks)
             for (url, depth), result in zip(batch, results):
-                for embeddings, metadatas, links in result:
-                    all_embeddings.extend(embeddings)
-                    all_metadatas.extend(metadatas)
+                for embed_task, links in result:
+                    embed_tasks.append(embed_task)
                     for link in links:
                         if link not in seen_urls:
                             to_crawl.append((link, depth + 1))
+        # Wait for page embeddings still in flight
+        for url, embeddings, metadatas, complete in await asyncio.gather(*embed_tasks):
+            if not complete:
+                failed_urls.add(url)
+                continue
+            all_embeddings.extend(embeddings)
+            all_metadatas.extend(metadatas)
     # Download and process files
     file_stats["found"] = len(file_queue)
     downloaded_files = []
+    file_urls = {}
     for file_url in file_queue:
         file_path, err = download_file(file_url, temp_dir)
         if file_path:
             downloaded_files.append(file_path)
+            file_urls[file_path] = file_url
             file_stats["downloaded"] += 1
             log_msgs.append(f"Downloaded file: {file_url} -> {file_path}")
         else:
             file_stats["failed"] += 1
             file_stats["errors"].append((file_url, err))
+            failed_urls.add(os.path.join(temp_dir, file_url.split('/')[-1]))
             log_msgs.append(f"Failed to download file: {file_url} | Error: {err}")
     # Process files with Docling
     docling_results, docling_errors = process_files_with_docling(downloaded_files)
     for path, text in docling_results:
         chunks = chunk_text(text)
         now = datetime.utcnow().isoformat()
-        for chunk in chunks:
-            emb = generate_embedding(chunk)
-            if emb:
-                all_embeddings.append(emb)
-                all_metadatas.append({
-                    "text": chunk,
-                    "url": path,
-                    "date": now
-                })
+        embeddings = await agenerate_embeddings(chunks, priority=PRIORITY_INGEST)
+        if not all(embeddings):
+            failed_urls.add(path)
+            continue
+        for chunk, emb in zip(chunks, embeddings):
+            all_embeddings.append(emb)
+            all_metadatas.append({
+                "text": chunk,
+                "url": path,
+                "date": now,
+                "section": section_from_url(file_urls.get(path, ""))
+            })
         file_stats["processed"] += 1
         log_msgs.append(f"Processed file: {path}")
     for path, err in docling_errors:
         file_stats["failed"] += 1
         file_stats["errors"].append((path, err))
+        failed_urls.add(path)
         log_msgs.append(f"Failed to process file: {path} | Error: {err}")
-    # Index all embeddings (deduplicated)
-    if all_embeddings:
-        dedup_embeddings = []
-        dedup_metadatas = []
-        for emb, meta in zip(all_embeddings, all_metadatas):
-            if not chunk_exists(meta["url"], meta["text"], meta["date"], index_name=index_name):
-                dedup_embeddings.append(emb)
-                dedup_metadatas.append(meta)
-        if dedup_embeddings:
-            insert_embeddings(dedup_embeddings, dedup_metadatas, index_name=index_name)
-            log_msgs.append(f"Indexed {len(dedup_embeddings)} new (deduplicated) chunks from {len(seen_urls)} pages and {file_stats['processed']} files into index '{index_name or 'rag_documents'}'.")
-        else:
-            log_msgs.append(f"No new (deduplicated) content indexed for index '{index_name or 'rag_documents'}'.")
-    else:
-        log_msgs.append(f"No content indexed for index '{index_name or 'rag_documents'}'.")
+    await close_async_session()
+    # Key chunks on (url, text) only: the crawl date changes every run
+    for meta in all_metadatas:
+        meta["content_hash"] = content_hash(meta["url"], meta["text"])
+    # Replace each page's chunks with this crawl's version and drop pages that have disappeared
+    sync = sync_documents(all_embeddings, all_metadatas, index_name=index_name, retain_urls=failed_urls,
+                          scope=[base_url + "/", os.path.join(temp_dir, "")])
+    log_msgs.append(
+        f"Index '{index_name or 'rag_documents'}': {sync['rows_added']} rows added, {sync['rows_replaced']} replaced, "
+        f"{sync['rows_deleted']} deleted, {sync['urls_unchanged']} pages unchanged "
+        f"({len(failed_urls)} pages or files kept from the previous crawl after failing)."
+    )
+    cache_stats = get_embedding_cache().stats()
+    log_msgs.append(f"Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['entries']} entries.")
     # Write log
     for msg in log_msgs:
         log_admin(msg)
@@ -277,6 +295,9 @@ async def crawl_and_index_async(start_url, index_name=None):
         "files_processed": file_stats["processed"],
         "files_failed": file_stats["failed"],
         "chunks_indexed": len(all_embeddings),
+        "rows_added": sync["rows_added"],
+        "rows_replaced": sync["rows_replaced"],
+        "rows_deleted": sync["rows_deleted"],
         "errors": file_stats["errors"]
     }
 
@@ -293,4 +314,5 @@ def create_and_register_index(index_name, description, domain):
     Create and register a new index (collection) for multi-index RAG.
     """
     register_index(index_name, description, domain)
+    ensure_index_embeddings(list_indexes())
     print(f"[Scraper] Registered new index '{index_name}' with domain '{domain}'.") 
\ No newline at end of file
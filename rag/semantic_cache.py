@@ -0,0 +1,143 @@
+import threading
+import time
+import numpy as np
+from typing import Dict, Iterable, List, Optional
+from rag.index_state import get_index_version
+
+SEMANTIC_CACHE_ENABLED = True
+# Minimum cosine similarity between a new query and a cached one to reuse its answer
+SEMANTIC_CACHE_THRESHOLD = 0.92
+SEMANTIC_CACHE_MAX_ENTRIES = 50000
+# Candidates are first ranked on a leading slice of each embedding (nomic-embed-text is
+# Matryoshka-trained, so its prefixes remain meaningful) and only the top few are rescored in full
+PREFILTER_DIM = 128
+PREFILTER_CANDIDATES = 8
+
+
+class SemanticCache:
+    """
+    Cache of answered queries, matched by cosine similarity of query embeddings.
+    Vectors live in preallocated float32 matrices: lookup is one matrix-vector product over
+    the short prefixes followed by an exact rescoring of the best candidates.
+    An entry is only served while every index it was answered from is at the same version.
+    """
+
+    def __init__(self, max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._vectors = None  # (capacity, dim), rows L2-normalized
+        self._prefixes = None  # (capacity, PREFILTER_DIM), rows L2-normalized
+        self._versions = np.zeros((0, 0), dtype=np.int64)  # (capacity, indexes), -1 where not searched
+        self._entries = []
+        self._index_names = []  # column -> index name
+        self._size = 0
+
+    def _normalize(self, embedding) -> Optional[np.ndarray]:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        if not norm:
+            return None
+        return vec / norm
+
+    def _valid_mask(self) -> np.ndarray:
+        # Called with the lock held; True where none of the entry's indexes has changed since
+        current = np.array([get_index_version(name) for name in self._index_names], dtype=np.int64)
+        versions = self._versions[:self._size]
+        return ((versions < 0) | (versions == current)).all(axis=1)
+
+    def lookup(self, embedding: List[float], threshold: float = SEMANTIC_CACHE_THRESHOLD) -> Optional[Dict]:
+        """
+        Return the cached entry closest to the query embedding if it clears the threshold.
+        """
+        query = self._normalize(embedding)
+        prefix = self._normalize(query[:PREFILTER_DIM]) if query is not None else None
+        with self._lock:
+            if prefix is None or not self._size or query.shape[0] != self._vectors.shape[1]:
+                self.misses += 1
+                return None
+            coarse = self._prefixes[:self._size] @ prefix
+            coarse[~self._valid_mask()] = -np.inf
+            k = min(PREFILTER_CANDIDATES, self._size)
+            candidates = np.argpartition(coarse, -k)[-k:]
+            candidates = candidates[np.isfinite(coarse[candidates])]
+            if len(candidates):
+                sims = self._vectors[candidates] @ query
+                best = int(np.argmax(sims))
+                if sims[best] >= threshold:
+                    self.hits += 1
+                    return dict(self._entries[candidates[best]], similarity=float(sims[best]))
+            self.misses += 1
+            return None
+
+    def add(self, embedding: List[float], query: str, answer: str, citations: List[str], index_names: Iterable[str]):
+        """
+        Cache an answer drawn from the given indexes (all of those searched for it).
+        """
+        index_names = list(dict.fromkeys(index_names))
+        vec = self._normalize(embedding)
+        prefix = self._normalize(vec[:PREFILTER_DIM]) if vec is not None else None
+        if prefix is None:
+            return
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != vec.shape[0]:
+                self._reset(vec.shape[0])
+            if self._size == self.max_entries:
+                self._compact()
+            if self._size == self._vectors.shape[0]:
+                self._grow()
+            new_names = [name for name in index_names if name not in self._index_names]
+            if new_names:
+                self._index_names.extend(new_names)
+                self._versions = np.concatenate(
+                    [self._versions, np.full((self._versions.shape[0], len(new_names)), -1, dtype=np.int64)], axis=1)
+            i = self._size
+            self._vectors[i] = vec
+            self._prefixes[i] = prefix
+            self._versions[i] = -1
+            for name in index_names:
+                self._versions[i, self._index_names.index(name)] = get_index_version(name)
+            self._entries.append({"query": query, "answer": answer, "citations": citations,
+                                  "index_names": index_names, "created": time.time()})
+            self._size += 1
+
+    def _reset(self, dim: int):
+        self._vectors = np.zeros((1024, dim), dtype=np.float32)
+        self._prefixes = np.zeros((1024, min(dim, PREFILTER_DIM)), dtype=np.float32)
+        self._versions = np.full((1024, len(self._index_names)), -1, dtype=np.int64)
+        self._entries = []
+        self._size = 0
+
+    def _grow(self):
+        capacity = min(self.max_entries, self._vectors.shape[0] * 2)
+        extra = capacity - self._vectors.shape[0]
+        self._vectors = np.concatenate([self._vectors, np.zeros((extra, self._vectors.shape[1]), dtype=np.float32)])
+        self._prefixes = np.concatenate([self._prefixes, np.zeros((extra, self._prefixes.shape[1]), dtype=np.float32)])
+        self._versions = np.concatenate([self._versions, np.full((extra, self._versions.shape[1]), -1, dtype=np.int64)])
+
+    def _compact(self):
+        # Drop entries from rebuilt indexes; if that frees nothing, drop the oldest quarter
+        keep = self._valid_mask()
+        if keep.all():
+            keep[:max(1, self._size // 4)] = False
+        kept = np.flatnonzero(keep)
+        n = len(kept)
+        self._vectors[:n] = self._vectors[kept]
+        self._prefixes[:n] = self._prefixes[kept]
+        self._versions[:n] = self._versions[kept]
+        self._entries = [self._entries[i] for i in kept]
+        self._size = n
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "entries": self._size,
+                    "hit_rate": self.hits / total if total else 0.0}
+
+
+_cache = SemanticCache()
+
+
+def get_semantic_cache() -> SemanticCache:
+    return _cache
@@ -0,0 +1,135 @@
+import json
+import re
+from typing import List, Optional
+from langdetect import DetectorFactory, detect
+from rag.llm_cache import cache_key, get_llm_cache
+
+# Translations are stable, so remembered ones outlive the general LLM cache TTL
+TRANSLATION_MEMORY_TTL = 30 * 24 * 3600
+# Texts with no function words from any profile fall back to langdetect from this length on;
+# shorter ones ("dog license fee") are taken as English
+LANGDETECT_MIN_CHARS = 40
+# A query with any English evidence is only taken as another language if that language scores
+# at least this much and beats English by LANGUAGE_MARGIN, so place names ("Las Cruces trash
+# schedule", "El Paso county jobs") do not make an English query Spanish
+LANGUAGE_MIN_SCORE = 2
+LANGUAGE_MARGIN = 1
+
+# Common function words per language. Ties go to the earlier language, so English wins on
+# shared words like "a" and Spanish wins among the Romance languages.
+LANGUAGE_PROFILES = {
+    "en": {"the", "a", "an", "and", "or", "of", "to", "in", "is", "are", "was", "do", "does", "how", "what",
+           "where", "when", "who", "why", "can", "i", "my", "for", "with", "on", "about", "need", "get", "pay"},
+    "es": {"el", "la", "los", "las", "de", "del", "y", "o", "en", "es", "son", "un", "una", "que", "qué", "como",
+           "cómo", "donde", "dónde", "cuando", "cuándo", "quién", "por", "para", "con", "mi", "mis", "puedo",
+           "necesito", "hay", "se", "lo", "al", "a"},
+    "pt": {"o", "os", "a", "as", "do", "da", "dos", "das", "e", "ou", "em", "no", "na", "é", "são", "um", "uma", "que",
+           "como", "onde", "quando", "quem", "por", "para", "com", "meu", "minha", "posso", "preciso", "não"},
+    "fr": {"le", "la", "les", "de", "des", "du", "et", "ou", "est", "sont", "un", "une", "que", "qui", "comment",
+           "où", "quand", "pourquoi", "pour", "avec", "mon", "ma", "mes", "je", "puis", "dois", "sur", "au", "aux"},
+    "it": {"il", "lo", "gli", "di", "della", "e", "è", "sono", "un", "una", "che", "come", "dove", "quando", "chi",
+           "perché", "per", "con", "mio", "mia", "posso", "devo", "non"},
+    "de": {"der", "die", "das", "den", "dem", "und", "oder", "ist", "sind", "ein", "eine", "wie", "wo", "wann",
+           "wer", "warum", "für", "mit", "mein", "meine", "ich", "kann", "muss", "nicht", "zu", "von", "auf"},
+}
+# Everyday words of local government queries, counted for English alongside its function words
+# (none is also a common word in the other profiled languages)
+ENGLISH_CONTENT_WORDS = {
+    "trash", "garbage", "recycling", "pickup", "schedule", "county", "city", "town", "hall", "phone", "number",
+    "job", "jobs", "permit", "permits", "license", "property", "water", "bill", "office", "hours", "meeting",
+    "council", "vote", "election", "road", "street", "clerk", "form", "apply", "fee", "fees", "open", "closed",
+    "today", "tomorrow", "school", "library", "park", "fire", "building", "zoning", "dog", "senior", "help",
+    "contact", "emergency", "payment", "renew", "near", "application", "sewer", "snow", "tax",
+}
+# Letters that, among the profiled languages, point to one (ç is also French, whose function words outweigh it)
+LANGUAGE_MARKERS = {"es": "ñ¿¡", "pt": "ãõç", "fr": "œæ", "de": "ß"}
+# Scripts that identify a language on their own (checked in order: kana before Han for Japanese)
+SCRIPT_RANGES = [
+    ("ko", re.compile(r"[\uAC00-\uD7AF]")),
+    ("ja", re.compile(r"[\u3040-\u30FF]")),
+    ("zh", re.compile(r"[\u4E00-\u9FFF]")),
+    ("ru", re.compile(r"[\u0400-\u04FF]")),
+    ("ar", re.compile(r"[\u0600-\u06FF]")),
+    ("he", re.compile(r"[\u0590-\u05FF]")),
+    ("hi", re.compile(r"[\u0900-\u097F]")),
+    ("th", re.compile(r"[\u0E00-\u0E7F]")),
+    ("el", re.compile(r"[\u0370-\u03FF]")),
+    ("vi", re.compile(r"[ơưđạảấầẩẫậắằẳẵặẹẻẽếềểễệỉịọỏốồổỗộớờởỡợụủứừửữựỳỵỷỹ]")),
+]
+WORD_PATTERN = re.compile(r"[^\W\d_]+")
+
+DetectorFactory.seed = 0  # langdetect is randomized unless seeded
+
+
+def detect_language(text: str) -> str:
+    """
+    Identify the language of a query as an ISO 639-1 code without a model call.
+    Distinctive scripts decide directly; Latin-script text is scored against per-language
+    function-word profiles (plus everyday English content words), and needs a clear lead over
+    English to count as another language. Only long text that matches no profile goes to
+    (seeded) langdetect.
+    """
+    lowered = text.lower()
+    for language, pattern in SCRIPT_RANGES:
+        if pattern.search(lowered):
+            return language
+    words = WORD_PATTERN.findall(lowered)
+    scores = {language: sum(word in profile for word in words) for language, profile in LANGUAGE_PROFILES.items()}
+    scores["en"] += sum(word in ENGLISH_CONTENT_WORDS for word in words)
+    for language, markers in LANGUAGE_MARKERS.items():
+        if any(marker in lowered for marker in markers):
+            scores[language] += 2
+    best = max(scores, key=scores.get)
+    if best != "en" and scores["en"] and (scores[best] < LANGUAGE_MIN_SCORE
+                                          or scores[best] - scores["en"] < LANGUAGE_MARGIN):
+        best = "en"
+    if scores[best]:
+        return best
+    if len(text) >= LANGDETECT_MIN_CHARS:
+        try:
+            return detect(text).split("-")[0]
+        except Exception:
+            pass
+    return "en"
+
+
+def _memory_key(text: str, source: str, target: str) -> str:
+    # Case, spacing and surrounding punctuation do not change a translation
+    normalized = " ".join(text.lower().split()).strip("¿?¡!. ")
+    return cache_key(normalized, index_version=f"translation:{source}>{target}")
+
+
+def recall_translation(text: str, source: str, target: str) -> Optional[str]:
+    """
+    Return the remembered translation of text for the language pair, or None.
+    """
+    return get_llm_cache().get(_memory_key(text, source, target), "translation_memory")
+
+
+def remember_translation(text: str, source: str, target: str, translation: str):
+    if translation and translation.strip() and not translation.startswith("[Error"):
+        get_llm_cache().put(_memory_key(text, source, target), "translation_memory", translation.strip(),
+                            ttl=TRANSLATION_MEMORY_TTL)
+
+
+def needs_translation(segment: str) -> bool:
+    # Blank lines, bare URLs and numbers are kept as they are
+    return any(len(word) > 1 for word in WORD_PATTERN.findall(re.sub(r"https?://\S+", "", segment)))
+
+
+def parse_translations(response: str, expected: int) -> Optional[List[str]]:
+    """
+    Parse a {"translations": [...]} reply. Returns None unless it holds exactly expected strings.
+    """
+    match = re.search(r"\{.*\}", response or "", re.DOTALL)
+    if not match:
+        return None
+    try:
+        translations = json.loads(match.group(0)).get("translations")
+    except (ValueError, AttributeError):
+        return None
+    if not isinstance(translations, list) or len(translations) != expected:
+        return None
+    if not all(isinstance(t, str) and t.strip() for t in translations):
+        return None
+    return translations
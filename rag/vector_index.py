@@ -0,0 +1,60 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Optional, Set
+
+
+class VectorIndex(ABC):
+    """
+    Storage operations the indexing and search code needs from a vector backend.
+    Each row is an embedding plus the scalar fields url, date, section and content_hash;
+    chunk text lives in the chunk store. Search scores are squared L2 distances (lower is closer).
+    """
+
+    name: str
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def insert(self, embeddings: List[List[float]], rows: List[Dict]):
+        ...
+
+    @abstractmethod
+    def search(self, query_embedding: List[float], top_k: int, filters: Optional[Dict[str, str]] = None) -> List[Dict]:
+        """
+        Return up to top_k rows closest to the query, each with url, date, section, content_hash, score
+        and embedding (the stored vector, so callers need not embed the chunk text again).
+        filters maps 'section' and/or 'url' to the exact value rows must have.
+        """
+        ...
+
+    @abstractmethod
+    def existing(self, hashes: List[str]) -> Set[str]:
+        ...
+
+    @abstractmethod
+    def embeddings(self, hashes: List[str]) -> Dict[str, List[float]]:
+        """
+        Return the stored vectors of the given content hashes; hashes not in the index are left out.
+        """
+        ...
+
+    @abstractmethod
+    def delete(self, hashes: List[str]):
+        ...
+
+    @abstractmethod
+    def scan(self, fields: List[str]) -> Iterator[List[Dict]]:
+        """
+        Yield all rows in batches, each row a dict of the requested fields.
+        """
+        ...
+
+    def compact(self):
+        pass
+
+    def tune(self, force: bool = False) -> bool:
+        """
+        Retune the index for its current size. Returns True if it was rebuilt.
+        """
+        return False
@@ -0,0 +1,40 @@
+import os
+import shutil
+import tempfile
+import unittest
+from rag import chunk_store, contacts, embedding_cache, index_state, llm_cache, milvus_utils, routing
+
+
+class IsolatedStoresTestCase(unittest.TestCase):
+    """
+    Runs each test in a fresh working directory, where every store opens its default file,
+    with the NumPy vector backend and no store left open from another test.
+    """
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+        self.reset_stores()
+        self.backend = milvus_utils.VECTOR_BACKEND
+        milvus_utils.VECTOR_BACKEND = "numpy"
+
+    def tearDown(self):
+        milvus_utils.VECTOR_BACKEND = self.backend
+        self.reset_stores()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def reset_stores(self):
+        chunk_store._store = None
+        contacts._store = None
+        embedding_cache._cache = None
+        llm_cache._cache = None
+        if index_state._conn is not None:
+            index_state._conn.close()
+        index_state._conn = None
+        index_state._versions.clear()
+        milvus_utils._vector_indexes.clear()
+        milvus_utils._blooms.clear()
+        routing._index_matrix = None
+        routing._section_matrices.clear()
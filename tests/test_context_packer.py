@@ -0,0 +1,37 @@
+import unittest
+from rag import context_packer
+
+
+def make_chunks(n):
+    # Orthogonal embeddings: no chunk is a near-duplicate of another
+    return [{"text": f"Trash pickup for route {i} is on Monday. Bring bins to the curb by 7am.",
+             "url": f"https://example.gov/{i}", "embedding": [float(i == j) + 0.1 for j in range(n)]}
+            for i in range(n)]
+
+
+class PackContextTest(unittest.TestCase):
+    def test_fits_the_budget(self):
+        chunks = make_chunks(5)
+        packed, stats = context_packer.pack_context("trash pickup", [1.0] * 5, chunks, budget=40)
+        self.assertLessEqual(stats["tokens_after"], 40)
+        self.assertTrue(all(c["text"] for c in packed))
+        self.assertTrue(all("embedding" not in c for c in packed))
+
+    def test_budget_smaller_than_candidate_count(self):
+        chunks = make_chunks(5)
+        packed, stats = context_packer.pack_context("trash pickup", [1.0] * 5, chunks, budget=3)
+        self.assertEqual(len(packed), 1)
+        self.assertTrue(packed[0]["text"])
+        self.assertLessEqual(stats["tokens_after"], 3)
+        self.assertEqual(stats["chunks_dropped"], 4)
+
+    def test_empty_chunks_are_not_packed(self):
+        chunks = make_chunks(3)
+        chunks[0]["text"] = ""
+        packed, _ = context_packer.pack_context("trash pickup", [1.0] * 3, chunks, budget=100)
+        self.assertEqual(len(packed), 2)
+        self.assertTrue(all(c["text"] for c in packed))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import os
+import threading
+import unittest
+from rag import milvus_utils
+from tests.isolated import IsolatedStoresTestCase
+
+
+class SlowScanIndex:
+    # Stands in for a large collection: the scan waits until the test lets it finish
+    def __init__(self):
+        self.scanning = threading.Event()
+        self.finish = threading.Event()
+
+    def scan(self, fields):
+        self.scanning.set()
+        self.finish.wait(5)
+        yield [{"content_hash": "h1"}, {"content_hash": "h2"}]
+
+
+class BloomBuildTest(IsolatedStoresTestCase):
+    def test_build_does_not_hold_the_global_lock(self):
+        index = SlowScanIndex()
+        milvus_utils._vector_indexes["docs"] = index
+        blooms = []
+        build = threading.Thread(target=lambda: blooms.append(milvus_utils._get_bloom("docs")))
+        build.start()
+        self.assertTrue(index.scanning.wait(5))
+        # Searches need the global lock; it must be free while the collection is scanned
+        acquired = milvus_utils._milvus_lock.acquire(timeout=1)
+        if acquired:
+            milvus_utils._milvus_lock.release()
+        index.finish.set()
+        build.join(5)
+        self.assertTrue(acquired)
+        self.assertIn("h1", blooms[0])
+        self.assertTrue(os.path.exists(milvus_utils._bloom_path("docs")))
+        self.assertIs(milvus_utils._get_bloom("docs"), blooms[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
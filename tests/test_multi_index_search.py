@@ -0,0 +1,43 @@
+import unittest
+from rag import milvus_utils
+from tests.isolated import IsolatedStoresTestCase
+
+DIM = 4
+QUERY = [1.0, 0.0, 0.0, 0.0]
+
+
+def chunk(index_name, i, text):
+    url = f"https://example.gov/{index_name}/{i}"
+    return {"url": url, "text": text, "date": "2025-01-01", "section": "/",
+            "content_hash": milvus_utils.content_hash(url, text)}
+
+
+class MultiIndexSearchTest(IsolatedStoresTestCase):
+    def setUp(self):
+        super().setUp()
+        self.saved = (milvus_utils.VECTOR_DIM, milvus_utils.HYBRID_SEARCH_ENABLED)
+        milvus_utils.VECTOR_DIM, milvus_utils.HYBRID_SEARCH_ENABLED = DIM, True
+        self.close = chunk("town", 0, "Bulk trash pickup is on the first Monday")
+        self.far = chunk("parks", 0, "Pavilion rentals open in April")
+        milvus_utils.insert_embeddings([[0.9, 0.1, 0.0, 0.0]], [self.close], "town")
+        milvus_utils.insert_embeddings([[0.1, 0.0, 0.9, 0.4]], [self.far], "parks")
+
+    def tearDown(self):
+        milvus_utils.VECTOR_DIM, milvus_utils.HYBRID_SEARCH_ENABLED = self.saved
+        super().tearDown()
+
+    def test_each_index_top_hit_is_scored_by_similarity_not_rank(self):
+        hits = milvus_utils.multi_index_search("trash pickup", QUERY, ["parks", "town"], top_k=2)
+        self.assertEqual([h["index_name"] for h in hits], ["town", "parks"])
+        self.assertGreater(hits[0]["score"], 0.9)
+        self.assertLess(hits[1]["score"], 0.2)
+
+    def test_lexical_only_hit_reads_its_embedding(self):
+        hit = {key: value for key, value in self.close.items()}
+        scores = milvus_utils.similarity_scores(QUERY, [hit, {"text": "no hash", "url": "u"}], "town")
+        self.assertAlmostEqual(scores[0], 0.9 / (0.82 ** 0.5), places=5)
+        self.assertEqual(scores[1], 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
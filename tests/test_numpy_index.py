@@ -0,0 +1,160 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from rag.numpy_index import NumpyVectorIndex
+from rag.vector_index import VectorIndex
+
+DIM = 4
+
+
+def make_rows(n, start=0, section="permits"):
+    rows = [{"url": f"https://example.gov/p{i}", "date": "2025-01-01", "section": section,
+             "content_hash": f"h{i}"} for i in range(start, start + n)]
+    embeddings = [[float(i == j % DIM) + i * 0.01 for j in range(DIM)] for i in range(start, start + n)]
+    return embeddings, rows
+
+
+class NumpyVectorIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index = self.open()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def open(self):
+        return NumpyVectorIndex("docs", DIM, directory=self.directory)
+
+    def rows_file(self, index):
+        return index._file("rows.jsonl")
+
+    def test_is_a_vector_index(self):
+        self.assertIsInstance(self.index, VectorIndex)
+        with self.assertRaises(TypeError):
+            VectorIndex()
+
+    def test_insert_and_search(self):
+        embeddings, rows = make_rows(5)
+        self.index.insert(embeddings, rows)
+        self.assertEqual(self.index.count(), 5)
+        hits = self.index.search(embeddings[2], top_k=3)
+        self.assertEqual(len(hits), 3)
+        self.assertEqual(hits[0]["content_hash"], "h2")
+        self.assertAlmostEqual(hits[0]["score"], 0.0, places=5)
+        np.testing.assert_allclose(hits[0]["embedding"], embeddings[2], rtol=1e-6)
+        self.assertEqual(sorted(h["score"] for h in hits), [h["score"] for h in hits])
+
+    def test_search_filters(self):
+        embeddings, rows = make_rows(3)
+        self.index.insert(embeddings, rows)
+        more_embeddings, more_rows = make_rows(3, start=3, section="trash")
+        self.index.insert(more_embeddings, more_rows)
+        hits = self.index.search(embeddings[0], top_k=10, filters={"section": "trash"})
+        self.assertEqual({h["content_hash"] for h in hits}, {"h3", "h4", "h5"})
+        hits = self.index.search(embeddings[0], top_k=10, filters={"url": "https://example.gov/p1"})
+        self.assertEqual([h["content_hash"] for h in hits], ["h1"])
+        self.assertEqual(self.index.search(embeddings[0], top_k=10, filters={"section": "unknown"}), [])
+
+    def test_reinserting_a_hash_replaces_its_row(self):
+        embeddings, rows = make_rows(2)
+        self.index.insert(embeddings, rows)
+        self.index.insert([embeddings[1]], [dict(rows[0], date="2025-02-01")])
+        self.assertEqual(self.index.count(), 2)
+        hits = self.index.search(embeddings[1], top_k=10)
+        self.assertEqual(sorted(h["content_hash"] for h in hits), ["h0", "h1"])
+        self.assertEqual(next(h["date"] for h in hits if h["content_hash"] == "h0"), "2025-02-01")
+
+    def test_dimension_mismatch(self):
+        embeddings, rows = make_rows(2)
+        with self.assertRaises(ValueError):
+            self.index.insert([e + [0.0] for e in embeddings], rows)
+        with self.assertRaises(ValueError):
+            self.index.insert(embeddings[:1], rows)
+        with self.assertRaises(ValueError):
+            self.index.search([0.0] * (DIM + 1), top_k=1)
+        self.assertEqual(self.index.count(), 0)
+
+    def test_delete_and_existing(self):
+        embeddings, rows = make_rows(4)
+        self.index.insert(embeddings, rows)
+        self.index.delete(["h1", "h3", "missing"])
+        self.assertEqual(self.index.count(), 2)
+        self.assertEqual(self.index.existing(["h0", "h1", "h2"]), {"h0", "h2"})
+        self.assertNotIn("h1", {h["content_hash"] for h in self.index.search(embeddings[1], top_k=10)})
+        scanned = [row for batch in self.index.scan(["content_hash", "url"]) for row in batch]
+        self.assertEqual([r["content_hash"] for r in scanned], ["h0", "h2"])
+
+    def test_embeddings(self):
+        embeddings, rows = make_rows(3)
+        self.index.insert(embeddings, rows)
+        self.index.delete(["h1"])
+        stored = self.index.embeddings(["h0", "h1", "h2", "missing"])
+        self.assertEqual(sorted(stored), ["h0", "h2"])
+        np.testing.assert_allclose(stored["h2"], embeddings[2], rtol=1e-6)
+
+    def test_compact(self):
+        embeddings, rows = make_rows(4)
+        self.index.insert(embeddings, rows)
+        self.index.delete(["h0", "h2"])
+        old_generation = self.index._generation
+        self.index.compact()
+        self.assertNotEqual(self.index._generation, old_generation)
+        self.assertFalse(os.path.exists(os.path.join(self.index.path, old_generation)))
+        self.assertEqual(len(self.index._hashes), 2)
+        self.assertEqual(self.index.search(embeddings[3], top_k=1)[0]["content_hash"], "h3")
+        reopened = self.open()
+        self.assertEqual(reopened._generation, self.index._generation)
+        self.assertEqual(reopened.existing(["h0", "h1", "h2", "h3"]), {"h1", "h3"})
+
+    def test_reopen(self):
+        embeddings, rows = make_rows(3)
+        self.index.insert(embeddings, rows)
+        self.index.delete(["h0"])
+        reopened = self.open()
+        self.assertEqual(reopened.count(), 2)
+        self.assertEqual(reopened.search(embeddings[2], top_k=1)[0]["content_hash"], "h2")
+        self.assertEqual(reopened.existing(["h0", "h1"]), {"h1"})
+
+    def test_torn_append_is_truncated(self):
+        embeddings, rows = make_rows(3)
+        self.index.insert(embeddings, rows)
+        path = self.rows_file(self.index)
+        intact = os.path.getsize(path)
+        with open(path, "ab") as f:
+            f.write(b'["https://example.gov/torn", "2025')
+        with open(self.index._file("vectors"), "ab") as f:
+            f.write(np.zeros(DIM, dtype=np.float32).tobytes()[:5])
+        reopened = self.open()
+        self.assertEqual(reopened.count(), 3)
+        self.assertEqual(os.path.getsize(path), intact)
+        # Later appends start on a fresh line and line up with their vectors
+        more_embeddings, more_rows = make_rows(2, start=3)
+        reopened.insert(more_embeddings, more_rows)
+        reopened = self.open()
+        self.assertEqual(reopened.count(), 5)
+        self.assertEqual(reopened.search(more_embeddings[1], top_k=1)[0]["content_hash"], "h4")
+
+    def test_rows_without_vectors_are_dropped(self):
+        embeddings, rows = make_rows(3)
+        self.index.insert(embeddings, rows)
+        row_bytes = DIM * np.dtype(np.float32).itemsize
+        with open(self.index._file("vectors"), "ab") as f:
+            f.truncate(2 * row_bytes)
+        reopened = self.open()
+        self.assertEqual(reopened.count(), 2)
+        with open(self.rows_file(reopened), encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+    def test_float16_storage(self):
+        index = NumpyVectorIndex("half", DIM, directory=self.directory, dtype="float16")
+        embeddings, rows = make_rows(3)
+        index.insert(embeddings, rows)
+        self.assertEqual(index.search(embeddings[1], top_k=1)[0]["content_hash"], "h1")
+        # The storage format is fixed when the index is created
+        self.assertEqual(NumpyVectorIndex("half", DIM, directory=self.directory).dtype, np.float16)
+
+
+if __name__ == "__main__":
+    unittest.main()
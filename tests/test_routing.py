@@ -0,0 +1,59 @@
+import unittest
+import numpy as np
+from rag import index_state, milvus_utils, routing
+from tests.isolated import IsolatedStoresTestCase
+
+DIM = 4
+TRASH = [1.0, 0.0, 0.0, 0.0]
+PERMITS = [0.0, 1.0, 0.0, 0.0]
+
+
+def chunk(i, section):
+    url = f"https://example.gov/{section}/{i}"
+    return {"url": url, "text": f"chunk {i}", "date": "2025-01-01", "section": section,
+            "content_hash": milvus_utils.content_hash(url, f"chunk {i}")}
+
+
+class SectionRoutingTest(IsolatedStoresTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dim = milvus_utils.VECTOR_DIM
+        milvus_utils.VECTOR_DIM = DIM
+        self.trash = [chunk(0, "/trash"), chunk(1, "/trash")]
+        self.permits = [chunk(2, "/permits")]
+        milvus_utils.insert_embeddings([TRASH, [0.8, 0.2, 0.0, 0.0]] + [PERMITS], self.trash + self.permits)
+
+    def tearDown(self):
+        milvus_utils.VECTOR_DIM = self.dim
+        super().tearDown()
+
+    def centroid(self, section):
+        sections, matrix = routing._load_section_matrix(milvus_utils.DEFAULT_COLLECTION_NAME)
+        return matrix[sections.index(section)] if section in sections else None
+
+    def delete(self, chunks):
+        return milvus_utils.delete_chunks([c["content_hash"] for c in chunks], [c["section"] for c in chunks])
+
+    def test_routes_to_the_closest_section(self):
+        section, margin = routing.route_section(milvus_utils.DEFAULT_COLLECTION_NAME, TRASH)
+        self.assertEqual(section, "/trash")
+        self.assertGreater(margin, 0)
+
+    def test_deleted_chunks_leave_the_centroid(self):
+        self.assertEqual(self.delete(self.trash[1:]), 1)
+        np.testing.assert_allclose(self.centroid("/trash"), TRASH, atol=1e-6)
+
+    def test_removed_section_is_no_longer_chosen(self):
+        self.assertEqual(self.delete(self.trash), 2)
+        self.assertIsNone(self.centroid("/trash"))
+        self.assertEqual(routing.route_section(milvus_utils.DEFAULT_COLLECTION_NAME, TRASH)[0], "/permits")
+
+    def test_sections_missing_from_the_catalog_are_not_chosen(self):
+        # A centroid outliving its section (e.g. state written before deletions were tracked)
+        index_state.update_section_catalog(milvus_utils.DEFAULT_COLLECTION_NAME, ["/trash"] * 2, delta=-1)
+        self.assertIsNotNone(self.centroid("/trash"))
+        self.assertEqual(routing.route_section(milvus_utils.DEFAULT_COLLECTION_NAME, TRASH)[0], "/permits")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import asyncio
+import itertools
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from bench import fake_ollama
+from rag import ollama_utils, scrape
+from tests.isolated import IsolatedStoresTestCase
+
+PAGE = (b"<html><body><h1>Town Clerk</h1><p>Dog licenses are issued at the clerk's office.</p>"
+        b"<img src='/logo.png'></body></html>")
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        body, content_type = (b"\x89PNG fake logo", "image/png") if self.path == "/logo.png" else (PAGE, "text/html")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class CountingOllamaHandler(fake_ollama.FakeOllamaHandler):
+    # Counts embedded texts and generate calls; every description differs, as sampled ones would
+    calls = {"embedded": 0, "generate": 0}
+    takes = itertools.count(1)
+
+    def do_POST(self):
+        if self.path == "/api/generate":
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self.calls["generate"] += 1
+            self._send_json({"response": f"A town seal, take {next(self.takes)}", "done": True})
+            return
+        if self.path == "/api/embed":
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            self.calls["embedded"] += len(payload["input"])
+            self._send_json({"embeddings": [fake_ollama.fake_vector(t) for t in payload["input"]]})
+            return
+        super().do_POST()
+
+
+def start_server(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+class RecrawlTest(IsolatedStoresTestCase):
+    def setUp(self):
+        super().setUp()
+        self.saved = (ollama_utils.OLLAMA_BASE_URL, scrape.REQUEST_DELAY)
+        scrape.REQUEST_DELAY = 0
+        CountingOllamaHandler.calls.update(embedded=0, generate=0)
+        self.ollama, ollama_utils.OLLAMA_BASE_URL = start_server(CountingOllamaHandler)
+        self.site, self.site_url = start_server(SiteHandler)
+
+    def tearDown(self):
+        self.ollama.shutdown()
+        self.ollama.server_close()
+        self.site.shutdown()
+        self.site.server_close()
+        ollama_utils.OLLAMA_BASE_URL, scrape.REQUEST_DELAY = self.saved
+        super().tearDown()
+
+    def crawl(self):
+        return asyncio.run(scrape.crawl_and_index_async(self.site_url + "/"))
+
+    def test_unchanged_page_with_image_is_not_described_or_embedded_again(self):
+        first = self.crawl()
+        self.assertEqual(first["rows_added"], 1)
+        self.assertEqual(CountingOllamaHandler.calls["generate"], 1)
+        self.assertGreater(CountingOllamaHandler.calls["embedded"], 0)
+        CountingOllamaHandler.calls.update(embedded=0, generate=0)
+        second = self.crawl()
+        self.assertEqual(CountingOllamaHandler.calls, {"embedded": 0, "generate": 0})
+        self.assertEqual((second["rows_added"], second["rows_replaced"], second["rows_deleted"]), (0, 0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()